@@ -1,4 +1,7 @@
 from .world import create_world, create_all_worlds, list_worlds #, update_belief
+from .compiler import compile_world
+from .agent.solver import solve_world
+from .agent.evaluation import evaluate_strategies, get_situations
 
 from .tools.read import list_all_logs, load_all_logs, load_log
 
@@ -1,10 +1,20 @@
+import collections.abc
+import math
+
 import networkx as nx
+import numpy as np
 
 import pomdp_py
 
+from ..tools.network import get_network_index
 from .belief import initialize_belief
 
 
+# The counts of the agreements and disagreements with an edge.
+COUNT_KEYS = ('n_robot_disagree', 'n_human_disagree',
+              'n_robot_agree', 'n_human_agree')
+
+
 class Agent(object):
     """A class to represent symbolic names for the agents."""
     HUMAN = 'Human'
@@ -35,6 +45,10 @@ class TaskAgent(pomdp_py.Agent, Agent):
     def update_belief(self, action, observation):
         pass
 
+    def get_planning_agent(self):
+        """Get the agent to plan for with pomdp_py, e.g. with POUCT."""
+        return self
+
 
 class ModellingAgent(TaskAgent):
     """A class to represent an agent with modelling capabilities."""
@@ -42,21 +56,29 @@ class ModellingAgent(TaskAgent):
     def __init__(
             self, init_state, policy_model, transition_model,
             observation_model, reward_model, planner,
-            history=None, state_no=None):
+            mental_history=None, state_no=None, history=None):
 
         self.planner = planner
+        # The timer of the stages of updating the beliefs (see StageTimer),
+        # or None to not time.
+        self.timer = None
+
+        # The earlier name of the mental history.
+        if history is not None:
+            mental_history = history
 
-        if history is None:
+        if mental_history is None:
             mental_state = MentalState(
                 init_state.network.graph, cur_node=self.planner.cur_node)
-            history = mental_state
+            mental_history = mental_state
 
         # States.
-        if not isinstance(history, list):
-            history = [history]
+        if not isinstance(mental_history, list):
+            mental_history = [mental_history]
 
-        # History, for navigating states.
-        self._history = history
+        # History of the mental states, for navigating states; the history
+        # (of actions and observations) is left to pomdp_py, e.g. for POUCT.
+        self._mental_history = mental_history
 
         # Set the state no if given, the last state otherwise.
         if state_no is not None:
@@ -89,24 +111,53 @@ class ModellingAgent(TaskAgent):
     def get_state(self, state_no=None):
         if state_no is None:
             state_no = self.num_states
-        return self._history[self.get_state_index(state_no)]
+        return self._mental_history[self.get_state_index(state_no)]
 
     @property
     def state_index(self):
         return self.get_state_index(self.state_no)
 
+    @property
+    def mental_history(self):
+        """list: the mental states and actions, e.g. [state_1, action_1,
+        state_2, ...]."""
+        return self._mental_history
+
+    @mental_history.setter
+    def mental_history(self, value):
+        self._mental_history = value
+
     @property
     def history(self):
-        return self._history
+        """list: the mental history, by its earlier name.
+
+        This overrides pomdp_py's (action, observation) history, hence
+        plan for get_planning_agent() with pomdp_py, e.g. with POUCT.
+        """
+        return self._mental_history
 
     @history.setter
     def history(self, value):
-        self._history = value
+        self._mental_history = value
+
+    def get_planning_agent(self):
+        """Get an agent to plan for with pomdp_py, e.g. with POUCT, with
+        this agent's models and current belief, and its own (action,
+        observation) history.
+
+        Returns:
+            pomdp_py.Agent: the agent.
+        """
+        return pomdp_py.Agent(
+            self.cur_belief, self.policy_model,
+            transition_model=self.transition_model,
+            observation_model=self.observation_model,
+            reward_model=self.reward_model)
 
     @property
     def num_states(self):
         """Number of states in the history."""
-        return len(self._history) // 2 + 1
+        return len(self._mental_history) // 2 + 1
 
     @property
     def cur_state(self):
@@ -115,7 +166,43 @@ class ModellingAgent(TaskAgent):
 
 
 class MentalState(object):
-    """A class to represent the mental state of an agent."""
+    """A class to represent the mental state of an agent.
+
+    The beliefs about the edges are stored as arrays over the edges by
+    their ids in the graph's index (see NetworkIndex), with a row per
+    level: 0 for what I believe about the world, 1 for what I believe you
+    believe, and 2 for what I believe you believe I believe. The updates
+    are vectorized over the edges and the levels, and a snapshot copies
+    the arrays only, as the graph's nodes and edges are shared.
+
+    The beliefs are also accessible by a networkx-compatible view, e.g.
+    beliefs['me']['you']['world'][u][v]['is_optimal'] (see BeliefGraph).
+
+    Attributes:
+        index (NetworkIndex):
+            the index of the graph's edges
+        edges (list):
+            the edges by their ids, each as a node pair (u, v)
+        nodes (dict):
+            the attributes of each node, i.e. its text
+        is_optimal (np.ndarray):
+            the believed probability that each edge is optimal at each
+            level, NaN if unknown
+        is_selected (np.ndarray):
+            whether each edge is selected at each level
+        is_suggested (np.ndarray):
+            whether each edge is suggested at each level
+        counts (dict):
+            the counts of the agreements and disagreements with each edge
+            by key (e.g. 'n_human_agree'), at the first level only
+        is_aligned (np.ndarray):
+            whether each edge is aligned, at the first level only
+        strategies (list):
+            the beliefs about the strategies (of 'me' and 'you') at each
+            level
+        cur_node (int):
+            the node that the agent believes they are at
+    """
 
     def __init__(
             self, graph, cur_node=None,
@@ -123,53 +210,40 @@ class MentalState(object):
         if agents is None:
             agents = set({Agent.HUMAN, Agent.ROBOT})
 
-        if Agent.HUMAN in agents:
-            self.beliefs = {
-                'me': {
-                    'world': self._create_view(graph, level=0),
-                    'you': {
-                        'world': self._create_view(graph, level=1),
-                        'me': {
-                            'world': self._create_view(graph, level=2),
-                        }
-                    },
-                }
-            }
-        else:
-            self.beliefs = {
-                'me': {
-                    'world': self._create_view(graph, level=0),
-                }
-            }
-        self.cur_node = cur_node
-
-    def _create_view(self, from_graph, level=0):
-        # About choices.
-        data = {
-            'is_optimal': None,
-            'is_selected': False,
-            'is_suggested': False,
-        }
-        if level == 0:
-            data['n_robot_disagree'] = 0
-            data['n_human_disagree'] = 0
-            data['n_robot_agree'] = 0
-            data['n_human_agree'] = 0
-            data['is_aligned'] = False
+        num_levels = 3 if Agent.HUMAN in agents else 1
 
-        graph = nx.Graph()
+        self.index = get_network_index(graph)
+        self.nodes = {u: {'text': d['text']}
+                      for u, d in graph.nodes(data=True)}
 
-        for u, d in from_graph.nodes(data=True):
-            graph.add_node(u, text=d['text'])
+        # The edges in the order and direction of a graph built from the
+        # given graph, as in its views.
+        view = nx.Graph()
+        view.add_nodes_from(graph.nodes())
+        view.add_edges_from(graph.edges())
+        self.edges = [None] * len(self.index.edges)
+        self._edge_order = list()
+        for u, v in view.edges():
+            i = self.index.edge_ids[(u, v)]
+            self.edges[i] = (u, v)
+            self._edge_order.append(i)
 
-        for u, v in from_graph.edges():
-            graph.add_edge(u, v, **data)
+        # About choices.
+        shape = (num_levels, len(self.edges))
+        self.is_optimal = np.full(shape, np.nan)
+        self.is_selected = np.zeros(shape, dtype=bool)
+        self.is_suggested = np.zeros(shape, dtype=bool)
+        self.counts = {key: np.zeros(len(self.edges), dtype=np.int64)
+                       for key in COUNT_KEYS}
+        self.is_aligned = np.zeros(len(self.edges), dtype=bool)
 
         # About strategies.
-        graph.graph['me'] = None
-        graph.graph['you'] = None
+        self.strategies = [{'me': None, 'you': None}
+                           for _ in range(num_levels)]
 
-        return graph
+        self.cur_node = cur_node
+
+        self._beliefs = None
 
     def __str__(self):
         return self.__repr__()
@@ -177,42 +251,226 @@ class MentalState(object):
     def __repr__(self):
         return 'MentalState({})'.format(self.get_beliefs())
 
+    def __deepcopy__(self, memo):
+        # The nodes and edges are shared: copy the beliefs only.
+        return self.copy()
+
+    def copy(self):
+        """Create a snapshot of the mental state."""
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(self.__dict__)
+        result.is_optimal = self.is_optimal.copy()
+        result.is_selected = self.is_selected.copy()
+        result.is_suggested = self.is_suggested.copy()
+        result.counts = {k: v.copy() for k, v in self.counts.items()}
+        result.is_aligned = self.is_aligned.copy()
+        result.strategies = [d.copy() for d in self.strategies]
+        result._beliefs = None
+        return result
+
+    @property
+    def num_levels(self):
+        """int: the number of the levels of the beliefs."""
+        return len(self.is_optimal)
+
+    @property
+    def beliefs(self):
+        """dict: the networkx-compatible views of the beliefs at each level,
+        e.g. beliefs['me']['world'] for the first level."""
+        if self._beliefs is None:
+            self._beliefs = {'me': {'world': BeliefGraph(self, 0)}}
+            if self.num_levels > 1:
+                self._beliefs['me']['you'] = {
+                    'world': BeliefGraph(self, 1),
+                    'me': {'world': BeliefGraph(self, 2)},
+                }
+        return self._beliefs
+
+    def get_edge_id(self, u, v):
+        """Get the id of an edge, in either direction."""
+        return self.index.edge_ids[(u, v)]
+
+    def get_selection(self, network):
+        """Get the boolean array over the edges selected in a network."""
+        if network.index == self.index:
+            return self.index.arrays.get_selection(network.selected_mask)
+        return np.array([network.has_edge(u, v) for u, v in self.edges],
+                        dtype=bool)
+
+    def get_suggestion(self, network):
+        """Get the boolean array over the edges for the suggested edge in a
+        network, if any."""
+        suggestion = np.zeros(len(self.edges), dtype=bool)
+        if network.suggested_edge is not None:
+            i = self.index.edge_ids.get(tuple(network.suggested_edge))
+            if i is not None:
+                suggestion[i] = True
+        return suggestion
+
+    def update_facts(self, network):
+        """Update the selected and the suggested edges at all levels to
+        those in a network."""
+        self.is_selected[:] = self.get_selection(network)
+        self.is_suggested[:] = self.get_suggestion(network)
+
     def get_beliefs(self):
         belief_list = list()
 
-        pairs = [('world', self.beliefs['me']),
-                 ('you', self.beliefs['me']['you']),
-                 ('me-by-you', self.beliefs['me']['you']['me'])]
-
-        for key, beliefs in pairs:
-            for u, v, d in beliefs['world'].edges(data=True):
-                value = d['is_optimal']
-                if value is not None:
-                    # # Simplest in tuples; less human readable.
-                    # belief = (key, u, v, value)
-
-                    # Verbose/propositional.
-                    s = 'I believe that'
-                    if key != 'world':
-                        s += ' you believe'
-                    if key == 'me-by-you':
-                        s += ' that I believe'
-                    s += ' {}-{}'.format(
-                        get_node_name(u, beliefs),
-                        get_node_name(v, beliefs))
-                    if value == 1.0:
-                        s += ' is'
-                    elif value == 0.0:
-                        s += ' is not'
-                    else:
-                        s += ' is with p={}'.format(value)
-                    s += ' optimal.'
-
-                    belief = s
-                    belief_list.append(belief)
+        keys = ['world', 'you', 'me-by-you']
+        for level in range(self.num_levels):
+            key = keys[level]
+            values = self.is_optimal[level]
+            for i in np.flatnonzero(~np.isnan(values)).tolist():
+                u, v = self.edges[i]
+                value = values[i].item()
+                # # Simplest in tuples; less human readable.
+                # belief = (key, u, v, value)
+
+                # Verbose/propositional.
+                s = 'I believe that'
+                if key != 'world':
+                    s += ' you believe'
+                if key == 'me-by-you':
+                    s += ' that I believe'
+                s += ' {}-{}'.format(
+                    self.nodes[u]['text'].split()[-1],
+                    self.nodes[v]['text'].split()[-1])
+                if value == 1.0:
+                    s += ' is'
+                elif value == 0.0:
+                    s += ' is not'
+                else:
+                    s += ' is with p={}'.format(value)
+                s += ' optimal.'
+
+                belief = s
+                belief_list.append(belief)
 
         return sorted(belief_list)
 
 
+class BeliefGraph(object):
+    """A networkx-compatible view of the beliefs of a mental state at a
+    level, e.g. graph[u][v]['is_optimal'], graph.edges(data=True) and
+    graph.nodes[u]['text'], where writing to an edge's beliefs updates the
+    mental state.
+
+    Attributes:
+        state (MentalState):
+            the mental state
+        level (int):
+            the level of the beliefs
+        nodes (dict):
+            the attributes of each node, i.e. its text
+        graph (dict):
+            the beliefs about the strategies
+    """
+
+    def __init__(self, state, level):
+        self.state = state
+        self.level = level
+        self.nodes = state.nodes
+        self.graph = state.strategies[level]
+
+        self._arrays = {
+            'is_optimal': state.is_optimal[level],
+            'is_selected': state.is_selected[level],
+            'is_suggested': state.is_suggested[level],
+        }
+        if level == 0:
+            self._arrays.update(state.counts)
+            self._arrays['is_aligned'] = state.is_aligned
+
+    def __repr__(self):
+        return 'BeliefGraph(level={}, |V|={}, |E|={})'.format(
+            self.level, len(self.nodes), len(self.state.edges))
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, u):
+        return u in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, u):
+        if u not in self.nodes:
+            raise KeyError(u)
+        return _BeliefAdjacency(self, u)
+
+    def has_edge(self, u, v):
+        return (u, v) in self.state.index.edge_ids
+
+    def number_of_edges(self):
+        return len(self.state.edges)
+
+    def edges(self, data=False):
+        """Get the edges (with their beliefs if data is True) as a list."""
+        edges = [self.state.edges[i] for i in self.state._edge_order]
+        if not data:
+            return edges
+        return [(u, v, self.get_edge_data(u, v)) for u, v in edges]
+
+    def get_edge_data(self, u, v):
+        """Get the beliefs about an edge, as a mutable mapping."""
+        return EdgeBeliefs(self._arrays, self.state.get_edge_id(u, v))
+
+    def to_networkx(self):
+        """Create a networkx graph with the beliefs as edge attributes."""
+        graph = nx.Graph(**self.graph)
+        graph.add_nodes_from((u, dict(d)) for u, d in self.nodes.items())
+        graph.add_edges_from(
+            (u, v, dict(d)) for u, v, d in self.edges(data=True))
+        return graph
+
+
+class _BeliefAdjacency(object):
+    """The beliefs about the edges of a node, i.e. graph[u]."""
+
+    def __init__(self, graph, u):
+        self._graph = graph
+        self._u = u
+
+    def __getitem__(self, v):
+        if not self._graph.has_edge(self._u, v):
+            raise KeyError(v)
+        return self._graph.get_edge_data(self._u, v)
+
+
+class EdgeBeliefs(collections.abc.MutableMapping):
+    """The beliefs about an edge at a level, as a mutable mapping to the
+    values of the arrays of a mental state, e.g. None if it is unknown
+    whether the edge is optimal."""
+
+    def __init__(self, arrays, edge_id):
+        self._arrays = arrays
+        self._id = edge_id
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __getitem__(self, key):
+        value = self._arrays[key][self._id].item()
+        if key == 'is_optimal' and math.isnan(value):
+            return None
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'is_optimal' and value is None:
+            value = np.nan
+        self._arrays[key][self._id] = value
+
+    def __delitem__(self, key):
+        print('Cannot delete a belief: {}'.format(key))
+        raise ValueError
+
+    def __iter__(self):
+        return iter(self._arrays)
+
+    def __len__(self):
+        return len(self._arrays)
+
+
 def get_node_name(node, beliefs):
     return beliefs['world'].nodes[node]['text'].split()[-1]
@@ -0,0 +1,178 @@
+import concurrent.futures
+import math
+import os
+
+from ..domain.state import EnvState
+from ..world import get_moved_node
+from .reasoning import TraversalPlanner, TraversalJumpingPlanner, \
+    PrimsPlanner
+
+
+# The planners of the strategies that plan by the network alone.
+STRATEGY_PLANNERS = {
+    'greedy': TraversalJumpingPlanner,
+    'optimal': PrimsPlanner,
+    'aligning': TraversalJumpingPlanner,
+    'pilot': TraversalPlanner,
+}
+
+# The strategies to evaluate by default, one per planner.
+DEFAULT_STRATEGIES = ('greedy', 'optimal', 'pilot')
+
+# The evaluator of a worker process, set by _init_worker().
+_worker_evaluator = None
+
+
+def get_situations(world):
+    """Get the situations along a world's history, e.g. of a log, to
+    evaluate the strategies at (see evaluate_strategies()).
+
+    The current node at each state is the node the robot believes they
+    are at, as tracked by update_belief(). The actions that are not
+    feasible at their state (e.g. in some logs) do not move the current
+    node, as World.act() ignores them.
+
+    Returns:
+        list: a (state, current node) pair for each state.
+    """
+    history = world.history
+    policy_model = world.agent.policy_model
+    state = history[0]
+    cur_node = world.agent.get_state(1).cur_node
+
+    situations = [(state, cur_node)]
+    for i in range(1, len(history), 2):
+        action, next_state = history[i], history[i + 1]
+        if action in policy_model.get_all_actions(state=state):
+            new_cur_node = get_moved_node(state, next_state, action)
+            if new_cur_node is not None:
+                cur_node = new_cur_node
+        situations.append((next_state, cur_node))
+        state = next_state
+
+    return situations
+
+
+def evaluate_strategies(situations, strategies=DEFAULT_STRATEGIES,
+                        max_workers=None, chunk_size=None):
+    """Plan by each of the robot's strategies at many situations at once,
+    e.g. at every state of the logs of a study.
+
+    A plan depends only on the background graph, the selected edges and
+    the current node, hence the equal situations are planned once. The
+    situations are planned by a pool of worker processes, in chunks. Each
+    worker receives the background graphs (as networks without a
+    selection, i.e. templates) once, at its start, and then each situation
+    as the id of its template, the bitmask of its selected edges and its
+    current node. Each worker keeps a planner per template and strategy,
+    that plans incrementally across the situations of a chunk.
+
+    Args:
+        situations (iterable): The (state, current node) pairs, e.g. from
+            get_situations().
+        strategies (iterable, optional): The strategies, as keys of
+            STRATEGY_PLANNERS (default DEFAULT_STRATEGIES).
+        max_workers (int, optional): The number of the worker processes
+            (default the number of the CPUs); 1 plans in this process.
+        chunk_size (int, optional): The number of the situations to send
+            to a worker at a time (default to have four chunks per worker).
+
+    Returns:
+        list: the plans at each situation by strategy, i.e. a dictionary
+            from a strategy to the action, the explanation and the current
+            node after planning.
+    """
+    strategies = list(strategies)
+    for strategy in strategies:
+        if strategy not in STRATEGY_PLANNERS:
+            print('Unknown strategy {}: not in {}.'.format(
+                strategy, sorted(STRATEGY_PLANNERS)))
+            raise ValueError
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers < 1:
+        print('Number of workers must be positive: {}'.format(max_workers))
+        raise ValueError
+
+    # Encode the situations by their templates, planning the equal ones once.
+    templates = list()
+    template_ids = dict()
+    tasks = list()
+    task_ids = dict()
+    situation_task_ids = list()
+    for state, cur_node in situations:
+        network = state.network
+        template_id = template_ids.get(network.index)
+        if template_id is None:
+            template_id = template_ids[network.index] = len(templates)
+            templates.append(network.cleared().replace(suggested_edge=None))
+
+        task = (template_id, network.selected_mask, cur_node)
+        task_id = task_ids.get(task)
+        if task_id is None:
+            task_id = task_ids[task] = len(tasks)
+            tasks.append(task)
+        situation_task_ids.append(task_id)
+
+    max_workers = min(max_workers, max(len(tasks), 1))
+    if max_workers == 1:
+        plans = _StrategyEvaluator(templates, strategies).evaluate(tasks)
+    else:
+        if chunk_size is None:
+            chunk_size = math.ceil(len(tasks) / (4 * max_workers))
+        chunks = [tasks[i:i + chunk_size]
+                  for i in range(0, len(tasks), chunk_size)]
+
+        plans = list()
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker,
+                initargs=(templates, strategies)) as executor:
+            for chunk_plans in executor.map(_evaluate_chunk, chunks):
+                plans.extend(chunk_plans)
+
+    return [plans[i] for i in situation_task_ids]
+
+
+class _StrategyEvaluator(object):
+    """A class to plan by some strategies at situations encoded by their
+    templates, see evaluate_strategies()."""
+
+    def __init__(self, templates, strategies):
+        self.templates = templates
+        self.strategies = strategies
+        self._planners = dict()
+
+    def evaluate(self, tasks):
+        """Plan at each (template id, selected mask, current node) task.
+
+        Returns:
+            list: the plans at each task by strategy.
+        """
+        plans = list()
+        for template_id, mask, cur_node in tasks:
+            network = self.templates[template_id].replace(selected_mask=mask)
+            plans.append({
+                strategy: self._get_planner(template_id, strategy)._get_plan(
+                    network, cur_node)
+                for strategy in self.strategies})
+        return plans
+
+    def _get_planner(self, template_id, strategy):
+        key = (template_id, strategy)
+        planner = self._planners.get(key)
+        if planner is None:
+            state = EnvState(
+                network=self.templates[template_id], agents=frozenset())
+            planner = self._planners[key] = STRATEGY_PLANNERS[strategy](state)
+        return planner
+
+
+def _init_worker(templates, strategies):
+    """Initialize a worker process with the templates, once."""
+    global _worker_evaluator
+    _worker_evaluator = _StrategyEvaluator(templates, strategies)
+
+
+def _evaluate_chunk(tasks):
+    return _worker_evaluator.evaluate(tasks)
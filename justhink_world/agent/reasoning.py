@@ -1,16 +1,153 @@
-from justhink_world.domain.action import SuggestPickAction, AttemptSubmitAction
+import collections
+import concurrent.futures
+import functools
+import heapq
+import threading
+import time
+import weakref
+
+from justhink_world.domain.action import SuggestPickAction, \
+    AttemptSubmitAction, get_action
 
 from justhink_world.agent import Agent
+from justhink_world.tools.network import get_network_index, \
+    get_network_arrays
 
 from pqdict import PQDict
 
 
-class TraversalPlanner(object):
+# The default latency budget of an anytime plan, in milliseconds.
+DEFAULT_DEADLINE_MS = 50
+
+# The weight of the last run in an anytime planner's estimate of a
+# planner's duration, and the factor to decay the estimate by at a skip.
+DURATION_SMOOTHING = 0.5
+
+
+class PlanCache(object):
+    """A class to cache the planners' plans, with a bounded size and
+    least-recently-used (LRU) eviction.
+
+    A plan depends only on the planner's type (i.e. the strategy), the
+    background graph, the selected edges and the current node, hence is
+    cached by a fingerprint of these: the graph's index (compared by value,
+    see NetworkIndex), the bitmask of the selected edges and the node. A
+    cache can be shared by the planners of many worlds, e.g. to replay
+    logs, and by threads. The cached explanations are shared, hence are not
+    to be changed.
+
+    Attributes:
+        max_size (int, optional):
+            the maximum number of plans to keep (default 10000)
+        num_hits (int):
+            the number of look-ups that found a plan
+        num_misses (int):
+            the number of look-ups that did not find a plan
+    """
+
+    def __init__(self, max_size=10000):
+        if max_size < 1:
+            print('Cache size must be positive: {}'.format(max_size))
+            raise ValueError
+
+        self.max_size = max_size
+        self.num_hits = 0
+        self.num_misses = 0
+        self._plans = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __contains__(self, key):
+        return key in self._plans
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'PlanCache(size={}/{}, hits={}, misses={})'.format(
+            len(self), self.max_size, self.num_hits, self.num_misses)
+
+    @property
+    def hit_rate(self):
+        """float: the ratio of the look-ups that found a plan."""
+        num_lookups = self.num_hits + self.num_misses
+        return self.num_hits / num_lookups if num_lookups > 0 else 0.0
+
+    def get(self, key):
+        """Get a plan, i.e. the action, the explanation and the current node
+        after planning, or None if not cached."""
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                self.num_misses += 1
+            else:
+                self.num_hits += 1
+                self._plans.move_to_end(key)
+        return plan
+
+    def put(self, key, plan):
+        """Cache a plan, evicting the least recently used plan if full."""
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            if len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+
+    def clear(self):
+        """Remove all the plans and reset the counters."""
+        with self._lock:
+            self._plans.clear()
+            self.num_hits = 0
+            self.num_misses = 0
+
+
+class Planner(object):
+    """A base class for the planners that plan by the selected edges of a
+    network and a current node. Inherit and override _plan(self, network,
+    cur_node).
+
+    If a cache (PlanCache) is given, the plans are memoized in that cache.
+
+    Attributes:
+        cache (PlanCache, optional):
+            the cache of the plans, or None to not cache (default None)
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+    def _get_plan(self, network, cur_node):
+        """Get the plan at a network and a current node, from the cache if
+        available.
+
+        Returns:
+            tuple: the action, the explanation and the current node after
+                planning.
+        """
+        if self.cache is None:
+            return self._plan(network, cur_node)
+
+        key = (self.__class__, network.index, network.selected_mask,
+               cur_node)
+        plan = self.cache.get(key)
+        if plan is None:
+            plan = self._plan(network, cur_node)
+            self.cache.put(key, plan)
+        return plan
+
+    def _plan(self, network, cur_node):
+        raise NotImplementedError
+
+
+class TraversalPlanner(Planner):
     """Define a greedy traversal planner.
 
     It will produce a suboptimal solution."""
 
-    def __init__(self, state, start=None):
+    def __init__(self, state, start=None, cache=None):
+        super().__init__(cache=cache)
         self.state = state
 
         if start is None:
@@ -22,36 +159,45 @@ class TraversalPlanner(object):
 
         self.last_explanation = None
 
+        self._cursors = None
+
     def plan(self, agent):
         """Select the next action by greedy traversal planning."""
         # Select greedy.
         self.state = agent.cur_belief.mpe()
         self.cur_node = agent.cur_state.cur_node
 
-        min_nodes, other_nodes = get_greedy_neighbor(
-            self.state.network.graph, self.cur_node,
-            self.state.network.subgraph)
+        action, expl, self.cur_node = self._get_plan(
+            self.state.network, self.cur_node)
+        self.last_explanation = expl
+
+        return action
+
+    def _plan(self, network, cur_node):
+        self._cursors = NeighborCursors.update(self._cursors, network)
+        min_nodes, other_nodes = self._cursors.get_min_neighbors(cur_node)
 
         # Make an explanation in terms of actions.
         expl = BetterThanExplanation()
         agent = Agent.ROBOT
         if len(min_nodes) == 0:
             expl = ConnectedExplanation()
-            expl.best = {AttemptSubmitAction(agent=agent)}
+            expl.best = {get_action(AttemptSubmitAction, agent=agent)}
         else:
-            expl.best = {SuggestPickAction((self.cur_node, u), agent=agent)
-                         for u in min_nodes}
-            expl.others = {SuggestPickAction((self.cur_node, u), agent=agent)
-                           for u in other_nodes}
+            expl.best = {
+                get_action(SuggestPickAction, (cur_node, u), agent=agent)
+                for u in min_nodes}
+            expl.others = {
+                get_action(SuggestPickAction, (cur_node, u), agent=agent)
+                for u in other_nodes}
 
         # Choose the action.
         action = sorted(expl.best)[0]
-        self.last_explanation = expl
 
-        return action
+        return action, expl, cur_node
 
 
-class TraversalJumpingPlanner(object):
+class TraversalJumpingPlanner(Planner):
     """Define a greedy traversal jumping planner.
     Instead of submitting when there is no outgoing edges from the current node
     as in TraversalPlanner, it will go around and try to continue connecting.
@@ -59,7 +205,8 @@ class TraversalJumpingPlanner(object):
     It will produce a suboptimal solution.
     """
 
-    def __init__(self, state, start=None):
+    def __init__(self, state, start=None, cache=None):
+        super().__init__(cache=cache)
         self.state = state
 
         if start is None:
@@ -74,26 +221,35 @@ class TraversalJumpingPlanner(object):
         self.last_explanation = None
         self.last_plan = None
 
+        self._cursors = None
+
     def plan(self, state, cur_node):  # agent):
         """Select the next action by greedy traversal planning."""
         self.state = state
         self.cur_node = cur_node
 
-        min_nodes, other_nodes = get_greedy_neighbor(
-            self.state.network.graph, self.cur_node,
-            self.state.network.subgraph)
+        action, expl, self.cur_node = self._get_plan(
+            self.state.network, self.cur_node)
+
+        self.last_explanation = expl
+        self.last_plan = action
+
+        return action
+
+    def _plan(self, network, cur_node):
+        cursors = NeighborCursors.update(self._cursors, network)
+        self._cursors = cursors
+        min_nodes, other_nodes = cursors.get_min_neighbors(cur_node)
 
         # Decide to pick an edge if any, instead of submitting.
         if len(min_nodes) == 0:
             # For each selected node.
-            for u in sorted(self.state.network.get_selected_nodes()):
+            for u in sorted(network.get_selected_nodes()):
                 # Move the current.
-                self.cur_node = u
-                # For each available action.
-                min_nodes, other_nodes = get_greedy_neighbor(
-                    self.state.network.graph, self.cur_node,
-                    self.state.network.subgraph)
-                if len(min_nodes) != 0:
+                cur_node = u
+                # For the first node with an available action.
+                if cursors.has_neighbors(u):
+                    min_nodes, other_nodes = cursors.get_min_neighbors(u)
                     break
 
         # Make an explanation in terms of actions.
@@ -101,27 +257,34 @@ class TraversalJumpingPlanner(object):
         agent = Agent.ROBOT
         if len(min_nodes) == 0:
             expl = ConnectedExplanation()
-            expl.best = {AttemptSubmitAction(agent=agent)}
+            expl.best = {get_action(AttemptSubmitAction, agent=agent)}
         else:
-            expl.best = {SuggestPickAction((self.cur_node, u), agent=agent)
-                         for u in min_nodes}
-            expl.others = {SuggestPickAction((self.cur_node, u), agent=agent)
-                           for u in other_nodes}
+            expl.best = {
+                get_action(SuggestPickAction, (cur_node, u), agent=agent)
+                for u in min_nodes}
+            expl.others = {
+                get_action(SuggestPickAction, (cur_node, u), agent=agent)
+                for u in other_nodes}
 
         # Choose the action.
         action = sorted(expl.best)[0]
 
-        self.last_explanation = expl
-        self.last_plan = action
+        return action, expl, cur_node
 
-        return action
 
-
-def get_greedy_neighbor(graph, u, excluded_subgraph):
+def get_greedy_neighbor(graph, u, excluded_subgraph, excluded_mask=None):
     """Find the nodes in graph with the lowest cost connected to a node u.
 
-    Ignore the edges in excluded_subgraph (e.g. selected edges).
+    Ignore the edges in excluded_subgraph (e.g. selected edges), given
+    also as a bitmask in excluded_mask if available.
     """
+    # Use the array-backed view of the graph if it is large enough.
+    arrays = get_network_arrays(graph)
+    if arrays is not None:
+        if excluded_mask is None:
+            excluded_mask = get_network_index(graph).get_mask(
+                excluded_subgraph.edges())
+        return arrays.get_min_neighbors(u, excluded_mask)
 
     # Find a minimum cost neighbor.
     min_cost = None
@@ -147,10 +310,115 @@ def get_greedy_neighbor(graph, u, excluded_subgraph):
     return min_nodes, other_nodes
 
 
-class PrimsPlanner():
+class NeighborCursors(object):
+    """A class to find the lowest cost available neighbors of the nodes
+    incrementally, for the greedy planners.
+
+    The neighbors of each node are sorted by cost once, and a cursor per
+    node points to its first neighbor by an edge that is not selected. As
+    the selection grows (e.g. along a run), the cursors only move forward,
+    past the edges that are selected since, so that finding whether a node
+    has an available neighbor takes constant amortized time. The cursors
+    restart if an edge is removed from the selection (e.g. by a reset or
+    by navigating the history).
+
+    Attributes:
+        index (NetworkIndex):
+            the index of the graph's edges
+        mask (int):
+            the bitmask of the selected edges that the cursors skip
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.mask = 0
+
+        # The (cost, neighbor, edge bit) of each node by cost and neighbor.
+        self._neighbors = {
+            u: [(cost, v, 1 << i) for cost, v, i in neighbors]
+            for u, neighbors in _get_sorted_neighbors(index).items()}
+
+        self._cursors = dict.fromkeys(self._neighbors, 0)
+
+    @classmethod
+    def update(cls, cursors, network):
+        """Update the cursors to the selection of a network, or create new
+        cursors if there are none for the network's graph.
+
+        Returns:
+            NeighborCursors: the updated cursors.
+        """
+        if cursors is None or cursors.index != network.index:
+            cursors = cls(network.index)
+        mask = network.selected_mask
+        if mask & cursors.mask != cursors.mask:
+            cursors._cursors = dict.fromkeys(cursors._neighbors, 0)
+        cursors.mask = mask
+        return cursors
+
+    def has_neighbors(self, u) -> bool:
+        """Check if a node has a neighbor by an edge that is not selected."""
+        return self._advance(u) < len(self._neighbors[u])
+
+    def get_min_neighbors(self, u) -> tuple:
+        """Find the neighbors of a node with the lowest cost edges, as
+        get_greedy_neighbor().
+
+        Returns:
+            tuple: the set of the nodes with the minimum cost edges, and
+                the set of the other neighbors.
+        """
+        min_nodes = set()
+        other_nodes = set()
+
+        neighbors = self._neighbors[u]
+        i = self._advance(u)
+        if i == len(neighbors):
+            return min_nodes, other_nodes
+
+        min_cost = neighbors[i][0]
+        mask = self.mask
+        for cost, v, bit in neighbors[i:]:
+            if mask & bit:
+                continue
+            if cost == min_cost:
+                min_nodes.add(v)
+            else:
+                other_nodes.add(v)
+
+        return min_nodes, other_nodes
+
+    def _advance(self, u):
+        """Move the cursor of a node past its selected edges."""
+        neighbors = self._neighbors[u]
+        i = self._cursors[u]
+        while i < len(neighbors) and self.mask & neighbors[i][2]:
+            i += 1
+        self._cursors[u] = i
+        return i
+
+
+def _get_sorted_neighbors(index):
+    """Get the (cost, neighbor, edge id) of each node of an indexed graph,
+    sorted by cost and neighbor."""
+    arrays = index.arrays
+    indptr = arrays.indptr.tolist()
+    neighbors = arrays.neighbors.tolist()
+    edge_ids = arrays.neighbor_edges.tolist()
+    result = dict()
+    for i, u in enumerate(arrays.nodes):
+        begin, end = indptr[i], indptr[i + 1]
+        result[u] = [
+            (index.costs[e], arrays.nodes[v], e)
+            for v, e in zip(neighbors[begin:end], edge_ids[begin:end])]
+    return result
+
+
+class PrimsPlanner(Planner):
     """Define a Prim's (or JPD (Jarnik/Prim/Dijkstra)) planner."""
 
-    def __init__(self, state, start=None):
+    def __init__(self, state, start=None, cache=None):
+        super().__init__(cache=cache)
         self.state = state
 
         if start is None:
@@ -165,34 +433,507 @@ class PrimsPlanner():
         self.last_explanation = None
         self.last_plan = None
 
+        self._frontier = None
+
     def plan(self, state, cur_node):  # agent):
         """Select the next action by Prim's planning."""
         # Select greedy.
         self.state = state
         self.cur_node = cur_node
 
-        expl, min_edges = get_prims_pick(
-            self.state.network.graph, self.cur_node,
-            self.state.network.subgraph.edges())
+        action, expl, _ = self._get_plan(self.state.network, self.cur_node)
+
+        self.last_explanation = expl
+        self.last_plan = action
+
+        return action
+
+    def _plan(self, network, cur_node):
+        self._frontier = PrimsFrontier.update(
+            self._frontier, network, cur_node)
+        min_edges, next_edges, other_edges = self._frontier.get_min_edges()
+        if len(next_edges) > 1:
+            # get_prims_pick() drops one of the edges with the next cost
+            # from the others, by the order of its queue: pick as it does.
+            expl, min_edges = get_prims_pick(
+                network.graph, cur_node, network.subgraph.edges())
+            other_edges = expl.others
 
         # Refine the explanation in terms of actions.
-        if min_edges is None:
+        if len(min_edges) == 0:
             expl = ConnectedExplanation()
-            expl.best = {AttemptSubmitAction(agent=Agent.ROBOT)}
+            expl.best = {get_action(AttemptSubmitAction, agent=Agent.ROBOT)}
         else:
-            expl.best = {SuggestPickAction(e, agent=Agent.ROBOT)
+            expl = BetterThanExplanation()
+            expl.best = {get_action(SuggestPickAction, e, agent=Agent.ROBOT)
                          for e in min_edges}
-            expl.others = {SuggestPickAction(e, agent=Agent.ROBOT)
-                           for e in expl.others}
+            expl.others = {get_action(SuggestPickAction, e, agent=Agent.ROBOT)
+                           for e in other_edges}
 
         # Choose the action.
         action = sorted(expl.best)[0]
 
+        return action, expl, cur_node
+
+
+class PrimsFrontier(object):
+    """A class to keep the frontier of Prim's algorithm across turns, i.e.
+    the edges from the nodes of the selected edges (or from the start
+    node if none is selected) to the other nodes, as get_prims_pick().
+
+    The frontier edges are kept in a heap by cost. As the selection grows,
+    the edges of the nodes that join are pushed, and the edges that became
+    internal are deleted lazily, when they reach the top of the heap. The
+    frontier restarts if an edge is removed from the selection (e.g. by
+    clearing, or by navigating the history).
+
+    Attributes:
+        index (NetworkIndex):
+            the index of the graph's edges
+        start (int):
+            the start node, if no edge is selected
+        mask (int):
+            the bitmask of the selected edges
+        nodes (set):
+            the nodes in the tree, i.e. of the selected edges
+        edges (dict):
+            the frontier edges by their ids, each as a node pair (u, v)
+            from the tree
+    """
+
+    def __init__(self, index, mask, start=None):
+        self.index = index
+        self.start = start
+        self.mask = mask
+        self.nodes = set()
+        self.edges = dict()
+
+        self._neighbors = _get_sorted_neighbors(index)
+        self._heap = list()
+
+        if mask == 0:
+            self._add_nodes([start])
+        else:
+            self._add_nodes(index.get_nodes(mask))
+
+    @classmethod
+    def update(cls, frontier, network, start):
+        """Update the frontier to the selection of a network, or create a
+        new frontier if it cannot grow to the selection.
+
+        Returns:
+            PrimsFrontier: the updated frontier.
+        """
+        mask = network.selected_mask
+        if frontier is None or frontier.index != network.index \
+                or mask & frontier.mask != frontier.mask \
+                or (frontier.mask == 0 and (
+                    mask != 0 or start != frontier.start)):
+            return cls(network.index, mask, start=start)
+
+        added = mask & ~frontier.mask
+        if added:
+            frontier.mask = mask
+            frontier._add_nodes(
+                frontier.index.get_nodes(added) - frontier.nodes)
+        return frontier
+
+    def get_min_edges(self) -> tuple:
+        """Find the frontier edges with the lowest and the second lowest
+        costs.
+
+        Returns:
+            tuple: the list of the edges with the minimum cost, the list of
+                the edges with the next cost, and the set of the other
+                frontier edges.
+        """
+        min_edges = self._pop_min_edges()
+        next_edges = self._pop_min_edges()
+        # Push the popped edges back.
+        for cost, i in min_edges + next_edges:
+            heapq.heappush(self._heap, (cost, i))
+
+        popped_ids = {i for _, i in min_edges + next_edges}
+        other_edges = {
+            e for i, e in self.edges.items() if i not in popped_ids}
+
+        return ([self.edges[i] for _, i in min_edges],
+                [self.edges[i] for _, i in next_edges], other_edges)
+
+    def _pop_min_edges(self):
+        """Pop the (cost, edge id) entries of the frontier edges with the
+        minimum cost, deleting the edges that left the frontier."""
+        heap = self._heap
+        while len(heap) > 0 and heap[0][1] not in self.edges:
+            heapq.heappop(heap)
+        entries = list()
+        while len(heap) > 0 and (
+                len(entries) == 0 or heap[0][0] == entries[0][0]):
+            entry = heapq.heappop(heap)
+            if entry[1] in self.edges:
+                entries.append(entry)
+        return entries
+
+    def _add_nodes(self, nodes):
+        """Add nodes to the tree, updating the frontier edges."""
+        for u in nodes:
+            self.nodes.add(u)
+            for cost, v, i in self._neighbors[u]:
+                if v in self.nodes:
+                    # The edge became internal, if it was in the frontier.
+                    self.edges.pop(i, None)
+                else:
+                    self.edges[i] = (u, v)
+                    heapq.heappush(self._heap, (cost, i))
+
+
+class AnytimePlanner(object):
+    """Define a planner with a latency budget, that plans with a cheap
+    fallback planner first, and then refines the plan with more expensive
+    planners while the budget allows.
+
+    The planners are run in order, from the fallback to the best, and the
+    plan of the last planner that completes is returned, with its
+    explanation. A planner is skipped if it is not expected to complete
+    within the remaining budget, by an estimate of its duration: an
+    exponential moving average of its runs, that decays at each skip, so
+    that an outlier (e.g. a cold start) delays the planner only for a few
+    plans. As the planners cannot be interrupted, a planner's first run
+    may exceed the budget; the fallback always runs.
+
+    By default, the fallback is a TraversalJumpingPlanner, and the only
+    refinement is a PrimsPlanner. On the activity's networks, Prim's
+    planning takes tens of microseconds, which fits any practical budget.
+    With the defaults, this is therefore effectively Prim's planning, with
+    the greedy fallback only for a budget of (nearly) zero. Give the
+    planners to refine with more expensive ones, e.g. lookahead planners.
+
+    Attributes:
+        planners (list):
+            the planners, from the fallback to the best
+        deadline_ms (float):
+            the latency budget of a plan in milliseconds
+        last_info (dict):
+            the metadata of the last plan, i.e. the planner that made it,
+            the numbers of the completed and skipped planners, the elapsed
+            time in milliseconds, and whether all the planners completed
+    """
+
+    def __init__(self, state, start=None, cache=None,
+                 deadline_ms=DEFAULT_DEADLINE_MS, planners=None):
+        if deadline_ms < 0:
+            print('Deadline must be non-negative: {}'.format(deadline_ms))
+            raise ValueError
+
+        if planners is None:
+            planners = [TraversalJumpingPlanner(state, start, cache=cache),
+                        PrimsPlanner(state, start, cache=cache)]
+        if len(planners) == 0:
+            print('At least a fallback planner is needed.')
+            raise ValueError
+
+        self.planners = planners
+        self.deadline_ms = deadline_ms
+
+        self.state = state
+        self.cur_node = planners[0].cur_node
+
+        self.last_explanation = None
+        self.last_plan = None
+        self.last_info = None
+
+        # The estimated duration of each planner, in seconds, or None if it
+        # has not run yet.
+        self._durations = [None] * len(planners)
+
+    def plan(self, state, cur_node):
+        """Select the next action by the best planner within the budget."""
+        self.state = state
+        start_time = time.perf_counter()
+        deadline = start_time + self.deadline_ms / 1000
+
+        planner = None
+        num_completed = 0
+        num_skipped = 0
+        for i, p in enumerate(self.planners):
+            now = time.perf_counter()
+            estimate = self._durations[i]
+            if i > 0 and now + (estimate or 0.0) > deadline:
+                if estimate is not None:
+                    self._durations[i] = (1 - DURATION_SMOOTHING) * estimate
+                num_skipped += 1
+                continue
+
+            action = p.plan(state, cur_node)
+            duration = time.perf_counter() - now
+            if estimate is None:
+                self._durations[i] = duration
+            else:
+                self._durations[i] = DURATION_SMOOTHING * duration \
+                    + (1 - DURATION_SMOOTHING) * estimate
+            planner = p
+            num_completed += 1
+
+        self.cur_node = planner.cur_node
+        self.last_explanation = planner.last_explanation
+        self.last_plan = action
+        self.last_info = {
+            'planner': planner.__class__.__name__,
+            'num_completed': num_completed,
+            'num_skipped': num_skipped,
+            'elapsed_ms': 1000 * (time.perf_counter() - start_time),
+            'is_complete': num_completed == len(self.planners),
+        }
+
+        return action
+
+
+class PolicyPlanner(object):
+    """Define a planner that looks the robot's action up in a solved policy
+    (see solve_world()) instead of planning at each state.
+
+    At the states that the policy does not cover (e.g. at the human's
+    turn, or outside the compiled states), it plans with a fallback
+    planner instead.
+    """
+
+    def __init__(self, policy, planner):
+        self.policy = policy
+        self.planner = planner
+
+        self.last_explanation = None
+        self.last_plan = None
+
+    @property
+    def state(self):
+        return self.planner.state
+
+    @property
+    def cur_node(self):
+        return self.planner.cur_node
+
+    @cur_node.setter
+    def cur_node(self, value):
+        self.planner.cur_node = value
+
+    def plan(self, state, cur_node):
+        """Select the next action from the policy."""
+        state_id = self.policy.get_state_id(state)
+        action = self.policy.get_action(state_id)
+
+        if action is None:
+            action = self.planner.plan(state, cur_node)
+            expl = self.planner.last_explanation
+        else:
+            self.planner.state = state
+            self.planner.cur_node = cur_node
+
+            # Explain by the equally good best actions, against the others.
+            q_values = self.policy.get_q_values(state_id)
+            best = self.policy.get_best_actions(state_id, q_values)
+            expl = BetterThanExplanation(
+                best=best,
+                others={a for a in q_values
+                        if isinstance(a, SuggestPickAction)} - best)
+
+        self.last_explanation = expl
+        self.last_plan = action
+
+        return action
+
+
+class SpeculativePlanner(object):
+    """Define a planner that plans ahead in the background, for the
+    situations that may follow the current state (e.g. one per feasible
+    action of the human at their turn), by a pool of worker threads.
+
+    When a plan is requested for a situation that was speculated, the
+    finished plan is picked up instead of planning again; otherwise, it
+    plans synchronously with the wrapped planner. A plan request cancels
+    the speculations left, as they are stale by then.
+
+    The planners are not thread-safe, hence each worker plans with its own
+    planner, made by create_planner() (without a cache, for the same
+    reason). If create_planner is None, the workers share the wrapped
+    planner, one plan at a time.
+
+    A speculation is keyed by the state (compared by value) and the
+    current node, as a plan may depend on any of the state (e.g. with a
+    solved policy, see PolicyPlanner).
+
+    A speculation that raises an error is reported, and the plan is made
+    synchronously instead. close() the planner (or use it as a context
+    manager) to shut the workers down; otherwise, they are shut down when
+    the planner is garbage collected, or at exit.
+
+    Attributes:
+        planner:
+            the planner of the synchronous plans
+        max_workers (int, optional):
+            the number of the worker threads (default 1)
+        num_speculations (int):
+            the number of the speculations submitted
+        num_hits (int):
+            the number of the plans picked up from a speculation
+        num_misses (int):
+            the number of the plans made synchronously while speculating,
+            i.e. for a situation not speculated (e.g. by the manager)
+        num_cancelled (int):
+            the number of the stale speculations cancelled before they
+            started
+        num_errors (int):
+            the number of the speculations that raised an error
+    """
+
+    def __init__(self, planner, create_planner=None, max_workers=1):
+        if max_workers < 1:
+            print('Number of workers must be positive: {}'.format(
+                max_workers))
+            raise ValueError
+
+        self.planner = planner
+        self.max_workers = max_workers
+
+        self.state = planner.state
+        self.cur_node = planner.cur_node
+
+        self.last_explanation = None
+        self.last_plan = None
+
+        self.num_speculations = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_cancelled = 0
+        self.num_errors = 0
+
+        self._create_planner = create_planner
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='speculation')
+        # Shut the workers down, at close() or when not referenced anymore.
+        self._finalizer = weakref.finalize(
+            self, self._executor.shutdown, wait=False, cancel_futures=True)
+        self._futures = dict()
+        # The planner of each worker thread, or the lock of the shared one.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return ('SpeculativePlanner({}, speculations={}, hits={},'
+                ' misses={}, cancelled={}, errors={})').format(
+                    self.planner.__class__.__name__, self.num_speculations,
+                    self.num_hits, self.num_misses, self.num_cancelled,
+                    self.num_errors)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def hit_rate(self):
+        """float: the ratio of the plans picked up from a speculation,
+        among the plans requested while speculating."""
+        num_plans = self.num_hits + self.num_misses
+        return self.num_hits / num_plans if num_plans > 0 else 0.0
+
+    @property
+    def num_pending(self):
+        """int: the number of the speculations not picked up yet."""
+        return len(self._futures)
+
+    def speculate(self, situations):
+        """Plan in the background for the possible next situations, each
+        as a (state, current node) pair, replacing the previous
+        speculations."""
+        self.cancel()
+        for state, cur_node in situations:
+            key = (state.key, cur_node)
+            if key in self._futures:
+                continue
+            # The workers do not refer to this planner, not to keep it.
+            future = self._executor.submit(
+                self._plan_ahead, self.planner, self._create_planner,
+                self._local, self._lock, state, cur_node)
+            future.add_done_callback(functools.partial(
+                self._report_error, weakref.ref(self)))
+            self._futures[key] = future
+            self.num_speculations += 1
+
+    def plan(self, state, cur_node):
+        """Select the next action, by a speculation if available."""
+        is_speculating = len(self._futures) > 0
+        future = self._futures.pop((state.key, cur_node), None)
+        self.cancel()
+
+        # Wait for a running speculation, as it plans the same; if it
+        # raised an error (reported already), plan again.
+        if future is not None and not future.cancel() \
+                and future.exception() is None:
+            action, expl, next_cur_node = future.result()
+            self.num_hits += 1
+        else:
+            with self._lock:
+                action = self.planner.plan(state, cur_node)
+                expl = self.planner.last_explanation
+                next_cur_node = self.planner.cur_node
+            if is_speculating:
+                self.num_misses += 1
+
+        self.state = state
+        self.cur_node = next_cur_node
         self.last_explanation = expl
         self.last_plan = action
 
         return action
 
+    def cancel(self):
+        """Cancel the speculations that have not started, and drop the
+        others' results."""
+        for future in self._futures.values():
+            if future.cancel():
+                self.num_cancelled += 1
+        self._futures.clear()
+
+    def close(self):
+        """Cancel the speculations and shut the workers down."""
+        self.cancel()
+        self._finalizer()
+
+    @staticmethod
+    def _report_error(planner_ref, future):
+        """Report the error of a speculation, if it raised one."""
+        if future.cancelled() or future.exception() is None:
+            return
+        planner = planner_ref()
+        if planner is not None:
+            with planner._lock:
+                planner.num_errors += 1
+        print('Speculative planning failed: {!r}'.format(future.exception()))
+
+    @staticmethod
+    def _plan_ahead(planner, create_planner, local, lock, state, cur_node):
+        """Plan at a situation, in a worker thread, with the worker's own
+        planner (made by create_planner), or with the shared planner.
+
+        Returns:
+            tuple: the action, the explanation and the current node after
+                planning.
+        """
+        if create_planner is None:
+            with lock:
+                action = planner.plan(state, cur_node)
+                return action, planner.last_explanation, planner.cur_node
+
+        planner = getattr(local, 'planner', None)
+        if planner is None:
+            planner = local.planner = create_planner()
+        action = planner.plan(state, cur_node)
+        return action, planner.last_explanation, planner.cur_node
+
 
 def get_prims_pick(graph, start, edges=frozenset(), weight_label='cost'):
     """Function receives a graph and a starting node, and return the next."""
@@ -0,0 +1,291 @@
+import hashlib
+import pathlib as pl
+
+import numpy as np
+
+from ..compiler import compile_world, DEFAULT_CACHE_DIR, DEFAULT_MAX_STATES
+from ..domain.action import SubmitAction
+from ..models.human_model import HumanModel
+from .agent import Agent
+
+
+def solve_world(world, human_model=None, gamma=0.95, tol=1e-6,
+                max_iterations=10000, max_states=DEFAULT_MAX_STATES,
+                cache_dir=DEFAULT_CACHE_DIR, use_cache=True, verbose=False):
+    """Compute the robot's optimal policy in a world by value iteration.
+
+    The world is compiled (see compile_world()) with the human's and the
+    robot's actions. The robot maximizes its expected discounted reward
+    (by the world's reward model, see get_solver_rewards()), while the
+    human responds by a human model. The policy is cached along with the
+    compiled world.
+
+    Args:
+        world (str or World): The world, or its name for create_world().
+        human_model (HumanModel, optional): The model of the human's
+            responses (default HumanModel.agreeing()).
+        gamma (float, optional): The discount factor.
+        tol (float, optional): The maximum change of a state's value to
+            stop the iterations at.
+        max_iterations (int, optional): The maximum number of iterations.
+        max_states (int, optional): The maximum number of states to
+            compile (see compile_world()).
+        cache_dir (str or pathlib.Path, optional): The directory to cache
+            the compiled world and the policy in.
+        use_cache (bool, optional): Whether to load the policy from and
+            save it to the cache (default True).
+        verbose (bool, optional): Whether to print progress.
+
+    Returns:
+        SolvedPolicy: the solved policy.
+    """
+    if human_model is None:
+        human_model = HumanModel.agreeing()
+
+    compiled = compile_world(
+        world, agents={Agent.HUMAN, Agent.ROBOT}, max_states=max_states,
+        cache_dir=cache_dir, use_cache=use_cache, verbose=verbose)
+
+    description = repr((compiled.fingerprint, repr(human_model), gamma, tol))
+    fingerprint = hashlib.sha1(description.encode()).hexdigest()
+
+    cache_file = None
+    if use_cache:
+        cache_file = pl.Path(cache_dir) / '{}-policy-{}.npz'.format(
+            compiled.name, fingerprint[:12])
+        if cache_file.is_file():
+            policy = SolvedPolicy.load(cache_file, compiled)
+            if policy.fingerprint == fingerprint:
+                if verbose:
+                    print('Loaded {} from {}'.format(policy, cache_file))
+                return policy
+
+    policy = solve(compiled, human_model, gamma=gamma, tol=tol,
+                   max_iterations=max_iterations, verbose=verbose)
+    policy.fingerprint = fingerprint
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        policy.save(cache_file)
+
+    return policy
+
+
+def solve(compiled, human_model, gamma=0.95, tol=1e-6,
+          max_iterations=10000, verbose=False):
+    """Compute the robot's optimal policy in a compiled world by value
+    iteration, see solve_world().
+
+    The robot decides at the states where it is an acting agent, and the
+    human at the states where only they act, by the human model. The
+    Bellman backups are vectorized over the feasible transitions.
+
+    Returns:
+        SolvedPolicy: the solved policy.
+    """
+    # The feasible transitions as (state, action) pairs, sorted by state.
+    num_states = compiled.num_states
+    rows, cols = np.nonzero(compiled.feasible)
+
+    # Keep the deciding agent's actions at each state.
+    is_robot = compiled.has_agent(Agent.ROBOT)
+    is_human = compiled.has_agent(Agent.HUMAN) & ~is_robot
+    action_agents = np.array([a.agent for a in compiled.actions])
+    is_robot_edge = is_robot[rows] & (action_agents[cols] == Agent.ROBOT)
+    is_human_edge = is_human[rows] & (action_agents[cols] == Agent.HUMAN)
+
+    robot_rows, robot_cols = rows[is_robot_edge], cols[is_robot_edge]
+    robot_states, robot_starts = np.unique(robot_rows, return_index=True)
+    human_rows, human_cols = rows[is_human_edge], cols[is_human_edge]
+    human_probs = _get_human_probabilities(
+        compiled, human_model, human_rows, human_cols)
+
+    rewards = get_solver_rewards(compiled)
+    robot_next = compiled.transitions[robot_rows, robot_cols]
+    robot_rewards = rewards[robot_rows, robot_cols]
+    human_next = compiled.transitions[human_rows, human_cols]
+    human_rewards = rewards[human_rows, human_cols]
+
+    values = np.zeros(num_states)
+    for i in range(max_iterations):
+        next_values = np.bincount(
+            human_rows, minlength=num_states,
+            weights=human_probs * (human_rewards + gamma * values[human_next]))
+        if len(robot_states) > 0:
+            next_values[robot_states] = np.maximum.reduceat(
+                robot_rewards + gamma * values[robot_next], robot_starts)
+        delta = np.abs(next_values - values).max(initial=0)
+        values = next_values
+        if delta < tol:
+            break
+    else:
+        print('Value iteration did not converge in {} iterations:'
+              ' the last change was {}.'.format(max_iterations, delta))
+    if verbose:
+        print('Value iteration converged in {} iterations.'.format(i + 1))
+
+    # The robot's action at a state is the first of its best actions.
+    policy = np.full(num_states, -1, dtype=np.int32)
+    if len(robot_states) > 0:
+        q_values = robot_rewards + gamma * values[robot_next]
+        is_best = q_values >= values[robot_rows] - tol
+        best_states, first = np.unique(
+            robot_rows[is_best], return_index=True)
+        policy[best_states] = robot_cols[is_best][first]
+
+    return SolvedPolicy(compiled, values, policy, gamma=gamma, tol=tol,
+                        rewards=rewards)
+
+
+def get_solver_rewards(compiled):
+    """Get the rewards of a compiled world to solve it by.
+
+    These are the world's rewards, except for a submission that ends the
+    activity by running out of the attempts, without an MST. The reward
+    model rewards it as the completion of the activity; here it is
+    rewarded as a failed submission, by the cost of the selection.
+    Otherwise, the optimal policy would be to submit at every attempt.
+
+    Returns:
+        np.ndarray: the reward by (state id, action id).
+    """
+    rewards = compiled.rewards.copy()
+    is_submit = np.array(
+        [isinstance(a, SubmitAction) for a in compiled.actions], dtype=bool)
+    rows, cols = np.nonzero(compiled.feasible & is_submit)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        state = compiled.get_state(i)
+        if state.max_attempts is None or state.network.is_mst():
+            continue
+        if compiled.get_state(int(compiled.transitions[i, j])).is_terminal:
+            rewards[i, j] = state.network.get_cost()
+    return rewards
+
+
+class SolvedPolicy(object):
+    """A class to represent the robot's optimal policy in a compiled world,
+    to look the robot's action at a state up in constant time.
+
+    Attributes:
+        compiled (CompiledWorld):
+            the compiled world
+        values (np.ndarray):
+            the optimal value of each state by its id
+        policy (np.ndarray):
+            the id of the robot's action at each state by its id, or -1 at
+            the states where the robot does not act
+        gamma (float):
+            the discount factor
+        tol (float):
+            the tolerance of the values, e.g. to tell the equally good
+            actions apart
+        rewards (np.ndarray):
+            the rewards solved by, see get_solver_rewards()
+        fingerprint (str):
+            a digest of the compiled world and the solver's parameters
+    """
+
+    def __init__(self, compiled, values, policy, gamma=0.95, tol=1e-6,
+                 fingerprint=None, rewards=None):
+        if rewards is None:
+            rewards = get_solver_rewards(compiled)
+
+        self.compiled = compiled
+        self.values = values
+        self.policy = policy
+        self.gamma = gamma
+        self.tol = tol
+        self.fingerprint = fingerprint
+        self.rewards = rewards
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'SolvedPolicy({}: V(s_0)={:g}, gamma={:g})'.format(
+            self.compiled.name, self.values[0], self.gamma)
+
+    def get_state_id(self, state):
+        """Get the id of a state, or None if not in the compiled states."""
+        return self.compiled.get_state_id(state)
+
+    def get_action(self, state_id):
+        """Get the robot's action at a state, or None if it does not act."""
+        if state_id is None or self.policy[state_id] < 0:
+            return None
+        return self.compiled.actions[self.policy[state_id]]
+
+    def get_q_values(self, state_id):
+        """Get the values of the robot's feasible actions at a state.
+
+        Returns:
+            dict: the value of each action of the robot.
+        """
+        if state_id is None or self.policy[state_id] < 0:
+            return dict()
+        compiled = self.compiled
+        ids = compiled.get_feasible_actions(state_id)
+        q_values = self.rewards[state_id, ids] \
+            + self.gamma * self.values[compiled.transitions[state_id, ids]]
+        return {compiled.actions[i]: q
+                for i, q in zip(ids.tolist(), q_values.tolist())
+                if compiled.actions[i].agent == Agent.ROBOT}
+
+    def get_best_actions(self, state_id, q_values=None):
+        """Get the robot's equally good best actions at a state.
+
+        Args:
+            state_id (int): The id of the state.
+            q_values (dict, optional): The values of the robot's actions
+                at the state if at hand, see get_q_values().
+        """
+        if q_values is None:
+            q_values = self.get_q_values(state_id)
+        if len(q_values) == 0:
+            return set()
+        value = max(q_values.values())
+        return {a for a, q in q_values.items() if q >= value - self.tol}
+
+    def save(self, file):
+        """Save the policy to a (compressed numpy .npz) file."""
+        np.savez_compressed(
+            file, fingerprint=np.array(self.fingerprint or ''),
+            values=self.values, policy=self.policy,
+            gamma=np.array(self.gamma), tol=np.array(self.tol))
+
+    @classmethod
+    def load(cls, file, compiled):
+        """Load the policy of a compiled world from a file, see save()."""
+        with np.load(file) as data:
+            return cls(compiled, data['values'], data['policy'],
+                       gamma=float(data['gamma']), tol=float(data['tol']),
+                       fingerprint=str(data['fingerprint']) or None)
+
+
+def _get_human_probabilities(compiled, human_model, rows, cols):
+    """Get the probabilities of the human's feasible actions, by
+    HumanModel.get_distribution() vectorized over the states."""
+    types = sorted({a.__class__ for a in compiled.actions},
+                   key=lambda t: t.__name__)
+    type_ids = {t: i for i, t in enumerate(types)}
+    action_types = np.array(
+        [type_ids[a.__class__] for a in compiled.actions], dtype=np.int64)
+    type_weights = np.array(
+        [human_model.weights.get(t, 0) for t in types], dtype=float)
+
+    # The number of the feasible actions of each type at each state.
+    num_states, num_types = compiled.num_states, len(types)
+    edge_types = action_types[cols]
+    pairs = rows * num_types + edge_types
+    counts = np.bincount(pairs, minlength=num_states * num_types)
+
+    # The weights of the actions' types, shared among the actions of a type.
+    probs = type_weights[edge_types] / counts[pairs]
+    totals = np.bincount(rows, weights=probs, minlength=num_states)
+    sizes = np.bincount(rows, minlength=num_states)
+
+    # Normalize, or fall back to equally likely actions.
+    totals, sizes = totals[rows], sizes[rows]
+    is_weighted = totals > 0
+    return np.where(is_weighted, probs / np.where(is_weighted, totals, 1),
+                    1 / np.maximum(sizes, 1))
@@ -0,0 +1,436 @@
+import hashlib
+import pathlib as pl
+import threading
+
+import numpy as np
+
+from .agent import Agent
+from .domain import action as action_module
+from .domain.action import SetPauseAction, get_action
+from .world import create_world
+
+
+# The version of the compiled tables' format, to invalidate older caches.
+FORMAT_VERSION = 1
+
+# The default directory to cache the compiled worlds in.
+DEFAULT_CACHE_DIR = pl.Path.home() / '.cache' / 'justhink_world'
+
+# The default maximum number of states to enumerate, e.g. the individual
+# worlds with 12 edges have ~10^4 states, while those with 20 edges have
+# ~10^6 connected selections alone.
+DEFAULT_MAX_STATES = 200000
+
+# The agents, by their bits in the compiled agent sets.
+AGENTS = (Agent.HUMAN, Agent.ROBOT, Agent.MANAGER)
+
+# The names of the columns that encode the compiled states.
+COLUMNS = ('masks', 'suggested_edges', 'agents', 'attempt_nos',
+           'max_attempts', 'step_nos', 'flags')
+
+
+def compile_world(world, agents=None, max_states=DEFAULT_MAX_STATES,
+                  cache_dir=DEFAULT_CACHE_DIR, use_cache=True,
+                  verbose=False):
+    """Compile the reachable state space of a world into tables.
+
+    The states reachable from the initial state of the world are
+    enumerated by the world's own policy model (for the feasible actions),
+    transition model and reward model. The states are identified by their
+    keys, without the step number unless the transitions depend on it.
+
+    Args:
+        world (str or World): The world, or its name for create_world(),
+            e.g. 'pretest-1'.
+        agents (set, optional): The agents to take the actions of,
+            e.g. {Agent.HUMAN, Agent.ROBOT} to leave the manager's
+            (pausing, resetting) actions out, or None for all agents.
+        max_states (int, optional): The maximum number of states to
+            enumerate (default DEFAULT_MAX_STATES).
+        cache_dir (str or pathlib.Path, optional): The directory to cache
+            the tables in (default DEFAULT_CACHE_DIR).
+        use_cache (bool, optional): Whether to load the tables from and
+            save them to the cache (default True).
+        verbose (bool, optional): Whether to print progress.
+
+    Returns:
+        CompiledWorld: the compiled world.
+
+    Raises:
+        ValueError: if there are more than max_states reachable states.
+    """
+    if isinstance(world, str):
+        name = world
+        world = create_world(name)
+    else:
+        name = world.name
+    if agents is not None:
+        agents = frozenset(agents)
+
+    cache_file = None
+    fingerprint = _get_fingerprint(world, agents)
+    if use_cache:
+        cache_file = pl.Path(cache_dir) / '{}-{}.npz'.format(
+            name, fingerprint[:12])
+        if cache_file.is_file():
+            compiled = CompiledWorld.load(cache_file, world, name=name)
+            if compiled.fingerprint == fingerprint:
+                if verbose:
+                    print('Loaded {} from {}'.format(compiled, cache_file))
+                return compiled
+
+    compiled = CompiledWorld.from_world(
+        world, name=name, agents=agents, max_states=max_states)
+    compiled.fingerprint = fingerprint
+    if verbose:
+        print('Compiled {}'.format(compiled))
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        compiled.save(cache_file)
+
+    return compiled
+
+
+class CompiledWorld(object):
+    """A class to represent the reachable state space of a world as dense,
+    integer-indexed tables.
+
+    States and actions are numbered from 0, in the order of discovery
+    (by breadth-first search from the initial state 0) and in the sorted
+    order respectively.
+
+    The states are kept encoded, as columns of their edge bitmasks,
+    suggested edges (by node numbers), agents (as bitmasks), attempt
+    numbers, step numbers and flags, and are rebuilt on demand.
+
+    Attributes:
+        name (str):
+            the name of the world
+        actions (list):
+            the actions (Action) by their ids
+        transitions (np.ndarray):
+            the next state id by (state id, action id), or -1 if the action
+            is not feasible at the state
+        rewards (np.ndarray):
+            the reward by (state id, action id)
+        feasible (np.ndarray):
+            whether an action is feasible at a state, by (state id,
+            action id)
+        columns (dict):
+            the columns of the encoded states by their names, e.g. 'masks'
+        fingerprint (str):
+            a digest of the world and the compilation's parameters
+    """
+
+    def __init__(self, name, init_state, columns, actions, transitions,
+                 rewards, step_invariant=True, fingerprint=None,
+                 states=None):
+        self.name = name
+        self.actions = actions
+        self.transitions = transitions
+        self.rewards = rewards
+        self.feasible = transitions >= 0
+        self.columns = columns
+        self.fingerprint = fingerprint
+
+        self._init_state = init_state
+        self._network = init_state.network.cleared()
+        self._nodes = _get_nodes(init_state.network)
+        self._step_invariant = step_invariant
+        if states is None:
+            states = [None] * len(columns['masks'])
+        self._states = states
+        self._state_ids = None
+        self._state_ids_lock = threading.Lock()
+        self._action_ids = {a: i for i, a in enumerate(actions)}
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'CompiledWorld({}: |S|={}, |A|={}, |T|={})'.format(
+            self.name, self.num_states, self.num_actions,
+            int(self.feasible.sum()))
+
+    @property
+    def num_states(self):
+        """int: the number of states."""
+        return len(self._states)
+
+    @property
+    def num_actions(self):
+        """int: the number of actions."""
+        return len(self.actions)
+
+    @property
+    def states(self):
+        """list: the states (EnvState) by their ids, all rebuilt."""
+        return [self.get_state(i) for i in range(self.num_states)]
+
+    @classmethod
+    def from_world(cls, world, name=None, agents=None,
+                   max_states=DEFAULT_MAX_STATES):
+        """Enumerate the reachable states of a world, see compile_world()."""
+        if name is None:
+            name = world.name
+        transition_model = world.env.transition_model
+        reward_model = world.env.reward_model
+        policy_model = world.agent.policy_model
+        step_invariant = not transition_model.depends_on_step_no
+
+        init_state = world.history[0]
+        states = [init_state]
+        state_ids = {_get_state_key(init_state, step_invariant): 0}
+        rows = list()
+        for state in states:
+            row = list()
+            for action in policy_model.get_all_actions(state=state):
+                if agents is not None and action.agent not in agents:
+                    continue
+                next_state = transition_model.sample(state, action)
+                key = _get_state_key(next_state, step_invariant)
+                j = state_ids.get(key)
+                if j is None:
+                    if len(states) >= max_states:
+                        print('World {} has more than {} states.'.format(
+                            name, max_states))
+                        raise ValueError
+                    j = state_ids[key] = len(states)
+                    states.append(next_state)
+                reward = reward_model.sample(state, action, next_state)
+                row.append((action, j, reward))
+            rows.append(row)
+
+        actions = sorted({a for row in rows for a, _, _ in row})
+        action_ids = {a: i for i, a in enumerate(actions)}
+        transitions = np.full((len(states), len(actions)), -1, dtype=np.int32)
+        rewards = np.zeros((len(states), len(actions)))
+        for i, row in enumerate(rows):
+            for action, j, reward in row:
+                transitions[i, action_ids[action]] = j
+                rewards[i, action_ids[action]] = reward
+
+        columns = _encode_states(states, _get_nodes(init_state.network))
+        compiled = cls(name, init_state, columns, actions, transitions,
+                       rewards, step_invariant=step_invariant, states=states)
+        compiled._state_ids = state_ids
+        return compiled
+
+    def get_state(self, state_id):
+        """Get a state by its id, rebuilding it if not at hand."""
+        state = self._states[state_id]
+        if state is None:
+            c = {k: v[state_id].tolist() for k, v in self.columns.items()}
+            flags = c['flags']
+            state = self._init_state.replace(
+                network=self._network.replace(
+                    selected_mask=c['masks'],
+                    suggested_edge=self._decode_edge(c['suggested_edges'])),
+                agents=_decode_agents(c['agents']),
+                attempt_no=c['attempt_nos'],
+                max_attempts=_decode_max_attempts(c['max_attempts']),
+                step_no=c['step_nos'],
+                is_submitting=bool(flags & 1),
+                is_paused=bool(flags >> 1 & 1),
+                is_terminal=bool(flags >> 2 & 1),
+                is_highlighted=bool(flags >> 3 & 1))
+            self._states[state_id] = state
+        return state
+
+    def get_state_id(self, state):
+        """Get the id of a state, or None if not in the compiled states."""
+        if self._state_ids is None:
+            # Built once, also if looked up by threads, e.g. by planners.
+            with self._state_ids_lock:
+                if self._state_ids is None:
+                    self._state_ids = self._build_state_ids()
+        return self._state_ids.get(
+            _get_state_key(state, self._step_invariant))
+
+    def get_action_id(self, action):
+        """Get the id of an action, or None if not in the compiled actions."""
+        return self._action_ids.get(action)
+
+    def has_agent(self, agent):
+        """Check if an agent can act at each state.
+
+        Returns:
+            np.ndarray: whether the agent is in the agents, by state id.
+        """
+        return (self.columns['agents'] >> AGENTS.index(agent) & 1) \
+            .astype(bool)
+
+    def is_feasible(self, state_id, action_id):
+        """Check if an action is feasible at a state, by their ids."""
+        return bool(self.feasible[state_id, action_id])
+
+    def get_feasible_actions(self, state_id):
+        """Get the ids of the feasible actions at a state."""
+        return np.flatnonzero(self.feasible[state_id])
+
+    def step(self, state_id, action_id):
+        """Take an action at a state, by their ids.
+
+        Returns:
+            tuple: the next state's id and the reward.
+
+        Raises:
+            ValueError: if the action is not feasible at the state.
+        """
+        next_state_id = self.transitions[state_id, action_id]
+        if next_state_id < 0:
+            print('Action {} is not feasible at state {}.'.format(
+                self.actions[action_id], self.get_state(state_id)))
+            raise ValueError
+        return int(next_state_id), float(self.rewards[state_id, action_id])
+
+    def save(self, file):
+        """Save the tables to a (compressed numpy .npz) file."""
+        node_ids = {u: i for i, u in enumerate(self._nodes)}
+
+        def encode_edge(edge):
+            if edge is None:
+                return (-1, -1)
+            return (node_ids[edge[0]], node_ids[edge[1]])
+
+        np.savez_compressed(
+            file,
+            fingerprint=np.array(self.fingerprint or ''),
+            step_invariant=np.array(self._step_invariant),
+            transitions=self.transitions,
+            rewards=self.rewards,
+            action_types=np.array(
+                [a.__class__.__name__ for a in self.actions]),
+            action_agents=np.array([a.agent for a in self.actions]),
+            action_edges=np.array(
+                [encode_edge(getattr(a, 'edge', None)) for a in self.actions],
+                dtype=np.int32).reshape(-1, 2),
+            action_values=np.array(
+                [a.is_paused if isinstance(a, SetPauseAction) else -1
+                 for a in self.actions], dtype=np.int8),
+            **self.columns)
+
+    @classmethod
+    def load(cls, file, world, name=None):
+        """Load the tables of a world from a file, see save()."""
+        if name is None:
+            name = world.name
+        with np.load(file) as data:
+            data = {k: data[k] for k in data.files}
+
+        init_state = world.history[0]
+        nodes = _get_nodes(init_state.network)
+
+        actions = list()
+        for type_name, agent, edge, value in zip(
+                data['action_types'], data['action_agents'],
+                data['action_edges'].tolist(), data['action_values']):
+            action_type = getattr(action_module, str(type_name))
+            if action_type is SetPauseAction:
+                args = (bool(value),)
+            elif edge[0] >= 0:
+                args = ((nodes[edge[0]], nodes[edge[1]]),)
+            else:
+                args = ()
+            actions.append(get_action(action_type, *args, agent=str(agent)))
+
+        columns = {k: data[k] for k in COLUMNS}
+        return cls(name, init_state, columns, actions, data['transitions'],
+                   data['rewards'],
+                   step_invariant=bool(data['step_invariant']),
+                   fingerprint=str(data['fingerprint']) or None)
+
+    def _decode_edge(self, edge):
+        if edge[0] < 0:
+            return None
+        return (self._nodes[edge[0]], self._nodes[edge[1]])
+
+    def _build_state_ids(self):
+        """Map the keys of the states to their ids, from the columns."""
+        index = self._network.index
+        edges = [self._decode_edge(e)
+                 for e in self.columns['suggested_edges'].tolist()]
+        agents = [_decode_agents(a) for a in range(1 << len(AGENTS))]
+        max_attempts = [_decode_max_attempts(m)
+                        for m in self.columns['max_attempts'].tolist()]
+        keys = zip(
+            self.columns['masks'].tolist(), edges,
+            [agents[a] for a in self.columns['agents'].tolist()],
+            self.columns['attempt_nos'].tolist(), max_attempts,
+            self.columns['step_nos'].tolist(),
+            self.columns['flags'].tolist())
+        if self._step_invariant:
+            return {(index, m, e, a, n, x, f): i
+                    for i, (m, e, a, n, x, _, f) in enumerate(keys)}
+        return {(index, m, e, a, n, x, s, f): i
+                for i, (m, e, a, n, x, s, f) in enumerate(keys)}
+
+
+def _get_state_key(state, step_invariant=True):
+    """Get the key of a state, without the step number if invariant."""
+    if step_invariant:
+        return state.network.key + (
+            state.agents, state.attempt_no, state.max_attempts, state.flags)
+    return state.key
+
+
+def _encode_states(states, nodes):
+    """Encode the states as columns of integers, see CompiledWorld."""
+    if len(states[0].network.index.edges) > 64:
+        print('Cannot encode a network with more than 64 edges.')
+        raise ValueError
+
+    node_ids = {u: i for i, u in enumerate(nodes)}
+
+    def encode_edge(edge):
+        if edge is None:
+            return (-1, -1)
+        return (node_ids[edge[0]], node_ids[edge[1]])
+
+    return {
+        'masks': np.array(
+            [s.network.selected_mask for s in states], dtype=np.uint64),
+        'suggested_edges': np.array(
+            [encode_edge(s.network.suggested_edge) for s in states],
+            dtype=np.int32).reshape(-1, 2),
+        'agents': np.array(
+            [sum(1 << i for i, a in enumerate(AGENTS) if a in s.agents)
+             for s in states], dtype=np.uint8),
+        'attempt_nos': np.array(
+            [s.attempt_no for s in states], dtype=np.int32),
+        'max_attempts': np.array(
+            [-1 if s.max_attempts is None else s.max_attempts
+             for s in states], dtype=np.int32),
+        'step_nos': np.array([s.step_no for s in states], dtype=np.int32),
+        'flags': np.array([s.flags for s in states], dtype=np.uint8),
+    }
+
+
+def _decode_agents(agents):
+    return frozenset(a for i, a in enumerate(AGENTS) if agents >> i & 1)
+
+
+def _decode_max_attempts(max_attempts):
+    return None if max_attempts < 0 else max_attempts
+
+
+def _get_nodes(network):
+    """Get the nodes of a network in a stable order, to encode them."""
+    return sorted(network.graph.nodes(), key=repr)
+
+
+def _get_fingerprint(world, agents):
+    """Get a stable digest of a world and the compilation's parameters."""
+    state = world.history[0]
+    index = state.network.index
+    description = repr((
+        FORMAT_VERSION, world.__class__.__name__,
+        type(world.env.transition_model).__name__,
+        type(world.agent.policy_model).__name__,
+        [repr(u) for u in _get_nodes(state.network)],
+        list(zip(index.edges, index.costs)),
+        sorted(state.agents), state.attempt_no, state.max_attempts,
+        state.step_no, state.flags,
+        None if agents is None else sorted(agents)))
+    return hashlib.sha1(description.encode()).hexdigest()
@@ -1,3 +1,5 @@
+import copyreg
+
 import pomdp_py
 
 from ..agent.agent import Agent
@@ -9,6 +11,14 @@ class Action(pomdp_py.Action):
 
     The proper actions should subclass this.
 
+    Note:
+        An action is treated as an immutable value: its hash and its string
+        representation (e.g. for sorting) are computed once. Use get_action()
+        to get a shared instance from the action pool instead of creating a
+        new one, e.g. when enumerating the feasible actions at every step.
+        Actions have __slots__ for a compact footprint: a subclass
+        declares its own attributes in __slots__ (e.g. ('edge',)).
+
     Attributes:
         name (str):
             the string representation of the action built by
@@ -18,14 +28,46 @@ class Action(pomdp_py.Action):
             i.e. agent = Agent.HUMAN rather than agent = Agent.HUMAN()
     """
 
+    # The name is an attribute of the pomdp_py base class.
+    __slots__ = ('agent', '_hash', '_repr')
+
+    # Whether get_action() shares the instances of the action type.
+    is_pooled = True
+
     def __init__(self, name, agent):
         assert isinstance(name, str)
 
         self.name = name
         self.agent = agent
+        self._hash = None
+        self._repr = None
+
+    def __reduce__(self):
+        return (copyreg.__newobj__, (self.__class__,), self.__getstate__())
+
+    def __getstate__(self):
+        state = {'name': self.name}
+        for cls in self.__class__.__mro__:
+            for k in cls.__dict__.get('__slots__', ()):
+                if k not in ('_hash', '_repr'):
+                    state[k] = getattr(self, k)
+        return state
+
+    def __setstate__(self, state):
+        # Actions pickled by the pomdp_py base class, e.g. in the logs,
+        # come as a tuple of the name and the attribute dictionary.
+        if isinstance(state, tuple):
+            name, attributes = state
+            state = dict(attributes, name=name)
+        self._hash = None
+        self._repr = None
+        for k, v in state.items():
+            setattr(self, k, v)
 
     def __hash__(self):
-        return hash(self.name)
+        if self._hash is None:
+            self._hash = hash((self.name, self.agent))
+        return self._hash
 
     def __eq__(self, other):
         """"Check if two actions are equivalent.
@@ -33,6 +75,8 @@ class Action(pomdp_py.Action):
         They are the same if their string representations,
         agents and types are equal.
         """
+        if self is other:
+            return True
         return isinstance(other, Action) \
             and self.name == other.name \
             and self.agent == other.agent
@@ -44,10 +88,14 @@ class Action(pomdp_py.Action):
         return self.__repr__()
 
     def __repr__(self):
-        return 'Action({},{})'.format(self.name, self.agent)
+        if self._repr is None:
+            self._repr = 'Action({},{})'.format(self.name, self.agent)
+        return self._repr
 
 
 class ResetAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.MANAGER):
         super().__init__('reset', agent)
 
@@ -64,6 +112,11 @@ class SetStateAction(Action):
             the agent of the action (default Agent.HUMAN)
     """
 
+    __slots__ = ('state',)
+
+    # Not pooled, not to keep every state that was set alive.
+    is_pooled = False
+
     def __init__(self, state, agent=Agent.MANAGER):
         assert isinstance(state, EnvState)
 
@@ -75,6 +128,8 @@ class SetStateAction(Action):
 
 
 class SetPauseAction(Action):
+    __slots__ = ('is_paused',)
+
     def __init__(self, is_paused, agent=Agent.HUMAN):
         assert isinstance(is_paused, bool)
         self.is_paused = is_paused
@@ -83,6 +138,8 @@ class SetPauseAction(Action):
 
 
 class SuggestPickAction(Action):
+    __slots__ = ('edge',)
+
     def __init__(self, edge, agent=Agent.HUMAN):
         self.edge = edge
         name = 'suggest-pick({})'.format(format_edge(self.edge))
@@ -90,6 +147,8 @@ class SuggestPickAction(Action):
 
 
 class PickAction(Action):
+    __slots__ = ('edge',)
+
     def __init__(self, edge, agent=Agent.HUMAN):
         self.edge = edge
         name = 'pick({})'.format(format_edge(self.edge))
@@ -97,6 +156,8 @@ class PickAction(Action):
 
 
 class UnpickAction(Action):
+    __slots__ = ('edge',)
+
     def __init__(self, edge, agent=Agent.HUMAN):
         self.edge = edge
         name = 'unpick({})'.format(format_edge(self.edge))
@@ -104,40 +165,106 @@ class UnpickAction(Action):
 
 
 class ObserveAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('observe', agent)
 
 
 class AgreeAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('agree', agent)
 
 
 class DisagreeAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('disagree', agent)
 
 
 class ClearAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('clear', agent)
 
 
 class AttemptSubmitAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('attempt-submit', agent)
 
 
 class ContinueAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('continue', agent)
 
 
 class SubmitAction(Action):
+    __slots__ = ()
+
     def __init__(self, agent=Agent.HUMAN):
         super().__init__('submit', agent)
 
 
+# The shared action instances, by their types and arguments.
+_action_pool = dict()
+
+
+def get_action(action_type, *args, agent=None):
+    """Get a shared instance of an action from the action pool.
+
+    The instance is created at the first request, and handed out for the
+    same type, arguments and agent afterwards. Only for the actions with
+    hashable arguments, e.g. get_action(PickAction, (1, 2), agent=agent).
+    The action types that are not pooled (e.g. SetStateAction, that
+    carries a state) are created anew at each request.
+
+    Args:
+        action_type (type): The class of the action, e.g. PickAction.
+        *args: The arguments of the action other than its agent,
+            e.g. an edge.
+        agent (str, optional): The agent of the action, or the default
+            agent of the action type if None (default None).
+
+    Returns:
+        Action: the shared action instance.
+    """
+    key = (action_type, args, agent)
+    action = _action_pool.get(key)
+    if action is None:
+        if agent is None:
+            action = action_type(*args)
+        else:
+            action = action_type(*args, agent=agent)
+        if action_type.is_pooled:
+            _action_pool[key] = action
+    return action
+
+
+def get_agent_action(action, agent):
+    """Get the action of the same type and arguments by another agent, from
+    the action pool (see get_action()), e.g. to take a planned action in a
+    role.
+
+    The arguments are the attributes in the __slots__ of the action's type,
+    in the order of its constructor's arguments.
+
+    Returns:
+        Action: the shared action instance.
+    """
+    action_type = action.__class__
+    args = tuple(getattr(action, k)
+                 for k in action_type.__dict__.get('__slots__', ()))
+    return get_action(action_type, *args, agent=agent)
+
+
 def format_edge(edge):
     try:
         s = (int(edge[0]), int(edge[1]))
@@ -0,0 +1,224 @@
+import collections
+
+
+class StateHistory(object):
+    """A class to represent the history of a world as a list-like sequence
+    of states and actions, i.e. [state_1, action_1, state_2, action_2, ...].
+
+    Instead of keeping every state, it keeps the actions, and a checkpoint
+    state every checkpoint_interval states. An intermediate state is
+    reconstructed on demand by replaying the actions from the nearest
+    earlier checkpoint with the transition model, i.e. with at most
+    checkpoint_interval - 1 transitions. The reconstructed states are kept
+    in a cache of the recently accessed states, e.g. for navigating back
+    and forth around the current state in a window.
+
+    The history gives back the states as they were added. If replaying an
+    action gives the next state but for some of its attributes other than
+    the network (e.g. the step numbers in a log), these attributes are kept
+    with the action, and replaced in the replayed state. A state whose
+    network is not reproduced by replaying its action is kept as a
+    checkpoint. A transition that was just made by the transition model
+    (e.g. in World.act()) is added by append_transition() instead, without
+    replaying it to check.
+
+    Attributes:
+        transition_model (TransitionModel):
+            the model to replay the actions with
+        checkpoint_interval (int, optional):
+            the number of states between two periodic checkpoints
+            (default 16)
+        cache_size (int, optional):
+            the maximum number of reconstructed states to cache
+            (default 32)
+    """
+
+    def __init__(self, items, transition_model, checkpoint_interval=16,
+                 cache_size=32):
+        if checkpoint_interval < 1:
+            print('Checkpoint interval must be positive: {}'.format(
+                checkpoint_interval))
+            raise ValueError
+
+        self.transition_model = transition_model
+        self.checkpoint_interval = checkpoint_interval
+        self.cache_size = cache_size
+
+        self._num_states = 0
+        self._actions = list()
+        self._checkpoints = dict()
+        self._changes = dict()
+        self._cache = collections.OrderedDict()
+        self._last_state = None
+
+        self.extend(items)
+
+    def __len__(self):
+        return self._num_states + len(self._actions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('history index out of range')
+
+        if index % 2 == 0:
+            return self.get_state(index // 2)
+        else:
+            return self._actions[index // 2]
+
+    def __iter__(self):
+        state = None
+        for k in range(self._num_states):
+            if k > 0:
+                action = self._actions[k - 1]
+                yield action
+            if k in self._checkpoints:
+                state = self._checkpoints[k]
+            elif k == self._num_states - 1:
+                state = self._last_state
+            else:
+                state = self._replay(k, state)
+            yield state
+        # An action that is not followed by a state yet.
+        if len(self._actions) == self._num_states > 0:
+            yield self._actions[-1]
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return repr(list(self))
+
+    @property
+    def num_states(self):
+        """int: the number of states in the history."""
+        return self._num_states
+
+    @property
+    def num_checkpoints(self):
+        """int: the number of states kept as checkpoints."""
+        return len(self._checkpoints)
+
+    def append(self, item):
+        """Add a state or an action, in turns, starting with a state."""
+        if len(self) % 2 == 0:
+            self._add_state(item)
+        else:
+            self._actions.append(item)
+
+    def append_transition(self, action, next_state):
+        """Add an action and the state that the transition model gives by
+        the action on the last state, trusted without replaying it."""
+        if len(self) % 2 == 0:
+            print('Cannot add a transition after an action.')
+            raise ValueError
+
+        self._actions.append(action)
+        self._add_state(next_state, is_replayed=True)
+
+    def extend(self, items):
+        """Add the states and actions, in turns, e.g. [action, state]."""
+        for item in items:
+            self.append(item)
+
+    def truncate(self, length):
+        """Keep only the first length items, ending with a state."""
+        if length % 2 == 0 or not 0 < length <= len(self):
+            print('Cannot truncate a history of length {} to {}.'.format(
+                len(self), length))
+            raise ValueError
+
+        k = length // 2
+        self._last_state = self.get_state(k)
+        self._num_states = k + 1
+        del self._actions[k:]
+        for cache in [self._checkpoints, self._changes, self._cache]:
+            for i in [i for i in cache if i > k]:
+                del cache[i]
+
+    def get_state(self, k):
+        """Get the k-th state, counting from 0.
+
+        Returns:
+            EnvState: the state, reconstructed if not a checkpoint.
+        """
+        if k == self._num_states - 1:
+            return self._last_state
+        if k in self._checkpoints:
+            return self._checkpoints[k]
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            return self._cache[k]
+
+        # Find the nearest earlier state that is kept.
+        j = k - 1
+        while j not in self._checkpoints and j not in self._cache:
+            j -= 1
+        state = self._checkpoints.get(j, self._cache.get(j))
+
+        # Replay the actions from there, caching the states on the way.
+        for i in range(j + 1, k + 1):
+            state = self._replay(i, state)
+            self._cache_state(i, state)
+        return state
+
+    def _replay(self, k, state):
+        """Get the k-th state by replaying its action on the previous
+        state."""
+        state = self.transition_model.sample(state, self._actions[k - 1])
+        changes = self._changes.get(k)
+        if changes is not None:
+            state = state.replace(**changes)
+        return state
+
+    def _add_state(self, state, is_replayed=False):
+        k = self._num_states
+        if k % self.checkpoint_interval == 0:
+            self._checkpoints[k] = state
+        elif not is_replayed:
+            changes = self._get_replay_changes(state)
+            if changes is None:
+                self._checkpoints[k] = state
+            elif len(changes) > 0:
+                self._changes[k] = changes
+        # Keep the previous state at hand, e.g. to step back to it.
+        if k > 0 and k - 1 not in self._checkpoints:
+            self._cache_state(k - 1, self._last_state)
+        self._last_state = state
+        self._num_states += 1
+
+    def _get_replay_changes(self, state):
+        """Get the attributes of a state that replaying the last action on
+        the last state does not give.
+
+        Returns:
+            dict: the attributes to replace in the replayed state by their
+                names, or None if the replay does not give the network.
+        """
+        try:
+            replayed = self.transition_model.sample(
+                self._last_state, self._actions[-1])
+        except Exception:
+            return None
+        if replayed == state:
+            return dict()
+        if type(replayed) is not type(state) \
+                or not hasattr(state, '_fields'):
+            return None
+
+        changes = {k: getattr(state, k) for k in state._fields
+                   if k != 'network' and getattr(replayed, k) != getattr(
+                       state, k)}
+        if replayed.replace(**changes) != state:
+            return None
+        return changes
+
+    def _cache_state(self, k, state):
+        self._cache[k] = state
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -1,3 +1,5 @@
+import copyreg
+
 import pomdp_py
 
 
@@ -5,9 +7,17 @@ class Observation(pomdp_py.Observation):
     """A class to represent a fully-observable observation of the
     current state."""
 
+    __slots__ = ('state',)
+
     def __init__(self, state):
         self.state = state
 
+    def __reduce__(self):
+        return (copyreg.__newobj__, (self.__class__,), {'state': self.state})
+
+    def __setstate__(self, state):
+        self.state = state['state']
+
     def __hash__(self):
         return hash(self.state)
 
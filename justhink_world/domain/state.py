@@ -1,10 +1,12 @@
 import copy
+import copyreg
+import weakref
 
 import pomdp_py
 import networkx as nx
 
-from ..tools.network import find_mst, is_subgraph_spanning, \
-    compute_total_cost, compute_subgraph_cost
+from ..tools.network import find_mst, compute_total_cost, \
+    get_network_index, get_node_name_index, UnionFind
 
 
 class EnvState(pomdp_py.State):
@@ -16,6 +18,11 @@ class EnvState(pomdp_py.State):
     It is manipulated via state transitions by a transition model.
     It is used to generate the available actions by a policy model.
 
+    Note:
+        A state is treated as an immutable value: a transition creates
+        a new state via replace(), sharing the unchanged attributes (e.g.
+        the network) with the previous state instead of copying them.
+
     Attributes:
         network (NetworkState):
             the state of the network, that contains the background graph,
@@ -52,6 +59,11 @@ class EnvState(pomdp_py.State):
            to emphasise on the cost in the tutorial (default False)
     """
 
+    # The attributes of a state, to copy and pickle.
+    _fields = ('network', 'agents', 'attempt_no', 'max_attempts', 'step_no',
+               'is_submitting', 'is_paused', 'is_terminal', 'is_highlighted')
+    __slots__ = _fields + ('__weakref__',)
+
     def __init__(
             self, network, agents,
             attempt_no=1,
@@ -72,34 +84,78 @@ class EnvState(pomdp_py.State):
         self.is_highlighted = is_highlighted
 
     def __hash__(self):
-        return hash(
-            (self.network,
-                self.agents,
-                self.attempt_no,
-                self.max_attempts,
-                self.step_no,
-                self.is_submitting,
-                self.is_paused,
-                self.is_terminal,
-                self.is_highlighted)
-        )
+        return hash(self.key)
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__)  \
-            and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and self.key == other.key
+
+    def __reduce__(self):
+        return (copyreg.__newobj__, (self.__class__,), self.__getstate__())
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self._fields}
+
+    def __setstate__(self, state):
+        # States pickled by the pomdp_py base class, e.g. in the logs,
+        # come as a tuple that contains the attribute dictionary.
+        if isinstance(state, tuple):
+            state = {k: v for d in state for k, v in d.items()}
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    @property
+    def key(self) -> tuple:
+        """tuple: a canonical, hashable value of the state.
+
+        Made of the network's key (the graph's index, the bitmask of
+        the selected edges, the suggested edge), the agents, the attempt
+        number, the maximum attempts, the step number, and the flags packed
+        into an integer. Equal states have equal keys.
+        """
+        return self.network.key + (
+            self.agents, self.attempt_no, self.max_attempts, self.step_no,
+            self.flags)
+
+    @property
+    def flags(self) -> int:
+        """int: the flags packed into an integer, with the bits (from the
+        lowest) is_submitting, is_paused, is_terminal, is_highlighted."""
+        return self.is_submitting | self.is_paused << 1 \
+            | self.is_terminal << 2 | self.is_highlighted << 3
 
     def __deepcopy__(self, memo, shared_attribute_names={}):
         """Create a copy of the state with a set of shared attributes."""
         cls = self.__class__
         result = cls.__new__(cls)
         memo[id(self)] = result
-        for k, v in self.__dict__.items():
+        for k in self._fields:
+            v = getattr(self, k)
             if k in shared_attribute_names:
                 setattr(result, k, copy.copy(v))
             else:
                 setattr(result, k, copy.deepcopy(v, memo))
         return result
 
+    def replace(self, **changes):
+        """Create a copy of the state with some attributes replaced.
+
+        The other attributes are shared with this state, e.g.
+        state.replace(is_paused=True) shares the network.
+
+        Returns:
+            EnvState: the new state.
+        """
+        cls = self.__class__
+        result = cls.__new__(cls)
+        for k in self._fields:
+            setattr(result, k, getattr(self, k))
+        for k, v in changes.items():
+            if k not in self._fields:
+                raise AttributeError(
+                    '{} has no attribute {}'.format(cls.__name__, k))
+            setattr(result, k, v)
+        return result
+
     def __str__(self):
         return self.__repr__()
 
@@ -131,6 +187,16 @@ class NetworkState(object):
         positions etc., sufficient to compute the cost of the selected
         network, whether it is optimal or not etc.
 
+        The selection is stored as a bitmask over the edge ids of the
+        background graph's index (see NetworkIndex), along with its cost,
+        connected components and frontier that are maintained
+        incrementally. Two states are equal (and hash the same) if they
+        have the same graph (by value), the same selected edges and the
+        same suggested edge.
+        Transitions create new states via with_edge(), cleared() and
+        replace(), sharing the background graph and the unchanged parts.
+        The subgraph is a view built on demand: do not modify it in place.
+
     Attributes:
         graph (networkx.Graph):
            the background graph with a cost function on edges
@@ -144,49 +210,84 @@ class NetworkState(object):
         node_name_key (str, optional)
             the key for the name of a node in node attribute dictionary
             (default 'text')
+        index (NetworkIndex):
+            the index of the background graph, shared by its states
     """
 
+    __slots__ = ('graph', 'index', '_edge_weight_key', '_node_name_key',
+                 '_mask', 'suggested_edge', '_cost', '_components',
+                 '_frontier', '_subgraph', '_nodes', '_edges')
+
     def __init__(self, graph, subgraph=None, suggested_edge=None,
                  edge_weight_key='cost', node_name_key='text'):
         self.graph = graph
+        self.index = get_network_index(graph, edge_weight_key=edge_weight_key)
+
+        self._edge_weight_key = edge_weight_key
+        self._node_name_key = node_name_key
+        # Build the node name index once, at load time.
+        get_node_name_index(graph, node_name_key=node_name_key)
 
         if subgraph is None:
-            self.subgraph = nx.Graph()
+            self._set_mask(0)
         else:
             self.subgraph = subgraph
 
         self.suggested_edge = suggested_edge
 
-        self._edge_weight_key = edge_weight_key
-        self._node_name_key = node_name_key
-
     def __hash__(self):
-        return hash((self.graph, self.subgraph, self.suggested_edge))
+        return hash(self.key)
 
     def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
-        else:
-            return False
+        return isinstance(other, self.__class__) and self.key == other.key
 
-    def __deepcopy__(self, memo, shared_attribute_names={'graph'}):
-        """Create a copy of the state with a set of shared attributes."""
-        cls = self.__class__
-        result = cls.__new__(cls)
+    @property
+    def key(self) -> tuple:
+        """tuple: a canonical, hashable value of the network state.
+
+        Made of the graph's index, the bitmask of the selected edges and
+        the suggested edge.
+        """
+        return (self.index, self._mask, self.suggested_edge)
+
+    def __deepcopy__(self, memo):
+        """Create a copy of the state that shares the background graph.
+
+        The selection is never modified in place, hence shared as well.
+        """
+        result = self._copy()
         memo[id(self)] = result
-        for k, v in self.__dict__.items():
-            if k in shared_attribute_names:
-                setattr(result, k, copy.copy(v))
-            else:
-                setattr(result, k, copy.deepcopy(v, memo))
         return result
 
+    def __getstate__(self):
+        # The selection by its edges, as the edge ids are per index.
+        return {
+            'graph': self.graph,
+            'edges': self.index.get_edges(self._mask),
+            'suggested_edge': self.suggested_edge,
+            '_edge_weight_key': self._edge_weight_key,
+            '_node_name_key': self._node_name_key,
+        }
+
+    def __setstate__(self, state):
+        state = dict(state)
+        # States pickled with a subgraph, e.g. in the logs.
+        if 'subgraph' in state:
+            edges = state.pop('subgraph').edges()
+        else:
+            edges = state.pop('edges')
+        for k, v in state.items():
+            setattr(self, k, v)
+        self.index = get_network_index(
+            self.graph, edge_weight_key=self._edge_weight_key)
+        self._set_mask(self.index.get_mask(edges))
+
     def __str__(self):
         return self.__repr__()
 
     def __repr__(self):
         extra_info = ''
-        num_nodes = self.subgraph.number_of_nodes()
+        num_nodes = len(self.get_selected_nodes())
 
         if num_nodes > 0:
             extra_info += ' where |V\'|={}'.format(num_nodes)
@@ -197,14 +298,63 @@ class NetworkState(object):
         extra_info += ' with cost={}'.format(self.get_cost())
 
         return 'Network(|E\'|={}{} in G(|V|={}, |E|={})){}'.format(
-            self.subgraph.number_of_edges(),
+            bin(self._mask).count('1'),
             '' if self.suggested_edge is None else '+1',
             self.graph.number_of_nodes(), self.graph.number_of_edges(),
             extra_info)
 
-    def get_selected_nodes(self) -> nx.Graph.nodes:
-        """Get an iterable for selected nodes from the selection subgraph."""
-        return self.subgraph.nodes()
+    @property
+    def subgraph(self):
+        """networkx.Graph: the subgraph of the selected edges."""
+        if self._subgraph is None:
+            subgraph = nx.Graph()
+            subgraph.add_edges_from(self.index.get_edges(self._mask))
+            self._subgraph = subgraph
+        return self._subgraph
+
+    @subgraph.setter
+    def subgraph(self, value):
+        self._set_mask(self.index.get_mask(value.edges()))
+
+    @property
+    def selected_mask(self) -> int:
+        """int: the bitmask of the selected edges by their ids."""
+        return self._mask
+
+    @selected_mask.setter
+    def selected_mask(self, value):
+        self._set_mask(value)
+
+    def get_selected_nodes(self) -> frozenset:
+        """Get the set of the nodes of the selected edges."""
+        if self._nodes is None:
+            self._nodes = frozenset(self.index.get_nodes(self._mask))
+        return self._nodes
+
+    def get_selected_edges(self) -> frozenset:
+        """Get the set of the selected edges, e.g. {(1, 2), (2, 4)}."""
+        if self._edges is None:
+            self._edges = frozenset(self.index.get_edges(self._mask))
+        return self._edges
+
+    @property
+    def frontier_mask(self) -> int:
+        """int: the bitmask of the unselected edges incident to a selected
+        node, i.e. that can extend the selection while connected."""
+        return self._frontier
+
+    def get_frontier_edges(self) -> list:
+        """Get the edges that can extend the selection while connected.
+
+        Returns:
+            list: the unselected edges incident to a selected node.
+        """
+        return self.index.get_edges(self._frontier)
+
+    def has_edge(self, u, v) -> bool:
+        """Check if an edge is selected."""
+        i = self.index.edge_ids.get((u, v))
+        return i is not None and (self._mask >> i) & 1 == 1
 
     def get_node_name(self, node, is_shortened=True) -> str:
         """Get the name of a node e.g. "Montreux".
@@ -229,19 +379,18 @@ class NetworkState(object):
     def get_node_id(self, name) -> int:
         """Get the id of a node from its name, e.g. "Montreux" to '1'.
 
+        The name is looked up in the node name index of the graph,
+        see NodeNameIndex for how a name is matched.
+
         Attributes:
             name (str):
                 name of a node in the graph.
         Returns:
-            int: id of a node e.g. 1, from the node's name e.g. "Montreux"
+            int: id of a node e.g. 1, from the node's name e.g. "Montreux",
+                or None if not found.
         """
-        found_id = None
-        for node_id in self.graph.nodes:
-            node_name = self.graph.nodes[node_id][self._node_name_key]
-            if name.lower() in node_name.lower():
-                found_id = node_id
-                break
-        return found_id
+        return get_node_name_index(
+            self.graph, node_name_key=self._node_name_key).find(name)
 
     def get_edge_ids(self, edge) -> tuple:
         """Get the ids of the nodes of an edge.
@@ -265,28 +414,110 @@ class NetworkState(object):
         """
         return self.get_node_name(edge[0]), self.get_node_name(edge[1])
 
+    def add_edge(self, u, v):
+        """Select an edge, updating the cost and the connected components.
+
+        Attributes:
+            u (int):
+                a node id of the edge in the graph.
+            v (int):
+                the other node id of the edge in the graph.
+        """
+        i = self.index.edge_ids[(u, v)]
+        bit = 1 << i
+        if self._mask & bit:
+            return
+        self._mask |= bit
+        self._cost += self.index.costs[i]
+        # Extend the frontier by the edges of the endpoints only.
+        self._frontier = (self._frontier | self.index.incident_masks[u]
+                          | self.index.incident_masks[v]) & ~self._mask
+        if not self._components.is_connected(u, v):
+            # Copy on write: the components may be shared with other states.
+            self._components = self._components.copy()
+            self._components.union(u, v)
+        self._clear_views()
+
     def clear(self):
         """Clear the selected edges and the flags."""
-        self.subgraph = nx.Graph()
+        self._set_mask(0)
         self.suggested_edge = None
 
+    def with_edge(self, u, v):
+        """Create a copy of the state with an edge selected.
+
+        Returns:
+            NetworkState: the new state.
+        """
+        result = self._copy()
+        result.add_edge(u, v)
+        return result
+
+    def cleared(self):
+        """Create a copy of the state with no selected or suggested edges.
+
+        Returns:
+            NetworkState: the new state.
+        """
+        result = self._copy()
+        result.clear()
+        return result
+
+    def replace(self, **changes):
+        """Create a copy of the state with some attributes replaced.
+
+        e.g. network.replace(suggested_edge=None)
+
+        Returns:
+            NetworkState: the new state.
+        """
+        result = self._copy()
+        for k, v in changes.items():
+            if not hasattr(self, k):
+                raise AttributeError('{} has no attribute {}'.format(
+                    self.__class__.__name__, k))
+            setattr(result, k, v)
+        return result
+
+    def _copy(self):
+        """Create a shallow copy that shares all the attributes."""
+        cls = self.__class__
+        result = cls.__new__(cls)
+        for k in self.__slots__:
+            setattr(result, k, getattr(self, k))
+        return result
+
+    def _set_mask(self, mask):
+        """Set the selected edges, and rebuild their cost and components."""
+        self._mask = mask
+        self._cost = self.index.get_cost(mask)
+        self._frontier = self.index.get_frontier_mask(mask)
+        self._components = UnionFind(self.graph.nodes())
+        for u, v in self.index.get_edges(mask):
+            self._components.union(u, v)
+        self._clear_views()
+
+    def _clear_views(self):
+        """Clear the views of the selection, to be built on demand."""
+        self._subgraph = None
+        self._nodes = None
+        self._edges = None
+
     def get_cost(self) -> float:
-        """Compute the total cost on the selected edges.
+        """Get the total cost on the selected edges.
 
         Returns:
             float: the cost.
         """
-        return compute_subgraph_cost(
-            self.graph, self.subgraph, edge_weight_key=self._edge_weight_key)
+        return self._cost
 
     def get_mst_cost(self) -> float:
-        """Compute the cost of a minimum-spanning tree of the state's network.
+        """Get the cost of a minimum-spanning tree of the state's network.
 
         Returns:
-            bool: The return value. True for success, False otherwise.
+            float: the cost, computed once per background graph.
         """
-        return compute_total_cost(
-            self.get_mst(), edge_weight_key=self._edge_weight_key)
+        return self.index.get_mst_cost()
 
     def get_mst(self) -> nx.Graph:
         """Get a minimum-spanning tree of the state's network.
@@ -296,6 +527,25 @@ class NetworkState(object):
         """
         return find_mst(self.graph, edge_weight_key=self._edge_weight_key)
 
+    def get_mst_edge_classes(self):
+        """Get the classes of the edges of the state's network by their
+        membership in its minimum-spanning trees.
+
+        Returns:
+            MstEdgeClasses: the classes, computed once per background graph.
+        """
+        return self.index.mst_classes
+
+    def is_mst_edge(self, u, v) -> bool:
+        """Check if an edge is in at least one minimum-spanning tree of the
+        state's network, i.e. if it may be optimal to select.
+
+        Returns:
+            bool: True if in an MST, False otherwise.
+        """
+        i = self.index.edge_ids.get((u, v))
+        return i is not None and self.index.mst_classes.is_in_some_mst(i)
+
     def get_max_cost(self) -> float:
         """Compute the total cost on the state's network.
 
@@ -311,7 +561,7 @@ class NetworkState(object):
         Returns:
             bool: True for spanning, False otherwise.
         """
-        return is_subgraph_spanning(self.graph, self.subgraph)
+        return self._components.num_sets == 1
 
     def is_mst(self) -> bool:
         """Check if the selected edges is an MST (minimum-spanning tree).
@@ -319,4 +569,58 @@ class NetworkState(object):
         Returns:
             bool: True for MST, False otherwise.
         """
+        # An edge that is in no MST rules an MST out early.
+        if self._mask & ~self.index.mst_classes.some_mask:
+            return False
         return self.is_spanning() and (self.get_cost() == self.get_mst_cost())
+
+
+class StateInternTable(object):
+    """A table to map equal states to a single shared instance.
+
+    States are looked up by their keys (see EnvState.key) along with the
+    attributes of their graphs (see NetworkIndex.attributes_key), as the
+    worlds with the same topology may have different layouts, and kept
+    only as long as they are referenced elsewhere, e.g. in a world's
+    history.
+
+    Attributes:
+        num_hits (int):
+            the number of states mapped to an existing instance
+        num_misses (int):
+            the number of states added as a new instance
+    """
+
+    def __init__(self):
+        self._states = weakref.WeakValueDictionary()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, state):
+        return self._get_key(state) in self._states
+
+    def __repr__(self):
+        return 'StateInternTable(size={}, hits={}, misses={})'.format(
+            len(self), self.num_hits, self.num_misses)
+
+    def intern(self, state):
+        """Get the shared instance that is equal to a state.
+
+        Returns:
+            EnvState: the shared instance, or the state itself if new.
+        """
+        key = self._get_key(state)
+        shared_state = self._states.get(key)
+        if shared_state is None:
+            self._states[key] = state
+            self.num_misses += 1
+            return state
+        self.num_hits += 1
+        return shared_state
+
+    @staticmethod
+    def _get_key(state):
+        return (state.network.index.attributes_key, state.key)
@@ -0,0 +1,96 @@
+import collections
+
+from ..domain.action import SuggestPickAction, AgreeAction, DisagreeAction, \
+    ClearAction, AttemptSubmitAction, ContinueAction, SubmitAction
+
+from ..agent.agent import Agent
+
+
+class HumanModel(object):
+    """A class to represent how the human responds in a collaborative world,
+    as a distribution over their feasible actions at a state.
+
+    An action's probability is proportional to the weight of its type,
+    shared equally among the feasible actions of that type, e.g. with the
+    weights {AgreeAction: 0.8, DisagreeAction: 0.2}, a human agrees with a
+    suggestion with probability 0.8. The weights are normalized over the
+    types that are feasible at the state, hence are relative only within
+    a decision (e.g. suggesting an edge against attempting to submit).
+    If none of the feasible types has a positive weight, the feasible
+    actions are equally likely.
+
+    Attributes:
+        weights (dict):
+            the weights of the action types, 0 for a type not given
+    """
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'HumanModel({})'.format(', '.join(
+            '{}={:g}'.format(t.__name__, w)
+            for t, w in sorted(self.weights.items(),
+                               key=lambda x: x[0].__name__)))
+
+    @classmethod
+    def agreeing(cls, p=1.0):
+        """Create a model of a human that agrees with probability p.
+
+        At their turn, the human suggests an edge, hardly ever attempting
+        to submit unless no edge is left to suggest, and confirms to submit.
+        """
+        if not 0 <= p <= 1:
+            print('Probability must be in [0, 1]: {}'.format(p))
+            raise ValueError
+
+        return cls({
+            AgreeAction: p, DisagreeAction: 1 - p,
+            SuggestPickAction: 1.0, AttemptSubmitAction: 1e-3,
+            SubmitAction: 1.0,
+        })
+
+    @classmethod
+    def from_logs(cls, logs, prior=1.0):
+        """Create a model from the frequencies of the human's action types
+        in the collaborative worlds of the logs (see load_all_logs()).
+
+        Args:
+            logs (dict): The histories by sample no and world name.
+            prior (float, optional): The count to add to each type
+                (i.e. Laplace smoothing), so that no type is ruled out.
+        """
+        types = [SuggestPickAction, AgreeAction, DisagreeAction, ClearAction,
+                 AttemptSubmitAction, ContinueAction, SubmitAction]
+        counts = collections.Counter({t: prior for t in types})
+        for sample in logs.values():
+            for name, history in sample.items():
+                if 'collaboration' not in name:
+                    continue
+                for action in history[1::2]:
+                    if action.agent == Agent.HUMAN \
+                            and action.__class__ in counts:
+                        counts[action.__class__] += 1
+
+        return cls(counts)
+
+    def get_distribution(self, actions):
+        """Get the probabilities of the feasible actions of the human.
+
+        Args:
+            actions (iterable): The feasible actions.
+
+        Returns:
+            dict: the probability of each action.
+        """
+        actions = list(actions)
+        type_counts = collections.Counter(a.__class__ for a in actions)
+        total = sum(self.weights.get(t, 0) for t in type_counts)
+        if total <= 0:
+            return {a: 1 / len(actions) for a in actions}
+
+        return {a: self.weights.get(a.__class__, 0)
+                / type_counts[a.__class__] / total for a in actions}
@@ -5,40 +5,223 @@ from ..domain.action import PickAction, SuggestPickAction, \
     SubmitAction, \
     AgreeAction, DisagreeAction, \
     ClearAction, AttemptSubmitAction, ContinueAction, \
-    SetPauseAction, ResetAction
+    SetPauseAction, ResetAction, ObserveAction, get_action
 
 from ..agent.agent import Agent
 
 
+class ActionSpace(object):
+    """A class to represent the available actions at a state, evaluated
+    from the rules of a policy model instead of as a materialized set.
+
+    The pick actions (e.g. PickAction, SuggestPickAction) are given by
+    the bitmasks of the edges that can be picked (see NetworkIndex), per
+    action type and agent, where an edge can be picked in either direction.
+    The other actions are given as a (small) set.
+
+    Membership, size, per-type and per-node queries are answered from the
+    bitmasks directly; the actions are enumerated only when iterated.
+
+    Attributes:
+        index (NetworkIndex):
+            the index of the network's background graph
+    """
+
+    def __init__(self, index, pick_masks=None, other_actions=()):
+        self.index = index
+        self._pick_masks = {k: m for k, m in (pick_masks or {}).items() if m}
+        self._other_actions = frozenset(other_actions)
+        self._other_list = None
+
+    def __contains__(self, action):
+        mask = self._pick_masks.get(
+            (action.__class__, getattr(action, 'agent', None)))
+        if mask is not None:
+            i = self.index.edge_ids.get(getattr(action, 'edge', None))
+            if i is not None and mask >> i & 1:
+                return True
+        return action in self._other_actions
+
+    def __len__(self):
+        num_picks = sum(bin(m).count('1') for m in self._pick_masks.values())
+        return 2 * num_picks + len(self._other_actions)
+
+    def __iter__(self):
+        for action_type, agent in self._pick_masks:
+            yield from self._iter_picks(action_type, agent)
+        yield from self._other_actions
+
+    def __getitem__(self, i):
+        """Get the i-th action in the order of iteration, without
+        enumerating the actions before it."""
+        if i < 0:
+            i += len(self)
+        if i >= 0:
+            for (action_type, agent), mask in self._pick_masks.items():
+                num_picks = 2 * bin(mask).count('1')
+                if i < num_picks:
+                    # Skip to the (i // 2)-th edge in the mask.
+                    for _ in range(i // 2):
+                        mask &= mask - 1
+                    u, v = self.index.edges[(mask & -mask).bit_length() - 1]
+                    edge = (u, v) if i % 2 == 0 else (v, u)
+                    return get_action(action_type, edge, agent=agent)
+                i -= num_picks
+
+            if self._other_list is None:
+                self._other_list = tuple(self._other_actions)
+            if i < len(self._other_list):
+                return self._other_list[i]
+
+        raise IndexError('action space index out of range')
+
+    def __eq__(self, other):
+        if isinstance(other, (ActionSpace, set, frozenset)):
+            return len(self) == len(other) and set(self) == set(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'ActionSpace({})'.format(sorted(self))
+
+    def get_types(self) -> set:
+        """Get the types of the available actions."""
+        types = {action_type for action_type, _ in self._pick_masks}
+        types.update(action.__class__ for action in self._other_actions)
+        return types
+
+    def get_actions(self, action_type) -> set:
+        """Get the available actions of a type, e.g. PickAction."""
+        actions = {a for a in self._other_actions
+                   if a.__class__ is action_type}
+        for key_type, agent in self._pick_masks:
+            if key_type is action_type:
+                actions.update(self._iter_picks(action_type, agent))
+        return actions
+
+    def sample(self, rng=random):
+        """Sample an action uniformly, by its index.
+
+        Args:
+            rng (random.Random, optional): The random number generator.
+
+        Returns:
+            Action: the sampled action.
+
+        Raises:
+            IndexError: if there are no actions.
+        """
+        return self[rng.randrange(len(self))]
+
+    def for_agents(self, agents):
+        """Get the actions of some agents, e.g. state.agents.
+
+        Returns:
+            ActionSpace: the actions of the agents.
+        """
+        pick_masks = {k: m for k, m in self._pick_masks.items()
+                      if k[1] in agents}
+        other_actions = {a for a in self._other_actions if a.agent in agents}
+        return ActionSpace(self.index, pick_masks, other_actions)
+
+    def touches(self, u, agent=None) -> bool:
+        """Check if a pick action is available with an edge at node u,
+        for an agent, or for any agent if agent is None."""
+        incident_mask = self.index.incident_masks.get(u, 0)
+        for (_, key_agent), mask in self._pick_masks.items():
+            if (agent is None or key_agent == agent) \
+                    and mask & incident_mask:
+                return True
+        return False
+
+    def _iter_picks(self, action_type, agent):
+        mask = self._pick_masks[action_type, agent]
+        for u, v in self.index.get_edges(mask):
+            yield get_action(action_type, (u, v), agent=agent)
+            yield get_action(action_type, (v, u), agent=agent)
+
+
 class PolicyModel(pomdp_py.RolloutPolicy):
     """A base class to represent an action selection policy, that
     (1) determines the action space at a given history or state, and
     (2) samples an action from this space according
     to some probability distribution.
+
+    The action space is an ActionSpace, built from the edges that can be
+    picked (e.g. the frontier of the selection that a network state
+    maintains incrementally) and the other actions. The actions at the
+    current state are kept, and the actions at another state (e.g. in a
+    planner's simulation) are built without replacing them. In
+    verification mode, they are checked against a full rebuild at every
+    update.
+
+    The actions are sampled uniformly by their indices in the action
+    space, with the model's own random number generator.
+
+    Attributes:
+        verify (bool, optional):
+            whether to check the actions against a full rebuild
+            (default False)
+        rng (random.Random):
+            the random number generator, seeded by the seed if given
     """
 
+    def __init__(self, verify=False, seed=None):
+        self.verify = verify
+        self.rng = random.Random(seed)
+        self.actions = ActionSpace(None)
+
     def probability(self, action, state, normalized=False, **kwargs):
         raise NotImplementedError  # Never used
 
     def sample(self, state, normalized=False, **kwargs):
-        return random.sample(self.get_all_actions(**kwargs), 1)[0]
+        """Sample a feasible action at a state uniformly."""
+        return self.get_all_actions(state=state).sample(self.rng)
 
     def update(self, state, next_state, action, **kwargs):
         self.update_available_actions(next_state)
 
     def get_all_actions(self, state=None, **kwargs):
-        """Enumerate only the feasible actions."""
+        """Enumerate only the feasible actions, at the current state or at
+        a given state."""
         if state is not None:
-            self.update_available_actions(state)
+            return self.get_action_space(state)
         return self.actions
 
     def rollout(self, state, history=None):
-        return self.sample(state, history)
+        """Sample an action for a rollout (e.g. by POUCT) uniformly among
+        the actions of the agents that act at a state, i.e. without the
+        manager's interventions, or observe if no agent acts."""
+        actions = self.get_action_space(state).for_agents(state.agents)
+        if len(actions) == 0:
+            return get_action(ObserveAction, agent=Agent.ROBOT)
+        return actions.sample(self.rng)
 
     # Helper methods.
     def update_available_actions(self, state):
+        """Update the actions at the current state."""
+        self.actions = self.get_action_space(state)
+        if self.verify:
+            self._verify_available_actions(state)
+
+    def get_action_space(self, state):
+        """Get the feasible actions at a state, as an ActionSpace."""
         raise NotImplementedError
 
+    def build_available_actions(self, state):
+        """Build the available actions from scratch, for verification."""
+        raise NotImplementedError
+
+    def _verify_available_actions(self, state):
+        expected = self.build_available_actions(state)
+        assert self.actions == expected, \
+            'Available actions differ from a rebuild at {}: {} vs {}'.format(
+                state, sorted(self.actions), sorted(expected))
+
 
 class IndividualPolicyModel(PolicyModel):
     """A class to represent the available actions at a state in 
@@ -50,7 +233,44 @@ class IndividualPolicyModel(PolicyModel):
         super().__init__(**kwargs)
         self.agent = agent
 
-    def update_available_actions(self, state):
+    def get_action_space(self, state):
+        network = state.network
+        pick_masks = dict()
+        actions = set()
+
+        # If it is not the end of the activity.
+        if not state.is_terminal:
+
+            # If not confirming a submission (i.e. normal gameplay).
+            if not state.is_submitting:
+
+                # Can pick edges outgoing from connected nodes, or all edges.
+                if network.selected_mask:
+                    mask = network.frontier_mask
+                else:
+                    mask = network.index.full_mask
+                pick_masks[(PickAction, self.agent)] = mask
+
+                # Can clear if there is at least one edge.
+                if network.selected_mask:
+                    actions.add(get_action(ClearAction, agent=self.agent))
+
+                # Can attempt to submit any time.
+                actions.add(get_action(
+                    AttemptSubmitAction, agent=self.agent))
+
+            # Confirming a submission.
+            else:
+                actions.add(get_action(ContinueAction, agent=self.agent))
+                actions.add(get_action(SubmitAction, agent=self.agent))
+
+        actions.add(get_action(SetPauseAction, True, agent=Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, False, agent=Agent.MANAGER))
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
+
+        return ActionSpace(network.index, pick_masks, actions)
+
+    def build_available_actions(self, state):
         actions = set()
 
         # If it is not the end of the activity.
@@ -60,36 +280,39 @@ class IndividualPolicyModel(PolicyModel):
             if not state.is_submitting:
 
                 # Can pick edges outgoing from connected nodes, or all edges.
-                if state.network.subgraph.number_of_edges() > 0:
-                    for u in state.network.subgraph.nodes():
+                if len(state.network.get_selected_edges()) > 0:
+                    for u in state.network.get_selected_nodes():
                         for v in state.network.graph.neighbors(u):
-                            if not state.network.subgraph.has_edge(u, v):
-                                actions.add(PickAction(
-                                    (u, v), agent=self.agent))
-                                actions.add(PickAction(
-                                    (v, u), agent=self.agent))
+                            if not state.network.has_edge(u, v):
+                                actions.add(get_action(
+                                    PickAction, (u, v), agent=self.agent))
+                                actions.add(get_action(
+                                    PickAction, (v, u), agent=self.agent))
                 else:
                     for u, v in state.network.graph.edges():
-                        actions.add(PickAction((u, v), agent=self.agent))
-                        actions.add(PickAction((v, u), agent=self.agent))
+                        actions.add(get_action(
+                            PickAction, (u, v), agent=self.agent))
+                        actions.add(get_action(
+                            PickAction, (v, u), agent=self.agent))
 
                 # Can clear if there is at least one edge.
-                if state.network.subgraph.number_of_edges() > 0:
-                    actions.add(ClearAction(agent=self.agent))
+                if len(state.network.get_selected_edges()) > 0:
+                    actions.add(get_action(ClearAction, agent=self.agent))
 
                 # Can attempt to submit any time.
-                actions.add(AttemptSubmitAction(agent=self.agent))
+                actions.add(get_action(
+                    AttemptSubmitAction, agent=self.agent))
 
             # Confirming a submission.
             else:
-                actions.add(ContinueAction(agent=self.agent))
-                actions.add(SubmitAction(agent=self.agent))
+                actions.add(get_action(ContinueAction, agent=self.agent))
+                actions.add(get_action(SubmitAction, agent=self.agent))
 
-        actions.add(SetPauseAction(True, Agent.MANAGER))
-        actions.add(SetPauseAction(False, Agent.MANAGER))
-        actions.add(ResetAction(Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, True, agent=Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, False, agent=Agent.MANAGER))
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
 
-        self.actions = actions
+        return actions
 
 
 class CollaborativePolicyModel(PolicyModel):
@@ -97,7 +320,57 @@ class CollaborativePolicyModel(PolicyModel):
         a collaborative world.
     """
 
-    def update_available_actions(self, state):
+    def get_action_space(self, state):
+        network = state.network
+        pick_masks = dict()
+        actions = set()
+
+        # For each active agent.
+        for agent in state.agents:
+
+            # If it is not the end of the activity.
+            if not state.is_terminal:
+
+                # If not confirming a submission (i.e. normal gameplay).
+                if not state.is_submitting:
+
+                    # If no edge is currently suggested.
+                    if network.suggested_edge is None:
+
+                        # Can pick edges outgoing from connected nodes
+                        # , or all edges if no edges are selected yet.
+                        if network.selected_mask:
+                            mask = network.frontier_mask
+                        else:
+                            mask = network.index.full_mask
+                        pick_masks[(SuggestPickAction, agent)] = mask
+
+                        # The agent can submit.
+                        actions.add(get_action(
+                            AttemptSubmitAction, agent=agent))
+
+                        # The agent can clear, if there is at least one edge.
+                        if network.selected_mask:
+                            actions.add(get_action(ClearAction, agent=agent))
+
+                    # If there is a suggested edge.
+                    else:
+                        # The agent can (dis)agree with the suggested edge.
+                        actions.add(get_action(AgreeAction, agent=agent))
+                        actions.add(get_action(DisagreeAction, agent=agent))
+
+                # Confirming a submission.
+                else:
+                    actions.add(get_action(ContinueAction, agent=agent))
+                    actions.add(get_action(SubmitAction, agent=agent))
+
+        actions.add(get_action(SetPauseAction, True, agent=Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, False, agent=Agent.MANAGER))
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
+
+        return ActionSpace(network.index, pick_masks, actions)
+
+    def build_available_actions(self, state):
         actions = set()
 
         # For each active agent.
@@ -114,70 +387,95 @@ class CollaborativePolicyModel(PolicyModel):
 
                         # Can pick edges outgoing from connected nodes
                         # , or all edges if no edges are selected yet.
-                        if state.network.subgraph.number_of_edges() > 0:
-                            for u in state.network.subgraph.nodes():
+                        if len(state.network.get_selected_edges()) > 0:
+                            for u in state.network.get_selected_nodes():
                                 for v in state.network.graph.neighbors(u):
-                                    if not state.network.subgraph.has_edge(
-                                            u, v):
+                                    if not state.network.has_edge(u, v):
                                         # Can select u to v an v to u.
                                         for e in [(u, v), (v, u)]:
-                                            a = SuggestPickAction(
-                                                e, agent=agent)
+                                            a = get_action(
+                                                SuggestPickAction, e,
+                                                agent=agent)
                                             actions.add(a)
                         else:
                             for u, v in state.network.graph.edges():
-                                actions.add(
-                                    SuggestPickAction((u, v), agent=agent))
-                                actions.add(
-                                    SuggestPickAction((v, u), agent=agent))
+                                actions.add(get_action(
+                                    SuggestPickAction, (u, v), agent=agent))
+                                actions.add(get_action(
+                                    SuggestPickAction, (v, u), agent=agent))
 
                         # The agent can submit.
-                        actions.add(AttemptSubmitAction(agent=agent))
+                        actions.add(get_action(
+                            AttemptSubmitAction, agent=agent))
 
                         # The agent can clear, if there is at least one edge.
-                        if state.network.subgraph.number_of_edges() > 0:
-                            actions.add(ClearAction(agent=agent))
+                        if len(state.network.get_selected_edges()) > 0:
+                            actions.add(get_action(ClearAction, agent=agent))
 
                     # If there is a suggested edge.
                     else:
                         # The agent can (dis)agree with the suggested edge.
-                        actions.add(AgreeAction(agent=agent))
-                        actions.add(DisagreeAction(agent=agent))
+                        actions.add(get_action(AgreeAction, agent=agent))
+                        actions.add(get_action(DisagreeAction, agent=agent))
 
                 # Confirming a submission.
                 else:
-                    actions.add(ContinueAction(agent=agent))
-                    actions.add(SubmitAction(agent=agent))
+                    actions.add(get_action(ContinueAction, agent=agent))
+                    actions.add(get_action(SubmitAction, agent=agent))
 
-        actions.add(SetPauseAction(True, Agent.MANAGER))
-        actions.add(SetPauseAction(False, Agent.MANAGER))
-        actions.add(ResetAction(Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, True, agent=Agent.MANAGER))
+        actions.add(get_action(SetPauseAction, False, agent=Agent.MANAGER))
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
 
-        self.actions = actions
+        return actions
 
 
 class IntroPolicyModel(PolicyModel):
-    def update_available_actions(self, state):
-        self.actions = {SubmitAction(agent=Agent.HUMAN)}
+    def get_action_space(self, state):
+        return ActionSpace(
+            state.network.index,
+            other_actions={get_action(SubmitAction, agent=Agent.HUMAN)})
+
+    def build_available_actions(self, state):
+        return {get_action(SubmitAction, agent=Agent.HUMAN)}
 
 
 class TutorialPolicyModel(PolicyModel):
-    def update_available_actions(self, state):
+    def get_action_space(self, state):
+        network = state.network
+        pick_masks = dict()
         actions = set()
 
-        num_edges = state.network.subgraph.number_of_edges()
+        if state.step_no < 4:
+            pick_masks[(PickAction, Agent.HUMAN)] = \
+                network.index.full_mask & ~network.selected_mask
+
+        if state.step_no < 4 and network.selected_mask:
+            actions.add(get_action(ClearAction, agent=Agent.HUMAN))
+
+        actions.add(get_action(SubmitAction, agent=Agent.HUMAN))
+
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
+
+        return ActionSpace(network.index, pick_masks, actions)
+
+    def build_available_actions(self, state):
+        actions = set()
 
         if state.step_no < 4:
             for u, v in state.network.graph.edges():
-                if not state.network.subgraph.has_edge(u, v):
-                    actions.add(PickAction((u, v), agent=Agent.HUMAN))
-                    actions.add(PickAction((v, u), agent=Agent.HUMAN))
+                if not state.network.has_edge(u, v):
+                    actions.add(get_action(
+                        PickAction, (u, v), agent=Agent.HUMAN))
+                    actions.add(get_action(
+                        PickAction, (v, u), agent=Agent.HUMAN))
 
-        if state.step_no < 4 and num_edges > 0:
-            actions.add(ClearAction(agent=Agent.HUMAN))
+        if state.step_no < 4 \
+                and len(state.network.get_selected_edges()) > 0:
+            actions.add(get_action(ClearAction, agent=Agent.HUMAN))
 
-        actions.add(SubmitAction(agent=Agent.HUMAN))
+        actions.add(get_action(SubmitAction, agent=Agent.HUMAN))
 
-        actions.add(ResetAction(Agent.MANAGER))
+        actions.add(get_action(ResetAction, agent=Agent.MANAGER))
 
-        self.actions = actions
+        return actions
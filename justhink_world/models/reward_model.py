@@ -37,7 +37,7 @@ class MstRewardModel(NullRewardModel):
 
         if isinstance(action, PickAction):
             u, v = action.edge
-            if not network.subgraph.has_edge(u, v) \
+            if not network.has_edge(u, v) \
                     and network.graph.has_edge(u, v):
                 reward = -network.graph[u][v]['cost']
             else:
@@ -1,4 +1,5 @@
-import copy
+import collections
+import threading
 
 import pomdp_py
 
@@ -14,12 +15,107 @@ from ..agent import Agent
 EPSILON = 1e-9
 
 
+class TransitionCache(object):
+    """A class to cache the transitions, with a bounded size and
+    least-recently-used (LRU) eviction.
+
+    A transition is cached by a fingerprint of the transition model's type,
+    the state's key, the attributes of its graph and the action (see
+    TransitionModel). A cache can be shared by the transition models of
+    many worlds (and threads), e.g. to replay logs that share prefixes of
+    states and actions: the worlds with the same topology but another
+    layout do not share the transitions, as the next states carry the
+    graph.
+
+    Attributes:
+        max_size (int, optional):
+            the maximum number of transitions to keep (default 10000)
+        num_hits (int):
+            the number of look-ups that found a transition
+        num_misses (int):
+            the number of look-ups that did not find a transition
+    """
+
+    def __init__(self, max_size=10000):
+        if max_size < 1:
+            print('Cache size must be positive: {}'.format(max_size))
+            raise ValueError
+
+        self.max_size = max_size
+        self.num_hits = 0
+        self.num_misses = 0
+        self._transitions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._transitions)
+
+    def __contains__(self, key):
+        return key in self._transitions
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'TransitionCache(size={}/{}, hits={}, misses={})'.format(
+            len(self), self.max_size, self.num_hits, self.num_misses)
+
+    @property
+    def hit_rate(self):
+        """float: the ratio of the look-ups that found a transition."""
+        num_lookups = self.num_hits + self.num_misses
+        return self.num_hits / num_lookups if num_lookups > 0 else 0.0
+
+    def get(self, key):
+        """Get the next state of a transition, or None if not cached."""
+        with self._lock:
+            next_state = self._transitions.get(key)
+            if next_state is None:
+                self.num_misses += 1
+            else:
+                self.num_hits += 1
+                self._transitions.move_to_end(key)
+        return next_state
+
+    def put(self, key, next_state):
+        """Cache the next state of a transition, evicting the least
+        recently used transition if full."""
+        with self._lock:
+            self._transitions[key] = next_state
+            self._transitions.move_to_end(key)
+            if len(self._transitions) > self.max_size:
+                self._transitions.popitem(last=False)
+
+    def clear(self):
+        """Remove all the transitions and reset the counters."""
+        with self._lock:
+            self._transitions.clear()
+            self.num_hits = 0
+            self.num_misses = 0
+
+
 class TransitionModel(pomdp_py.TransitionModel):
     """Base class transition model for an activity.
-    Inherit and override sample(self, state, action)."""
+    Inherit and override _sample(self, state, action).
+
+    If a cache (TransitionCache) is given, the transitions are memoized in
+    that cache, by a fingerprint of the model's type, the state's key, the
+    attributes of its graph (see NetworkIndex.attributes_key) and the
+    action. The states are immutable, hence shared from the cache.
+
+    Attributes:
+        cache (TransitionCache, optional):
+            the cache of the transitions, or None to not cache
+            (default None)
+        depends_on_step_no (bool):
+            whether the transitions depend on the step number of a state,
+            rather than only counting the steps (default False)
+    """
 
-    def __init__(self):
-        pass
+    depends_on_step_no = False
+
+    def __init__(self, cache=None):
+        self.cache = cache
 
     def probability(self, next_state, state, action,
                     normalized=False, **kwargs):
@@ -30,151 +126,174 @@ class TransitionModel(pomdp_py.TransitionModel):
             return EPSILON
 
     def sample(self, state, action):
-        raise NotImplementedError
+        if self.cache is None:
+            return self._sample(state, action)
+
+        key = self._get_fingerprint(state, action)
+        if key is None:
+            return self._sample(state, action)
+
+        next_state = self.cache.get(key)
+        if next_state is None:
+            next_state = self._sample(state, action)
+            self.cache.put(key, next_state)
+        return next_state
 
     def argmax(self, state, action):
         """Returns the most likely next state"""
         return self.sample(state, action)
 
+    def _sample(self, state, action):
+        raise NotImplementedError
+
+    def _get_fingerprint(self, state, action):
+        """Get a hashable value of a transition, or None if not cacheable.
+
+        A state-setting action is not identified by its name (that shows
+        the state partially), hence is not cached.
+        """
+        if isinstance(action, SetStateAction):
+            return None
+        return (self.__class__, state.key,
+                state.network.index.attributes_key,
+                action.__class__, action.name, action.agent)
+
 
 class IntroTransitionModel(TransitionModel):
     """Transition model for the introduction: no action is available."""
 
-    def sample(self, state, action):
+    def _sample(self, state, action):
         return state
 
 
 class TutorialTransitionModel(TransitionModel):
     """Transition model for the tutorial."""
 
-    def sample(self, state, action):
-        next_state = copy.deepcopy(state)
+    # The tutorial proceeds by its instruction steps.
+    depends_on_step_no = True
+
+    def _sample(self, state, action):
+        network = state.network
+        changes = dict()
 
         if isinstance(action, ResetAction):
-            next_state.step_no = 0
-            next_state.is_highlighted = False
-            next_state.network.subgraph = nx.Graph()
+            changes['step_no'] = 0
+            changes['is_highlighted'] = False
+            changes['network'] = network.replace(subgraph=nx.Graph())
 
-        num_edges = state.network.subgraph.number_of_edges()
+        num_edges = len(network.get_selected_edges())
 
         if state.step_no == 1 and isinstance(action, PickAction):
-            next_state.step_no = 2
-            next_state.is_highlighted = True
+            changes['step_no'] = 2
+            changes['is_highlighted'] = True
 
         elif state.step_no == 2 and isinstance(action, ClearAction):
-            next_state.step_no = 3
-            next_state.is_highlighted = False
+            changes['step_no'] = 3
+            changes['is_highlighted'] = False
 
         elif state.step_no == 3 and isinstance(action, SubmitAction) \
                 and num_edges == 1:
-            next_state.is_terminal = True
-            next_state.step_no = 4
+            changes['is_terminal'] = True
+            changes['step_no'] = 4
 
         if isinstance(action, PickAction):
-            next_state.network.subgraph.add_edge(*action.edge)
+            changes['network'] = network.with_edge(*action.edge)
 
         elif isinstance(action, ClearAction) and num_edges > 0:
-            next_state.network.subgraph = nx.Graph()
+            changes['network'] = network.replace(subgraph=nx.Graph())
 
-        return next_state
+        return state.replace(**changes)
 
 
 class IndividualTransitionModel(TransitionModel):
     """Transition model for an individual activity (e.g. tests)."""
 
-    def sample(self, state, action):
-
-        next_state = copy.deepcopy(state)
+    def _sample(self, state, action):
 
         if isinstance(action, SetStateAction):
             return action.state
 
         elif isinstance(action, SetPauseAction):
-            next_state = copy.deepcopy(state)
-            next_state.is_paused = action.is_paused
-            return next_state
-
-        elif isinstance(action, ResetAction):
-            next_state.network.subgraph = nx.Graph()
-            next_state.agents = frozenset({Agent.HUMAN})
-            next_state.attempt_no = 1
-            next_state.is_submitting = False
-            next_state.is_paused = False
-            next_state.is_terminal = False
-            next_state.is_highlighted = False
+            return state.replace(is_paused=action.is_paused)
 
         # Like a wait action to fill observation.
         elif isinstance(action, ObserveAction):
             return state
 
         network = state.network
-        next_network = next_state.network
+        next_network = network
+        changes = dict()
+
+        if isinstance(action, ResetAction):
+            next_network = network.replace(subgraph=nx.Graph())
+            changes['agents'] = frozenset({Agent.HUMAN})
+            changes['attempt_no'] = 1
+            changes['is_submitting'] = False
+            changes['is_paused'] = False
+            changes['is_terminal'] = False
+            changes['is_highlighted'] = False
 
         # Pick action.
-        if isinstance(action, PickAction):
+        elif isinstance(action, PickAction):
             if not state.is_terminal:
                 u, v = action.edge
                 if network.graph.has_edge(u, v) \
-                        and not network.subgraph.has_edge(u, v):
-                    next_network.subgraph.add_edge(u, v)
-                next_state.is_submitting = False
+                        and not network.has_edge(u, v):
+                    next_network = network.with_edge(u, v)
+                changes['is_submitting'] = False
 
         # Clear action.
         elif isinstance(action, ClearAction):
-            next_network.suggested_edge = None
-            next_network.subgraph = nx.Graph()
+            next_network = network.cleared()
 
         # Attempt to submit action.
         elif isinstance(action, AttemptSubmitAction):
-            next_state.is_submitting = True
+            changes['is_submitting'] = True
 
         elif isinstance(action, ContinueAction):
-            next_state.is_submitting = False
+            changes['is_submitting'] = False
 
         elif isinstance(action, SubmitAction):
-            next_state.is_terminal = True
-            next_state.agents = frozenset()
-            next_state.is_submitting = False
+            changes['is_terminal'] = True
+            changes['agents'] = frozenset()
+            changes['is_submitting'] = False
 
-        next_state.network = next_network
+        changes['network'] = next_network
 
-        next_state.step_no = next_state.step_no + 1
+        changes['step_no'] = state.step_no + 1
 
-        return next_state
+        return state.replace(**changes)
 
 
 class CollaborativeTransitionModel(TransitionModel):
     """Transition model for a collaborative activity."""
 
-    def sample(self, state, action):
-        next_state = copy.deepcopy(state)
+    def _sample(self, state, action):
 
         # Meta type of actions, intervention-like / god-mode.
         if isinstance(action, SetStateAction):
-            return copy.deepcopy(action.state)
+            return action.state
 
         elif isinstance(action, SetPauseAction):
-            next_state = copy.deepcopy(state)
-            next_state.is_paused = action.is_paused
-            return next_state
-
-        elif isinstance(action, ResetAction):
-            next_state.network.subgraph = nx.Graph()
-            next_state.agents = frozenset({Agent.ROBOT})
-            next_state.attempt_no = 1
-            next_state.is_submitting = False
-            next_state.is_paused = False
-            next_state.is_terminal = False
-            next_state.is_highlighted = False
+            return state.replace(is_paused=action.is_paused)
 
         elif isinstance(action, ObserveAction):
             return state
 
-        next_state = copy.deepcopy(state)
         network = state.network
-        next_network = next_state.network
+        next_network = network
+        changes = dict()
 
-        if isinstance(action, SuggestPickAction):
+        if isinstance(action, ResetAction):
+            next_network = network.replace(subgraph=nx.Graph())
+            changes['agents'] = frozenset({Agent.ROBOT})
+            changes['attempt_no'] = 1
+            changes['is_submitting'] = False
+            changes['is_paused'] = False
+            changes['is_terminal'] = False
+            changes['is_highlighted'] = False
+
+        elif isinstance(action, SuggestPickAction):
             u, v = action.edge
 
             # Validity.
@@ -185,63 +304,59 @@ class CollaborativeTransitionModel(TransitionModel):
 
                 # New suggestion.
                 if s is None:
-                    next_network.suggested_edge = (u, v)
+                    next_network = network.replace(suggested_edge=(u, v))
                     # Maintain the agents that can act: suggestions swap turns.
-                    next_state.agents = toggle_agent(state.agents)
+                    changes['agents'] = toggle_agent(state.agents)
 
                 # Accept.
                 elif s == (u, v) or s == (v, u):
+                    next_network = network.with_edge(u, v)
                     next_network.suggested_edge = None
-                    next_network.subgraph.add_edge(u, v)
 
                 # Reject and have a new suggestion.
                 else:
-                    next_network.suggested_edge = (u, v)
-
-                next_network.is_submitting = False
+                    next_network = network.replace(suggested_edge=(u, v))
 
         # Clear action.
         elif isinstance(action, ClearAction):
-            next_network.suggested_edge = None
-            next_network.subgraph = nx.Graph()
+            next_network = network.cleared()
 
         # Agree action.
         elif isinstance(action, AgreeAction):
-            next_network.suggested_edge = None
             s = network.suggested_edge
-            next_network.subgraph.add_edge(s[0], s[1])
+            next_network = network.with_edge(s[0], s[1])
+            next_network.suggested_edge = None
 
         # Disagree action.
         elif isinstance(action, DisagreeAction):
-            next_network.suggested_edge = None
+            next_network = network.replace(suggested_edge=None)
 
         # Attempt to submit action.
         elif isinstance(action, AttemptSubmitAction):
-            next_state.is_submitting = True
+            changes['is_submitting'] = True
 
         elif isinstance(action, ContinueAction):
-            next_state.is_submitting = False
+            changes['is_submitting'] = False
 
         elif isinstance(action, SubmitAction):
             if network.is_mst():
-                next_state.is_terminal = True
-                next_state.agents = frozenset()
+                changes['is_terminal'] = True
+                changes['agents'] = frozenset()
             elif state.attempt_no == state.max_attempts:
-                next_state.is_terminal = True
-                next_state.agents = frozenset()
+                changes['is_terminal'] = True
+                changes['agents'] = frozenset()
             else:
-                next_network.subgraph = nx.Graph()
-                next_network.suggested_edge = None
-                next_state.attempt_no += 1
+                next_network = network.cleared()
+                changes['attempt_no'] = state.attempt_no + 1
 
-            next_state.is_submitting = False
-            next_state.is_paused = False
+            changes['is_submitting'] = False
+            changes['is_paused'] = False
 
-        next_state.network = next_network
+        changes['network'] = next_network
 
-        next_state.step_no = next_state.step_no + 1
+        changes['step_no'] = state.step_no + 1
 
-        return next_state
+        return state.replace(**changes)
 
 
 def toggle_agent(agents):
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import json
+import sys
+
+import pytest
+
+from justhink_world.tools import benchmark
+
+
+def test_benchmark_run():
+    results = benchmark.run(quick=True)
+
+    # Every benchmark reports its metrics, with a value and a unit each.
+    assert {k.split('/')[0] for k in results} == set(benchmark.BENCHMARKS)
+    for result in results.values():
+        assert set(result) == {'value', 'unit'}
+        assert result['value'] > 0
+
+    # The results are serializable, and compare equal to themselves.
+    results = json.loads(json.dumps(results))
+    rows = benchmark.compare(results, results)
+    assert len(rows) == len(results)
+    assert not any(is_regression for *_, is_regression in rows)
+
+
+def test_benchmark_compare():
+    baseline = {'a': {'value': 10, 'unit': 'us'},
+                'b': {'value': 100, 'unit': 'op/s'},
+                'c': {'value': 10, 'unit': 'us'},
+                'd': {'value': 1, 'unit': 'us'}}
+    results = {'a': {'value': 15, 'unit': 'us'},
+               'b': {'value': 50, 'unit': 'op/s'},
+               'c': {'value': 11, 'unit': 'us'},
+               'e': {'value': 1, 'unit': 'us'}}
+
+    # Slower times and lower throughputs are flagged over the threshold.
+    rows = {row[0]: row[1:] for row in benchmark.compare(
+        results, baseline, threshold=0.2)}
+    assert sorted(rows) == ['a', 'b', 'c']
+    assert rows['a'] == (10, 15, 0.5, True)
+    assert rows['b'] == (100, 50, 1.0, True)
+    assert rows['c'][-1] is False
+
+
+def test_benchmark_main(tmp_path, monkeypatch, capsys):
+    output = tmp_path / 'results.json'
+    argv = ['benchmark', 'plan', '--quick', '--output', str(output)]
+    monkeypatch.setattr(sys, 'argv', argv)
+    benchmark.main()
+    report = json.loads(output.read_text())
+    assert report['metadata']['quick'] is True
+
+    # Comparing against itself passes, against a faster baseline fails.
+    monkeypatch.setattr(sys, 'argv', argv + ['--baseline', str(output)])
+    benchmark.main()
+    for result in report['results'].values():
+        if result['unit'].endswith('/s'):
+            result['value'] *= 1e6
+        else:
+            result['value'] /= 1e6
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(report))
+    monkeypatch.setattr(sys, 'argv', argv + ['--baseline', str(baseline)])
+    with pytest.raises(SystemExit) as info:
+        benchmark.main()
+    assert info.value.code == 1
+    assert 'REGRESSION' in capsys.readouterr().out
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import random
+
+import numpy as np
+
+from justhink_world import create_world, compile_world
+
+
+def test_compiled_world(tmp_path):
+    compiled = compile_world('pretest-1', cache_dir=tmp_path)
+    assert compiled.num_states > 1
+
+    # The tables agree with the world's own models on a random walk.
+    world = create_world('pretest-1')
+    rng = random.Random(0)
+    state_id = 0
+    for _ in range(40):
+        actions = sorted(world.agent.all_actions)
+        if len(actions) == 0:
+            break
+        action = rng.choice(actions)
+        feasible = compiled.get_feasible_actions(state_id)
+        assert {compiled.actions[i] for i in feasible} == set(actions)
+
+        world.act(action)
+        state_id, _ = compiled.step(
+            state_id, compiled.get_action_id(action))
+        assert state_id == compiled.get_state_id(world.cur_state)
+
+    # A second compilation loads the same tables from the cache.
+    loaded = compile_world('pretest-1', cache_dir=tmp_path)
+    assert np.array_equal(loaded.transitions, compiled.transitions)
+    assert loaded.actions == compiled.actions
+    state_id = compiled.num_states - 1
+    assert loaded.get_state(state_id) == compiled.get_state(state_id)
+    assert loaded.get_state_id(compiled.get_state(state_id)) == state_id
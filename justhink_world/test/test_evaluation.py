@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+from justhink_world import create_world, evaluate_strategies, \
+    get_situations
+from justhink_world.agent import Agent
+from justhink_world.domain.action import SuggestPickAction, AgreeAction, \
+    DisagreeAction
+
+
+def test_evaluate_strategies():
+    actions = [SuggestPickAction((0, 3), agent=Agent.ROBOT),
+               AgreeAction(agent=Agent.HUMAN),
+               SuggestPickAction((3, 1), agent=Agent.HUMAN),
+               DisagreeAction(agent=Agent.ROBOT)]
+    worlds = {strategy: create_world('collaboration-1',
+                                     agent_strategy=strategy)
+              for strategy in ['greedy', 'optimal']}
+    plans = {strategy: list() for strategy in worlds}
+    for action in actions:
+        for strategy, world in worlds.items():
+            world.act(action)
+            planner = world.agent.planner
+            plans[strategy].append((planner.last_plan, planner.cur_node))
+
+    # The situations are tracked as by the robot.
+    world = worlds['greedy']
+    situations = get_situations(world)
+    assert [c for _, c in situations] == [
+        world.agent.get_state(i).cur_node
+        for i in range(1, world.num_states + 1)]
+
+    # The workers plan as the worlds' planners, side by side.
+    for max_workers in [1, 2]:
+        results = evaluate_strategies(
+            situations + situations, max_workers=max_workers)
+        assert len(results) == 2 * len(situations)
+        assert all(set(r) == {'greedy', 'optimal', 'pilot'} for r in results)
+        for strategy in worlds:
+            assert [r[strategy][0::2] for r in results[1:len(situations)]] \
+                == plans[strategy]
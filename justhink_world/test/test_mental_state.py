@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+import math
+
+from justhink_world import create_world
+from justhink_world.agent import Agent
+from justhink_world.domain.action import SuggestPickAction, AgreeAction
+
+
+def test_mental_state():
+    world = create_world('collaboration-1')
+    world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+    world.act(AgreeAction(agent=Agent.HUMAN))
+
+    mental_state = world.agent.cur_state
+    beliefs = mental_state.beliefs['me']
+    you = beliefs['you']['world']
+
+    # The view reads the arrays, in both directions of an edge.
+    assert you[0][3]['is_optimal'] == 1.0
+    assert you[3][0]['is_optimal'] == 1.0
+    assert beliefs['world'][0][3]['is_selected']
+    assert beliefs['world'][0][3]['n_human_agree'] == 1
+    assert 'n_human_agree' not in you[0][3]
+    assert len(beliefs['world'].edges(data=True)) \
+        == world.cur_state.network.graph.number_of_edges()
+
+    # Writing to the view updates the arrays, and a snapshot is separate.
+    snapshot = mental_state.copy()
+    you[0][3]['is_optimal'] = None
+    i = mental_state.get_edge_id(0, 3)
+    assert math.isnan(mental_state.is_optimal[1, i])
+    assert snapshot.beliefs['me']['you']['world'][0][3]['is_optimal'] == 1.0
+    assert snapshot.get_beliefs() != mental_state.get_beliefs()
+
+    # The previous mental states are left as they were.
+    assert world.agent.get_state(1).beliefs['me']['world'][0][3][
+        'n_human_agree'] == 0
+
+    graph = beliefs['world'].to_networkx()
+    assert graph[0][3]['is_selected']
+    assert graph.nodes[0]['text'] == beliefs['world'].nodes[0]['text']
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import copy
+import gc
+import pickle
+import random
+import weakref
+
+import pomdp_py
+
+from justhink_world import create_world, load_log
+from justhink_world.agent import Agent
+from justhink_world.domain import action as action_module
+from justhink_world.domain.action import PickAction, SuggestPickAction, \
+    AgreeAction, AttemptSubmitAction, SetPauseAction, SetStateAction, \
+    ResetAction, get_action, get_agent_action
+from justhink_world.models.policy_model import IndividualPolicyModel, \
+    CollaborativePolicyModel
+
+
+def test_action_space():
+    world = create_world('collaboration-1')
+    world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+    world.act(AgreeAction(agent=Agent.HUMAN))
+
+    policy_model = world.agent.policy_model
+    actions = policy_model.get_all_actions(state=world.cur_state)
+    expected = policy_model.build_available_actions(world.cur_state)
+
+    assert actions == expected
+    assert len(actions) == len(expected)
+    assert all(action in actions for action in expected)
+    assert PickAction((0, 3), agent=Agent.HUMAN) not in actions
+    assert SuggestPickAction((0, 3), agent=Agent.HUMAN) not in actions
+
+    picks = actions.get_actions(SuggestPickAction)
+    assert picks == {a for a in expected if isinstance(a, SuggestPickAction)}
+    assert AttemptSubmitAction in actions.get_types()
+
+    for u in world.cur_state.network.graph.nodes():
+        assert actions.touches(u) == any(u in a.edge for a in picks)
+
+
+def test_action_sampling():
+    world = create_world('collaboration-1')
+    state = world.cur_state
+    policy_model = world.agent.policy_model
+    actions = policy_model.get_all_actions(state=state)
+
+    assert [actions[i] for i in range(len(actions))] == list(actions)
+    assert actions[-1] == list(actions)[-1]
+
+    # Sampling is reproducible by the seed, and rollouts take the
+    # acting agents' actions only.
+    samples = list()
+    for _ in range(2):
+        policy_model.rng.seed(0)
+        samples.append([policy_model.rollout(state) for _ in range(20)])
+    assert samples[0] == samples[1]
+    assert all(a.agent in state.agents for a in samples[0])
+
+
+def test_pouct():
+    world = create_world('collaboration-1')
+    actions = world.agent.all_actions
+    planner = pomdp_py.POUCT(
+        max_depth=5, num_sims=20, rollout_policy=world.agent.policy_model)
+
+    action = planner.plan(world.agent.get_planning_agent())
+    assert action in actions
+    # Planning leaves the actions at the current state as they were.
+    assert world.agent.all_actions == actions
+    world.act(action)
+
+    # The mental history keeps its earlier name as well.
+    assert world.agent.history is world.agent.mental_history
+    assert world.agent.get_state(2) is world.agent.history[2]
+
+
+def test_agent_action():
+    for action, expected in [
+            (AgreeAction(agent=Agent.ROBOT), AgreeAction(agent=Agent.HUMAN)),
+            (SuggestPickAction((0, 3), agent=Agent.ROBOT),
+             SuggestPickAction((0, 3), agent=Agent.HUMAN)),
+            (SetPauseAction(True, agent=Agent.MANAGER),
+             SetPauseAction(True, agent=Agent.HUMAN))]:
+        action = get_agent_action(action, Agent.HUMAN)
+        assert action == expected
+        assert action is get_agent_action(expected, Agent.HUMAN)
+    assert get_agent_action(AgreeAction(), Agent.ROBOT) \
+        is get_action(AgreeAction, agent=Agent.ROBOT)
+
+
+def test_action_pool():
+    # Replaying a log again does not grow the pool.
+    log = load_log(1, 'collaboration-1')
+    sizes = list()
+    for _ in range(2):
+        world = create_world('collaboration-1')
+        for action in log[1::2]:
+            world.act(action)
+        sizes.append(len(action_module._action_pool))
+    assert sizes[0] == sizes[1]
+
+    # An action that sets a state is not pooled, not to keep the state.
+    state = world.cur_state.replace(is_paused=True)
+    action = get_agent_action(SetStateAction(state), Agent.HUMAN)
+    assert action.state is state and action.agent == Agent.HUMAN
+    assert len(action_module._action_pool) == sizes[1]
+    state_ref = weakref.ref(state)
+    del state, action
+    gc.collect()
+    assert state_ref() is None
+
+
+def test_action_slots():
+    state = create_world('pretest-1').cur_state
+    actions = [PickAction((3, 1)), SuggestPickAction((1, 4), Agent.ROBOT),
+               AgreeAction(), SetPauseAction(True), ResetAction(),
+               SetStateAction(state)]
+    for action in actions:
+        assert not hasattr(action, '__dict__')
+
+        # Copies and pickles keep the fields, hence equality and hashing.
+        for other in [copy.deepcopy(action),
+                      pickle.loads(pickle.dumps(action))]:
+            assert other == action and hash(other) == hash(action)
+            assert repr(other) == repr(action)
+            assert other.agent == action.agent
+    assert pickle.loads(pickle.dumps(actions[0])).edge == (3, 1)
+    assert PickAction((3, 1)) != PickAction((3, 1), Agent.ROBOT)
+
+    # Actions pickled by the pomdp_py base class, e.g. in the logs.
+    action = PickAction.__new__(PickAction)
+    action.__setstate__(
+        (actions[0].name, {'edge': (3, 1), 'agent': Agent.HUMAN}))
+    assert action == actions[0] and action.edge == (3, 1)
+
+
+def test_policy_model_frontier():
+    # Along random walks, the frontiers maintained incrementally match
+    # their rebuilds, and so do the actions in verification mode, also
+    # after a model switches to another layout.
+    rng = random.Random(0)
+    individual_model = IndividualPolicyModel(verify=True, seed=0)
+    for name, model in [
+            ('collaboration-1', CollaborativePolicyModel(verify=True, seed=0)),
+            ('pretest-1', individual_model), ('pretest-5', individual_model)]:
+        world = create_world(name)
+        transition_model = world.env.transition_model
+        state = world.cur_state
+        for _ in range(200):
+            network = state.network
+            assert network.frontier_mask == network.index.get_frontier_mask(
+                network.selected_mask)
+            model.update_available_actions(state)
+            if state.is_terminal or rng.random() < 0.02:
+                state = world.cur_state
+            else:
+                state = transition_model.sample(state, model.rollout(state))
+
+    # A stale action set fails the verification.
+    model.actions = model.get_action_space(world.cur_state)
+    try:
+        model._verify_available_actions(state.replace(is_terminal=True))
+    except AssertionError:
+        pass
+    else:
+        assert False, 'verification passed with stale actions'
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from justhink_world import create_world, solve_world
+from justhink_world.agent import Agent
+from justhink_world.domain.state import EnvState, NetworkState
+from justhink_world.models.human_model import HumanModel
+
+
+def create_small_collaboration(**kwargs):
+    graph = create_world('pretest-1').cur_state.network.graph
+    graph = graph.subgraph([0, 1, 3, 4, 5]).copy()
+    state = EnvState(
+        network=NetworkState(graph), agents=frozenset({Agent.ROBOT}),
+        attempt_no=1, max_attempts=3, is_paused=False)
+    return create_world('collaboration-1', history=[state], **kwargs)
+
+
+def test_solved_policy(tmp_path):
+    human_model = HumanModel.agreeing()
+    policy = solve_world(create_small_collaboration(),
+                         human_model=human_model, cache_dir=tmp_path)
+
+    # The robot follows the policy, with a human that always agrees.
+    world = create_small_collaboration(policy=policy)
+    planner = world.agent.planner
+    while not world.cur_state.is_terminal:
+        if Agent.ROBOT in world.cur_state.agents:
+            action = planner.plan(world.cur_state, planner.cur_node)
+            assert action in planner.last_explanation.best
+        else:
+            actions = [a for a in world.agent.all_actions
+                       if a.agent == Agent.HUMAN]
+            distribution = human_model.get_distribution(actions)
+            action = max(sorted(distribution), key=distribution.get)
+        world.act(action)
+    assert world.cur_state.network.is_mst()
+    assert world.cur_state.attempt_no == 1
+
+    # A second solution loads the same policy from the cache.
+    loaded = solve_world(create_small_collaboration(),
+                         human_model=human_model, cache_dir=tmp_path)
+    assert np.array_equal(loaded.policy, policy.policy)
+    assert np.allclose(loaded.values, policy.values)
+
+
+def test_solver_rewards(tmp_path):
+    # Running out of the attempts without an MST completes the activity by
+    # the world's rewards, and fails a submission by the solver's.
+    policy = solve_world(create_small_collaboration(), cache_dir=tmp_path)
+    compiled = policy.compiled
+    is_changed = policy.rewards != compiled.rewards
+    assert is_changed.any()
+    for i, j in zip(*np.nonzero(is_changed)):
+        state = compiled.get_state(i)
+        next_state = compiled.get_state(compiled.transitions[i, j])
+        assert next_state.is_terminal and not state.network.is_mst()
+        assert state.attempt_no == state.max_attempts
+        assert compiled.rewards[i, j] == 1000
+        assert policy.rewards[i, j] == state.network.get_cost()
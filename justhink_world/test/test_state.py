@@ -0,0 +1,649 @@
+#!/usr/bin/env python
+
+import copy
+import gc
+import json
+import pickle
+import random
+import time
+import weakref
+
+import networkx as nx
+from pqdict import PQDict
+
+from justhink_world import create_world, load_log
+from justhink_world.domain.action import PickAction, ClearAction, \
+    SuggestPickAction, AgreeAction, AttemptSubmitAction, ResetAction
+from justhink_world.domain.state import NetworkState, StateInternTable
+from justhink_world.domain.observation import Observation
+from justhink_world.agent import Agent
+from justhink_world.agent.reasoning import get_greedy_neighbor, \
+    get_prims_pick, NeighborCursors, PrimsFrontier, PlanCache, \
+    AnytimePlanner, SpeculativePlanner, TraversalJumpingPlanner, \
+    PrimsPlanner
+from justhink_world.models.transition_model import TransitionCache
+from justhink_world.tools.network import get_network_arrays, \
+    get_mst_edge_classes, compute_subgraph_cost, compute_edgelist_cost, \
+    compute_mst_cost, compute_total_cost, find_mst, is_subgraph_spanning, \
+    get_network_index, UnionFind
+
+
+def test_network_state_equality():
+    worlds = [create_world('pretest-1'), create_world('pretest-1')]
+    for world in worlds:
+        world.act(PickAction((3, 1)))
+        world.act(PickAction((1, 4)))
+
+    state, other = [world.cur_state for world in worlds]
+
+    assert state.network.graph is not other.network.graph
+    assert state == other
+    assert hash(state) == hash(other)
+    assert state != worlds[0].history[0]
+
+
+def test_network_index_attributes():
+    indices = [create_world(name).cur_state.network.index
+               for name in ['pretest-1', 'pretest-1', 'pretest-5']]
+
+    # The same topology with another layout has another attributes key.
+    assert indices[0] == indices[1] == indices[2]
+    assert indices[0].attributes_key == indices[1].attributes_key
+    assert indices[0].attributes_key != indices[2].attributes_key
+
+
+def test_state_intern_table():
+    table = StateInternTable()
+    worlds = [create_world(name, state_table=table)
+              for name in ['pretest-1', 'pretest-1', 'pretest-5']]
+    for world in worlds:
+        world.act(PickAction((3, 1)))
+
+    # The states of the same layout are shared, not of another layout.
+    states = [world.cur_state for world in worlds]
+    assert states[0] is states[1]
+    assert states[0] == states[2] and states[0] is not states[2]
+    assert states[2].network.graph is worlds[2].history[0].network.graph
+    assert states[2] in table and len(table) == 4
+
+
+def test_network_state_cost_and_spanning():
+    network = create_world('collaboration-1').cur_state.network
+    mst = network.get_mst()
+
+    for u, v in mst.edges():
+        assert not network.is_spanning()
+        network = network.with_edge(u, v)
+        assert network.get_cost() == sum(
+            network.graph[a][b]['cost'] for a, b in network.subgraph.edges())
+
+    assert network.is_spanning()
+    assert network.is_mst()
+    assert nx.is_connected(network.subgraph)
+
+    cleared = network.cleared()
+    assert cleared.get_cost() == 0
+    assert not cleared.is_spanning()
+    assert network.is_mst()
+
+
+def test_network_state_incremental():
+    network = create_world('collaboration-1').cur_state.network
+    graph = network.graph
+    mst_cost = compute_total_cost(find_mst(graph))
+    rng = random.Random(0)
+
+    # The maintained cost and connectivity match the networkx computations.
+    for _ in range(20):
+        edges = list(graph.edges())
+        rng.shuffle(edges)
+        selection = network.cleared()
+        for u, v in edges[:rng.randrange(len(edges) + 1)]:
+            selection = selection.with_edge(u, v)
+            subgraph = selection.subgraph
+            assert selection.get_cost() == compute_edgelist_cost(
+                graph, subgraph.edges())
+            spanning = is_subgraph_spanning(graph, subgraph)
+            assert selection.is_spanning() == spanning
+            assert selection.is_mst() == (
+                spanning and selection.get_cost() == mst_cost)
+        assert selection.get_mst_cost() == mst_cost
+
+
+def test_union_find():
+    rng = random.Random(0)
+    nodes = list(range(10))
+    components = UnionFind(nodes)
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    for _ in range(15):
+        u, v = rng.sample(nodes, 2)
+        merged = components.union(u, v)
+        assert merged != nx.has_path(graph, u, v)
+        graph.add_edge(u, v)
+        assert components.num_sets == nx.number_connected_components(graph)
+
+    # A copy is independent of its original.
+    other = components.copy()
+    other.add(10)
+    assert 10 in other and 10 not in components
+    assert len(other) == len(components) + 1
+
+
+def test_mst_cost_cache():
+    graph = nx.Graph()
+    graph.add_node(0, x=0)
+    graph.add_weighted_edges_from(
+        [(0, 1, 2), (1, 2, 1), (0, 2, 1), (2, 3, 5)], weight='cost')
+    assert compute_mst_cost(graph) == 7
+    index = get_network_index(graph)
+    assert get_network_index(graph) is index
+
+    # Another layout of the graph has another index, of the same topology.
+    other = graph.copy()
+    other.nodes[0]['x'] = 1
+    other_index = get_network_index(other)
+    assert other_index is not index and other_index == index
+    assert other_index.attributes_key != index.attributes_key
+    assert compute_mst_cost(other) == 7
+
+    # The index is evicted with its graph.
+    ref = weakref.ref(index)
+    del graph, index
+    gc.collect()
+    assert ref() is None
+    assert get_network_index(other) is other_index
+
+
+def test_network_state_pickling():
+    world = create_world('pretest-1')
+    world.act(PickAction((3, 1)))
+
+    state = pickle.loads(pickle.dumps(world.cur_state))
+
+    assert state == world.cur_state
+    assert state.network.get_cost() == world.cur_state.network.get_cost()
+
+
+def test_state_slots():
+    world = create_world('pretest-1')
+    world.act(PickAction((3, 1)))
+    state = world.cur_state
+    observation = Observation(state)
+    for obj in [state, state.network, observation]:
+        assert not hasattr(obj, '__dict__')
+        for other in [copy.deepcopy(obj), pickle.loads(pickle.dumps(obj))]:
+            assert other == obj and hash(other) == hash(obj)
+
+    # The equality is field-wise.
+    for changes in [dict(attempt_no=2), dict(is_paused=True),
+                    dict(agents=frozenset({Agent.ROBOT})),
+                    dict(network=state.network.cleared())]:
+        other = state.replace(**changes)
+        assert other != state and Observation(other) != observation
+    assert state.replace(step_no=state.step_no) == state
+
+    # States pickled by the pomdp_py base class, e.g. in the logs.
+    other = state.__class__.__new__(state.__class__)
+    other.__setstate__(({k: getattr(state, k) for k in state._fields},))
+    assert other == state
+
+
+def test_network_state_node_names(capsys):
+    network = create_world('collaboration-1').cur_state.network
+
+    assert network.get_node_id('Mount Montreux') == 6
+    assert network.get_node_id('montreux') == 6
+    assert network.get_node_id('Montreu') == 6
+    assert network.get_edge_ids(('Bern', 'Luzern')) == (3, 1)
+    assert network.get_node_id('Lausanne') is None
+
+    # An ambiguous name is reported, and resolved by the graph's order.
+    first = next(iter(network.graph.nodes()))
+    assert network.get_node_id('Mount') == first
+    assert network.get_node_id('') == first
+    assert network.get_node_id('  ') == first
+    capsys.readouterr()
+    assert network.get_node_id('Mount') == first
+    assert 'ambiguous' in capsys.readouterr().out
+
+
+def test_network_arrays():
+    graph = nx.gnm_random_graph(50, 200, seed=0)
+    for i, (u, v) in enumerate(graph.edges()):
+        graph[u][v]['cost'] = i % 7 + 1
+    network = NetworkState(graph)
+    for u, v in list(nx.minimum_spanning_tree(graph).edges())[:20]:
+        network = network.with_edge(u, v)
+
+    assert get_network_arrays(graph) is not None
+    assert compute_subgraph_cost(graph, network.subgraph) \
+        == compute_edgelist_cost(graph, network.subgraph.edges())
+
+    frontier = {frozenset((u, v)) for u in network.get_selected_nodes()
+                for v in graph.neighbors(u) if not network.has_edge(u, v)}
+    assert frontier == {frozenset(e) for e in network.get_frontier_edges()}
+
+    for u in graph.nodes():
+        costs = {v: graph[u][v]['cost'] for v in graph.neighbors(u)
+                 if not network.has_edge(u, v)}
+        min_nodes, other_nodes = get_greedy_neighbor(
+            graph, u, network.subgraph)
+        assert min_nodes == {v for v, c in costs.items()
+                             if c == min(costs.values())}
+        assert min_nodes | other_nodes == set(costs)
+
+
+def test_neighbor_cursors():
+    world = create_world('pretest-1')
+    network = world.cur_state.network
+    graph = network.graph
+    edges = list(nx.dfs_edges(network.get_mst(), source=3))
+
+    # The cursors move forward as the selection grows, and restart when
+    # it shrinks.
+    cursors = None
+    networks = [network]
+    for u, v in edges:
+        networks.append(networks[-1].with_edge(u, v))
+    for network in networks + networks[::-3]:
+        cursors = NeighborCursors.update(cursors, network)
+        for u in graph.nodes():
+            expected = get_greedy_neighbor(graph, u, network.subgraph)
+            assert cursors.get_min_neighbors(u) == expected
+            assert cursors.has_neighbors(u) == (len(expected[0]) > 0)
+
+
+def test_prims_frontier():
+    world = create_world('pretest-1')
+    network = world.cur_state.network
+    graph = network.graph
+    edges = list(nx.dfs_edges(network.get_mst(), source=3))
+
+    # The frontier grows with the selection, and restarts when it shrinks.
+    frontier = None
+    networks = [network]
+    for u, v in edges:
+        networks.append(networks[-1].with_edge(u, v))
+    for network in networks + networks[::-3]:
+        frontier = PrimsFrontier.update(frontier, network, 3)
+        min_edges, next_edges, other_edges = frontier.get_min_edges()
+        expl, expected = get_prims_pick(
+            graph, 3, network.subgraph.edges())
+        if expected is None:
+            assert min_edges == next_edges == [] and other_edges == set()
+            continue
+        assert set(min_edges) == set(expected)
+
+        # The frontier edges by the lowest, the next and the other costs.
+        nodes = network.get_selected_nodes() or {3}
+        assert set(min_edges) | set(next_edges) | other_edges == {
+            (u, v) for u in nodes for v in graph.neighbors(u)
+            if v not in nodes}
+        costs = [{graph.edges[e]['cost'] for e in group}
+                 for group in [min_edges, next_edges, other_edges]]
+        assert len(costs[0]) == 1 and len(costs[1]) <= 1
+        assert all(c > max(costs[0]) for c in costs[1] | costs[2])
+        assert all(c > max(costs[1]) for c in costs[2])
+
+
+def get_baseline_prims_pick(graph, start, edges):
+    """Pick as get_prims_pick() did before the persistent frontier."""
+    closed_set = {u for tup in edges for u in tup}
+    if len(closed_set) == 0:
+        closed_set = closed_set.union({start})
+
+    pq = PQDict()
+    others = set()
+    for u in closed_set:
+        for v in graph.neighbors(u):
+            if u not in closed_set or v not in closed_set:
+                pq.additem((u, v), graph.edges[u, v]['cost'])
+                others.add((u, v))
+    if len(pq) == 0:
+        return None, others
+
+    edge, min_weight = pq.popitem()
+    others.discard(edge)
+    min_edges = [edge]
+    while len(pq) > 0:
+        edge, weight = pq.popitem()
+        others.discard(edge)
+        if weight == min_weight:
+            min_edges.append(edge)
+        else:
+            break
+    return min_edges, others
+
+
+def test_prims_planner_baseline():
+    # On the built-in worlds, the planner explains as the baseline pick.
+    rng = random.Random(0)
+    for name in ['pretest-1', 'pretest-3', 'collaboration-1',
+                 'collaboration-2', 'posttest-5']:
+        state = create_world(name).cur_state
+        network = state.network
+        index = network.index
+        masks = [rng.getrandbits(len(index.edges)) for _ in range(50)]
+        mst_edges = list(nx.dfs_edges(network.get_mst(), source=3))
+        masks += [index.get_mask(mst_edges[:k])
+                  for k in range(len(mst_edges) + 1)]
+
+        planner = PrimsPlanner(state)
+        for mask in masks:
+            network = state.network.replace(selected_mask=mask)
+            expected, expected_others = get_baseline_prims_pick(
+                network.graph, 3, network.subgraph.edges())
+            expl, min_edges = get_prims_pick(
+                network.graph, 3, network.subgraph.edges())
+            assert min_edges == expected and expl.others == expected_others
+
+            planner.plan(state.replace(network=network), 3)
+            expl = planner.last_explanation
+            if expected is None:
+                assert isinstance(planner.last_plan, AttemptSubmitAction)
+                continue
+            assert {a.edge for a in expl.best} == set(expected)
+            assert {a.edge for a in expl.others} == expected_others
+
+
+def test_mst_edge_classes():
+    # A triangle of ties, a pendant edge, and a costlier edge on a cycle.
+    graph = nx.Graph()
+    graph.add_edges_from([(0, 1), (1, 2), (0, 2)], cost=1)
+    graph.add_edge(2, 3, cost=2)
+    graph.add_edge(3, 0, cost=3)
+    classes = get_mst_edge_classes(graph)
+    index = NetworkState(graph).index
+
+    def get_edges(ids):
+        return {frozenset(index.edges[i]) for i in ids}
+
+    some = [i for i in range(5) if classes.is_in_some_mst(i)]
+    every = [i for i in range(5) if classes.is_in_every_mst(i)]
+    assert get_edges(some) == get_edges(
+        [index.edge_ids[e] for e in [(0, 1), (1, 2), (0, 2), (2, 3)]])
+    assert get_edges(every) == {frozenset((2, 3))}
+    assert classes.mst_cost == compute_mst_cost(graph) == 4
+
+    ids, num_edges = classes.get_tie_class(index.edge_ids[(0, 1)])
+    assert get_edges(ids) == get_edges(some) - get_edges(every)
+    assert num_edges == 2
+    assert classes.get_tie_class(index.edge_ids[(2, 3)]) is None
+
+    network = create_world('pretest-1').cur_state.network
+    mst = network.get_mst()
+    assert all(network.is_mst_edge(u, v) == mst.has_edge(u, v)
+               for u, v in network.graph.edges())
+
+
+def test_world_history_checkpoints():
+    world = create_world('pretest-1', checkpoint_interval=3)
+    edges = list(nx.dfs_edges(world.cur_state.network.get_mst(), source=3))
+    for edge in edges:
+        world.act(PickAction(edge))
+
+    history = world.history
+    assert len(history) == 2 * len(edges) + 1
+    assert history.num_checkpoints < history.num_states
+    states = list(history)[::2]
+    for i in [12, 2, 8, 0, 6, 4]:
+        assert history[i] == states[i // 2]
+
+    # Acting at an earlier state drops the later states.
+    world.state_no = 3
+    world.act(ClearAction())
+    assert world.num_states == 4
+    assert history[4] == states[2]
+    assert history[6].network.get_cost() == 0
+
+
+def test_world_history_transitions():
+    world = create_world('pretest-1', checkpoint_interval=3)
+    model = world.env.transition_model
+    sample = model._sample
+    samples = list()
+
+    def counting_sample(state, action):
+        samples.append(action)
+        return sample(state, action)
+
+    # Acting transitions once: the history trusts the transition.
+    model._sample = counting_sample
+    for edge in [(3, 1), (1, 4), (4, 5), (5, 6)]:
+        world.act(PickAction(edge))
+    assert len(samples) == 4
+    assert world.history.num_checkpoints == 2
+    assert world.history[6] == list(world.history)[6]
+
+
+def test_world_history_log():
+    # The states of a log differ from their replays by the step numbers.
+    log = load_log(1, 'collaboration-1')
+    world = create_world('collaboration-1', history=log)
+    history = world.history
+    assert history.num_states == (len(log) + 1) // 2
+    assert history.num_checkpoints < history.num_states // 4
+    for k in [5, 0, history.num_states - 2, 7]:
+        assert repr(history[2 * k]) == repr(log[2 * k])
+        assert history[2 * k].step_no == log[2 * k].step_no
+    assert list(history) == list(log)
+
+
+def test_collaborative_reset():
+    world = create_world('collaboration-1')
+    for action in [SuggestPickAction((1, 2), agent=Agent.ROBOT),
+                   AgreeAction(agent=Agent.HUMAN)]:
+        world.act(action)
+    state = world.cur_state.replace(
+        attempt_no=2, agents=frozenset({Agent.HUMAN}), is_terminal=True)
+    assert state.network.subgraph.number_of_edges() == 1
+
+    # Resetting clears the network and restarts the attempts.
+    model = world.env.transition_model
+    next_state = model.sample(state, ResetAction())
+    assert next_state.network.subgraph.number_of_edges() == 0
+    assert next_state.attempt_no == 1
+    assert next_state.agents == frozenset({Agent.ROBOT})
+    assert not next_state.is_terminal
+    assert next_state.network.graph is state.network.graph
+    assert state.network.subgraph.number_of_edges() == 1
+
+
+def test_transition_cache():
+    cache = TransitionCache(max_size=2)
+    worlds = [create_world('pretest-1', transition_cache=cache)
+              for _ in range(2)]
+    for world in worlds:
+        world.act(PickAction((3, 1)))
+        world.act(PickAction((1, 4)))
+
+    assert worlds[0].cur_state is worlds[1].cur_state
+    assert cache.num_misses == 2 and cache.num_hits >= 2
+    assert len(cache) == 2
+
+    model = worlds[0].env.transition_model
+    model.sample(worlds[0].cur_state, ClearAction())
+    assert len(cache) == 2 and cache.num_misses == 3
+
+    # The worlds of the same topology with another layout keep their graphs.
+    cache = TransitionCache()
+    worlds = [create_world(name, transition_cache=cache)
+              for name in ['pretest-1', 'pretest-5']]
+    for world in worlds:
+        world.act(PickAction((3, 1)))
+        assert world.cur_state.network.graph \
+            is world.history[0].network.graph
+    assert cache.num_misses == 2
+
+
+def test_plan_cache():
+    cache = PlanCache(max_size=100)
+    worlds = [create_world('collaboration-1', agent_strategy=strategy,
+                           plan_cache=cache)
+              for strategy in ['greedy', 'optimal', 'greedy']]
+    for world in worlds:
+        world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+        world.act(AgreeAction(agent=Agent.HUMAN))
+
+    # The strategies are cached apart, and the plans are shared.
+    num_plans = len(cache)
+    assert cache.num_misses == num_plans and cache.num_hits == num_plans // 2
+    planners = [world.agent.planner for world in worlds]
+    assert planners[0].last_explanation is planners[2].last_explanation
+    assert planners[0].last_explanation is not planners[1].last_explanation
+    assert planners[0].cur_node == planners[2].cur_node
+
+
+def test_anytime_planner():
+    worlds = {strategy: create_world('collaboration-1',
+                                     agent_strategy=strategy)
+              for strategy in ['greedy', 'optimal']}
+    worlds['fallback'] = create_world(
+        'collaboration-1', agent_strategy='anytime', deadline_ms=0)
+    worlds['anytime'] = create_world(
+        'collaboration-1', agent_strategy='anytime', deadline_ms=1000)
+    worlds['default'] = create_world(
+        'collaboration-1', agent_strategy='anytime')
+    for world in worlds.values():
+        world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+        world.act(AgreeAction(agent=Agent.HUMAN))
+
+    # The fallback plans within no budget, the best planner otherwise: with
+    # the default planners and budget, as the optimal strategy.
+    planners = {k: world.agent.planner for k, world in worlds.items()}
+    assert isinstance(planners['anytime'], AnytimePlanner)
+    for key, expected in [('fallback', 'greedy'), ('anytime', 'optimal'),
+                          ('default', 'optimal')]:
+        planner = planners[key]
+        assert planner.last_plan == planners[expected].last_plan
+        assert planner.cur_node == planners[expected].cur_node
+        expl = planners[expected].last_explanation
+        assert planner.last_explanation.best == expl.best
+        assert planner.last_explanation.others == expl.others
+        assert worlds[key].agent.cur_state.get_beliefs() \
+            == worlds[expected].agent.cur_state.get_beliefs()
+
+    assert planners['fallback'].last_info['num_completed'] == 1
+    assert not planners['fallback'].last_info['is_complete']
+    assert planners['anytime'].last_info['planner'] == 'PrimsPlanner'
+    assert planners['anytime'].last_info['is_complete']
+
+
+class ColdStartPlanner(PrimsPlanner):
+    """A planner that is slow at its first plan only."""
+
+    def plan(self, state, cur_node):
+        if self.last_plan is None:
+            time.sleep(0.2)
+        return super().plan(state, cur_node)
+
+
+def test_anytime_planner_recovers():
+    state = create_world('collaboration-1').cur_state
+    planner = AnytimePlanner(
+        state, deadline_ms=50,
+        planners=[TraversalJumpingPlanner(state), ColdStartPlanner(state)])
+
+    # The slow first run delays the refinement for a few plans only.
+    infos = list()
+    for _ in range(8):
+        planner.plan(state, 3)
+        infos.append(planner.last_info)
+    assert infos[0]['is_complete']
+    assert not infos[1]['is_complete']
+    assert all(info['is_complete'] for info in infos[-3:])
+
+
+def test_speculative_planner():
+    worlds = [create_world('collaboration-1', agent_strategy='optimal',
+                           speculative=speculative)
+              for speculative in [True, False]]
+    planner = worlds[0].agent.planner
+    assert isinstance(planner, SpeculativePlanner)
+
+    for action in [SuggestPickAction((0, 3), agent=Agent.ROBOT),
+                   AgreeAction(agent=Agent.HUMAN),
+                   SuggestPickAction((3, 1), agent=Agent.HUMAN)]:
+        for world in worlds:
+            world.act(action)
+        # The speculative world plans and believes as the other.
+        planners = [world.agent.planner for world in worlds]
+        assert planners[0].last_plan == planners[1].last_plan
+        assert planners[0].cur_node == planners[1].cur_node
+        assert planners[0].last_explanation.best \
+            == planners[1].last_explanation.best
+        assert worlds[0].agent.cur_state.get_beliefs() \
+            == worlds[1].agent.cur_state.get_beliefs()
+
+    # The human's actions were speculated, and the stale ones dropped.
+    assert planner.num_speculations > 2
+    assert planner.num_hits + planner.num_misses == 2
+    assert planner.num_pending == 0
+    worlds[0].close()
+
+
+class FailingPlanner(PrimsPlanner):
+    def plan(self, state, cur_node):
+        raise RuntimeError('Planning failed.')
+
+
+def test_speculative_planner_errors(capsys):
+    state = create_world('collaboration-1').cur_state
+    with SpeculativePlanner(
+            PrimsPlanner(state),
+            create_planner=lambda: FailingPlanner(state)) as planner:
+        # A failed speculation is reported, and planned synchronously.
+        planner.speculate([(state, 3)])
+        assert isinstance(planner.plan(state, 3), SuggestPickAction)
+        assert planner.num_misses == 1
+        for _ in range(100):
+            if planner.num_errors > 0:
+                break
+            time.sleep(0.01)
+    assert planner.num_errors == 1
+    assert 'Planning failed.' in capsys.readouterr().out
+
+
+def test_speculative_planner_shutdown():
+    # The workers stop when the world is closed, or not referenced anymore.
+    for is_closed in [True, False]:
+        world = create_world('collaboration-1', speculative=True)
+        world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+        threads = list(world.agent.planner._executor._threads)
+        assert len(threads) > 0
+        if is_closed:
+            with world:
+                pass
+        del world
+        gc.collect()
+        for thread in threads:
+            thread.join(timeout=5)
+            assert not thread.is_alive()
+
+def test_stage_timing(tmp_path):
+    world = create_world('collaboration-1', timed=True)
+    assert create_world('collaboration-1').stats() == dict()
+
+    world.act(SuggestPickAction((0, 3), agent=Agent.ROBOT))
+    world.act(AgreeAction(agent=Agent.HUMAN))
+    world.act(AgreeAction(agent=Agent.HUMAN))
+
+    # The infeasible action is validated only.
+    stats = world.stats()
+    assert stats['act.validate']['count'] == 3
+    assert stats['act']['count'] == 2
+    assert 'act.rebase' not in stats
+    # Including the robot's observation at the start.
+    assert stats['update_belief.plan']['count'] == 3
+    for s in stats.values():
+        assert s['min_ms'] <= s['mean_ms'] <= s['max_ms']
+        assert sum(s['histogram_us'].values()) == s['count']
+    assert stats['act']['total_ms'] >= sum(
+        stats['act.{}'.format(k)]['total_ms']
+        for k in ['transition', 'observe', 'update_belief'])
+
+    file = tmp_path / 'stats.json'
+    world.save_stats(file)
+    with open(file) as handle:
+        assert json.load(handle) == stats
@@ -0,0 +1,400 @@
+"""Benchmark the hot paths of the worlds, headless.
+
+The suite measures creating the worlds, acting in them (by world type and
+action mix), updating the available actions, planning (by planner type),
+updating the robot's beliefs, replaying the logs, and planning with
+pomdp_py's POUCT. The results are written as JSON, and can be compared
+against a baseline to flag the regressions. Without a display, disable
+pyglet's shadow window (created when the package is imported), e.g.
+
+PYGLET_SHADOW_WINDOW=0 python -m justhink_world.tools.benchmark \\
+    --output results.json --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import pomdp_py
+
+from .._version import __version__
+from ..agent.reasoning import \
+    TraversalPlanner, TraversalJumpingPlanner, PrimsPlanner
+from ..domain.action import PickAction, SuggestPickAction, AgreeAction
+from ..domain.observation import Observation
+from ..world import create_world
+from .read import load_all_logs
+
+
+# A world of each type.
+WORLD_NAMES = ['intro', 'tutorial', 'pretest-1', 'robot-individual-1',
+               'collaboration-1']
+
+# The action mixes to act by, i.e. any action of the acting agents, or
+# preferably the actions that build the network.
+ACTION_MIXES = ['random', 'picks']
+
+# The default relative slowdown to flag as a regression.
+DEFAULT_THRESHOLD = 0.2
+
+
+def benchmark_create_world(names=WORLD_NAMES, repeat=5):
+    """Measure the latency of create_world() per world (in ms)."""
+    results = dict()
+    for name in names:
+        times = list()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            create_world(name)
+            times.append(time.perf_counter() - start)
+        results['create_world/{}'.format(name)] = \
+            (1000 * statistics.median(times), 'ms')
+    return results
+
+
+def benchmark_act(names=WORLD_NAMES, num_steps=200, seed=0):
+    """Measure the throughput of World.act() per world type and action
+    mix (in actions per second)."""
+    results = dict()
+    for name in names:
+        for mix in ACTION_MIXES:
+            world, _, times = _walk(name, num_steps, mix=mix, seed=seed)
+            results['act/{}/{}'.format(
+                world.__class__.__name__, mix)] = \
+                (len(times) / sum(times), '/s')
+    return results
+
+
+def benchmark_policy_update(names=WORLD_NAMES, num_steps=200, seed=0):
+    """Measure the cost of updating the available actions per world type
+    (in microseconds), at the states of a walk."""
+    results = dict()
+    for name in names:
+        world, walk, _ = _walk(name, num_steps, mix='picks', seed=seed)
+        policy_model = world.agent.policy_model
+        states = [state for _, state in walk]
+        start = time.perf_counter()
+        for state in states:
+            policy_model.update_available_actions(state)
+        elapsed = time.perf_counter() - start
+        results['policy_update/{}'.format(world.__class__.__name__)] = \
+            (1e6 * elapsed / len(states), 'us')
+    return results
+
+
+def benchmark_planners(name='collaboration-1', num_steps=200, seed=0):
+    """Measure the latency of the planners' plan() per planner type (in
+    microseconds), at the states of a walk in a world."""
+    world, walk, _ = _walk(name, num_steps, mix='picks', seed=seed)
+    states = [state for _, state in walk]
+    agent = world.agent
+    cur_node = agent.cur_state.cur_node
+
+    results = dict()
+    for planner_type in [TraversalPlanner, TraversalJumpingPlanner,
+                         PrimsPlanner]:
+        planner = planner_type(states[0])
+        elapsed = 0
+        for state in states:
+            if planner_type is TraversalPlanner:
+                # Plans at the agent's belief and mental state instead.
+                agent.set_belief(pomdp_py.Histogram({state: 1.0}))
+                start = time.perf_counter()
+                planner.plan(agent)
+            else:
+                start = time.perf_counter()
+                planner.plan(state, cur_node)
+            elapsed += time.perf_counter() - start
+        results['plan/{}'.format(planner_type.__name__)] = \
+            (1e6 * elapsed / len(states), 'us')
+    return results
+
+
+def benchmark_update_belief(name='collaboration-1', num_steps=200, seed=0):
+    """Measure the cost of the robot's update_belief() (in microseconds),
+    by replaying the transitions of a walk in a world."""
+    _, walk, _ = _walk(name, num_steps, mix='picks', seed=seed)
+
+    elapsed = 0
+    num_updates = 0
+    for action, state in walk:
+        if action is None:
+            agent = create_world(name).agent
+            continue
+        observation = Observation(state)
+        start = time.perf_counter()
+        agent.update_belief(observation, action)
+        elapsed += time.perf_counter() - start
+        num_updates += 1
+    return {'update_belief/{}'.format(name):
+            (1e6 * elapsed / num_updates, 'us')}
+
+
+def benchmark_log_replay(max_logs=None):
+    """Measure the throughput of replaying the logs' actions in fresh
+    worlds (in actions per second)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        logs = load_all_logs()
+
+    histories = [(name, history) for sample in logs.values()
+                 for name, history in sample.items() if name != 'tutorial']
+    histories = histories[:max_logs]
+
+    num_actions = 0
+    start = time.perf_counter()
+    # The logs may have actions that are not feasible anymore: quietly.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, history in histories:
+            world = create_world(name)
+            for action in history[1::2]:
+                world.act(action)
+                num_actions += 1
+    elapsed = time.perf_counter() - start
+
+    return {'log_replay': (num_actions / elapsed, '/s')}
+
+
+def benchmark_pouct(name, num_sims=100, max_depth=10, num_turns=5,
+                    discount_factor=0.95, seed=0):
+    """Plan with POUCT for a number of turns in a world, acting with the
+    planned action at each turn.
+
+    Args:
+        name (str): The name of the world, e.g. 'collaboration-1'.
+        num_sims (int, optional): The number of simulations per turn.
+        max_depth (int, optional): The maximum depth of a simulation.
+        num_turns (int, optional): The maximum number of turns to plan
+            for, i.e. unless the world reaches a terminal state earlier.
+        discount_factor (float, optional): The discount factor.
+        seed (int, optional): The seed of the random number generators.
+
+    Returns:
+        dict: the results, e.g. the simulations per second and the mean
+            planning time per turn (in seconds).
+    """
+    random.seed(seed)
+    world = create_world(name)
+    world.agent.policy_model.rng.seed(seed)
+    planner = pomdp_py.POUCT(
+        max_depth=max_depth, num_sims=num_sims,
+        discount_factor=discount_factor,
+        rollout_policy=world.agent.policy_model)
+
+    plan_times = list()
+    total_sims = 0
+    for _ in range(num_turns):
+        if world.cur_state.is_terminal:
+            break
+        # Plan from scratch, without reusing the previous turn's tree.
+        agent = world.agent.get_planning_agent()
+        agent.tree = None
+
+        start = time.perf_counter()
+        action = planner.plan(agent)
+        plan_times.append(time.perf_counter() - start)
+        total_sims += planner.last_num_sims
+
+        world.act(action)
+
+    total_time = sum(plan_times)
+    return {
+        'world': name,
+        'world_type': world.__class__.__name__,
+        'num_turns': len(plan_times),
+        'num_sims': total_sims,
+        'sims_per_second': total_sims / total_time if total_time else 0,
+        'plan_time': total_time / len(plan_times) if plan_times else 0,
+    }
+
+
+def benchmark_pouct_worlds(names=WORLD_NAMES, num_sims=100, seed=0):
+    """Measure POUCT's simulations per second and planning time per turn
+    (in ms) per world type, see benchmark_pouct()."""
+    results = dict()
+    for name in names:
+        result = benchmark_pouct(name, num_sims=num_sims, seed=seed)
+        key = 'pouct/{}'.format(result['world_type'])
+        results[key + '/sims'] = (result['sims_per_second'], '/s')
+        results[key + '/plan'] = (1000 * result['plan_time'], 'ms')
+    return results
+
+
+def run(benchmarks=None, quick=False, seed=0, verbose=False):
+    """Run the benchmarks, all of them by default.
+
+    Args:
+        benchmarks (list, optional): The names of the benchmarks to run,
+            from BENCHMARKS.
+        quick (bool, optional): Whether to run fewer repetitions, e.g.
+            for a smoke test.
+        seed (int, optional): The seed of the random number generators.
+        verbose (bool, optional): Whether to print progress.
+
+    Returns:
+        dict: the results by metric name, with a value and a unit each.
+    """
+    if benchmarks is None:
+        benchmarks = list(BENCHMARKS)
+    num_steps = 20 if quick else 200
+
+    results = dict()
+    for name in benchmarks:
+        if verbose:
+            print('Running {} ...'.format(name))
+        if name == 'create_world':
+            result = benchmark_create_world(repeat=1 if quick else 5)
+        elif name == 'log_replay':
+            result = benchmark_log_replay(max_logs=5 if quick else None)
+        elif name == 'pouct':
+            result = benchmark_pouct_worlds(
+                num_sims=10 if quick else 100, seed=seed)
+        else:
+            result = BENCHMARKS[name](num_steps=num_steps, seed=seed)
+        results.update({k: {'value': v, 'unit': u}
+                        for k, (v, u) in result.items()})
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare the results against a baseline.
+
+    The change of a metric is its relative slowdown, e.g. 0.5 for taking
+    1.5 times as long, or for a 1.5 times lower throughput (for the units
+    per second). The metrics that are not in both are left out.
+
+    Returns:
+        list: the (name, baseline value, value, change, is regression)
+            tuples.
+    """
+    rows = list()
+    for name in sorted(set(results) & set(baseline)):
+        value, base = results[name]['value'], baseline[name]['value']
+        if value <= 0 or base <= 0:
+            continue
+        if results[name]['unit'].endswith('/s'):
+            change = base / value - 1
+        else:
+            change = value / base - 1
+        rows.append((name, base, value, change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the hot paths of the worlds.')
+    parser.add_argument('benchmarks', nargs='*', help='the benchmarks to'
+                        ' run, from {} (default all)'.format(
+                            ', '.join(BENCHMARKS)))
+    parser.add_argument('--output', help='the JSON file to write to')
+    parser.add_argument('--baseline', help='a JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='the relative slowdown to flag (default 0.2)')
+    parser.add_argument('--quick', action='store_true',
+                        help='run fewer repetitions')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+
+    results = run(args.benchmarks or None, quick=args.quick, seed=args.seed,
+                  verbose=True)
+    report = {
+        'metadata': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    print()
+    print('{:<48} {:>12} {:>4}'.format('Metric', 'Value', 'Unit'))
+    for name, result in sorted(results.items()):
+        print('{:<48} {:>12.1f} {:>4}'.format(
+            name, result['value'], result['unit']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('Written to {}'.format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        rows = compare(results, baseline, threshold=args.threshold)
+
+        print()
+        print('{:<48} {:>12} {:>12} {:>8}'.format(
+            'Metric', 'Baseline', 'Value', 'Change'))
+        for name, base, value, change, is_regression in rows:
+            print('{:<48} {:>12.1f} {:>12.1f} {:>+7.0%}{}'.format(
+                name, base, value, change,
+                ' REGRESSION' if is_regression else ''))
+
+        num_regressions = sum(row[-1] for row in rows)
+        if num_regressions > 0:
+            print('{} regression(s) over {:.0%}.'.format(
+                num_regressions, args.threshold))
+            sys.exit(1)
+
+
+def _walk(name, num_steps, mix='random', seed=0):
+    """Walk in a world by an action mix, timing each World.act() call.
+
+    A new world is created (untimed) whenever the world terminates.
+
+    Returns:
+        tuple: the last world, the (action, state) pairs of the walk, with
+            (None, initial state) at the start and after each new world,
+            and the times of the acts.
+    """
+    rng = random.Random(seed)
+    world = create_world(name)
+    walk = [(None, world.cur_state)]
+    times = list()
+    while len(times) < num_steps:
+        state = world.cur_state
+        actions = world.agent.policy_model.get_all_actions(state=state)
+        if len(actions.for_agents(state.agents)) > 0:
+            actions = actions.for_agents(state.agents)
+        if mix == 'picks':
+            picks = [a for a in actions if isinstance(
+                a, (PickAction, SuggestPickAction, AgreeAction))]
+            if len(picks) > 0:
+                actions = sorted(picks)
+        action = actions[rng.randrange(len(actions))]
+
+        start = time.perf_counter()
+        world.act(action)
+        times.append(time.perf_counter() - start)
+        walk.append((action, world.cur_state))
+
+        if world.cur_state.is_terminal:
+            world = create_world(name)
+            walk.append((None, world.cur_state))
+    return world, walk, times
+
+
+# The benchmarks by their names.
+BENCHMARKS = {
+    'create_world': benchmark_create_world,
+    'act': benchmark_act,
+    'policy_update': benchmark_policy_update,
+    'plan': benchmark_planners,
+    'update_belief': benchmark_update_belief,
+    'log_replay': benchmark_log_replay,
+    'pouct': benchmark_pouct_worlds,
+}
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,27 @@
+import bisect
+import difflib
+import hashlib
+import threading
+import weakref
+
 import networkx as nx
+import numpy as np
+
+
+# The minimum number of edges for a graph to use its array-backed view:
+# on smaller graphs (e.g. the activity's networks), the overhead of numpy
+# calls outweighs walking the graph's dictionaries.
+ARRAY_MIN_EDGES = 64
+
+# Cache of the network indices, per (background) graph and weight key.
+_network_index_cache = weakref.WeakKeyDictionary()
+
+# Cache of the node name indices, per (background) graph and name key.
+_name_index_cache = weakref.WeakKeyDictionary()
+
+# The lock to build the indices in the caches above and their views once,
+# also by the threads that plan in the background (see SpeculativePlanner).
+_cache_lock = threading.RLock()
 
 
 def is_edgelist_spanning(graph, edges) -> bool:
@@ -44,6 +67,24 @@ def find_mst(graph, edge_weight_key='cost') -> nx.Graph:
     return nx.minimum_spanning_tree(graph, weight=edge_weight_key)
 
 
+def compute_mst_cost(graph, edge_weight_key='cost') -> float:
+    """Compute the cost of a minimum-spanning tree for a given graph.
+
+    The cost is computed once per graph and weight key, and cached for the
+    lifetime of the graph: the graph is assumed not to change afterwards.
+
+    Args:
+        graph (nx.Graph): The graph with a cost function on edges.
+        edge_weight_key (str, optional): The attribute key for the weight.
+            Defaults to 'cost'.
+
+    Returns:
+        float: the cost.
+    """
+    return get_network_index(
+        graph, edge_weight_key=edge_weight_key).get_mst_cost()
+
+
 def compute_total_cost(graph, edge_weight_key='cost') -> float:
     """Compute the total cost for a given graph.
 
@@ -55,6 +96,9 @@ def compute_total_cost(graph, edge_weight_key='cost') -> float:
     Returns:
         float: the cost.
     """
+    arrays = _get_cached_network_arrays(graph, edge_weight_key)
+    if arrays is not None:
+        return arrays.get_total_cost()
     return sum([d[edge_weight_key] for u, v, d in graph.edges(data=True)])
 
 
@@ -81,6 +125,10 @@ def compute_subgraph_cost(graph, subgraph, edge_weight_key='cost') -> float:
     Returns:
         float: the cost.
     """
+    arrays = _get_cached_network_arrays(graph, edge_weight_key)
+    if arrays is not None:
+        index = _network_index_cache[graph][edge_weight_key]
+        return arrays.get_cost(index.get_mask(subgraph.edges))
     return compute_edgelist_cost(
         graph, subgraph.edges, edge_weight_key=edge_weight_key)
 
@@ -97,3 +145,710 @@ def in_edgelist(u, v, edges) -> bool:
         bool: True if exists, False otherwise.
     """
     return (u, v) in edges or (v, u) in edges
+
+
+class UnionFind(object):
+    """A disjoint-set forest with path compression and union by rank.
+
+    Used to maintain the connected components of a selection subgraph
+    incrementally, as edges are added to it.
+
+    Attributes:
+        num_sets (int):
+            the number of disjoint sets, e.g. connected components
+    """
+
+    def __init__(self, elements=()):
+        self._parent = dict()
+        self._rank = dict()
+        self.num_sets = 0
+        for u in elements:
+            self.add(u)
+
+    def __contains__(self, u):
+        return u in self._parent
+
+    def __len__(self):
+        return len(self._parent)
+
+    def __deepcopy__(self, memo):
+        # The elements are immutable (e.g. node ids): copy the forest only.
+        return self.copy()
+
+    def copy(self):
+        """Create a copy of the disjoint sets."""
+        result = self.__class__()
+        result._parent = self._parent.copy()
+        result._rank = self._rank.copy()
+        result.num_sets = self.num_sets
+        return result
+
+    def add(self, u):
+        """Add an element as a singleton set, if it is not in a set yet."""
+        if u not in self._parent:
+            self._parent[u] = u
+            self._rank[u] = 0
+            self.num_sets += 1
+
+    def find(self, u):
+        """Find the representative of the set that contains u."""
+        root = u
+        while self._parent[root] != root:
+            root = self._parent[root]
+        # Compress the path from u to the root.
+        while self._parent[u] != root:
+            self._parent[u], u = root, self._parent[u]
+        return root
+
+    def union(self, u, v) -> bool:
+        """Merge the sets that contain u and v.
+
+        Returns:
+            bool: True if two different sets are merged, False otherwise.
+        """
+        ru, rv = self.find(u), self.find(v)
+        if ru == rv:
+            return False
+        if self._rank[ru] < self._rank[rv]:
+            ru, rv = rv, ru
+        self._parent[rv] = ru
+        if self._rank[ru] == self._rank[rv]:
+            self._rank[ru] += 1
+        self.num_sets -= 1
+        return True
+
+    def is_connected(self, u, v) -> bool:
+        """Check if u and v are in the same set."""
+        return self.find(u) == self.find(v)
+
+
+def get_network_index(graph, edge_weight_key='cost'):
+    """Get the index of a graph, built once and cached for the graph.
+
+    The graph is assumed not to change after its index is built.
+
+    Args:
+        graph (nx.Graph): The graph with a cost function on edges.
+        edge_weight_key (str, optional): The attribute key for the weight.
+            Defaults to 'cost'.
+
+    Returns:
+        NetworkIndex: the index of the graph.
+    """
+    index = _network_index_cache.get(graph, {}).get(edge_weight_key)
+    if index is None:
+        with _cache_lock:
+            indices = _network_index_cache.setdefault(graph, dict())
+            index = indices.get(edge_weight_key)
+            if index is None:
+                index = NetworkIndex(graph, edge_weight_key=edge_weight_key)
+                indices[edge_weight_key] = index
+    return index
+
+
+class NetworkIndex(object):
+    """A class to index the edges of a (background) graph by integers.
+
+    Edges are numbered in a canonical order, so that graphs with the same
+    nodes, edges and costs have the same index, regardless of the order
+    they are constructed in. A set of edges is then encoded as a bitmask
+    where bit i is set if edge i is in the set, e.g. to represent a
+    selection, with fast set operations, hashing and equality.
+
+    Note:
+        The index does not keep a reference to its graph, so that it can be
+        cached for as long as the graph is alive.
+
+    Attributes:
+        edges (list):
+            the edges by their ids, each as a node pair (u, v)
+        edge_ids (dict):
+            the edge id of each edge, in both directions (u, v) and (v, u)
+        costs (list):
+            the costs of the edges by their ids
+        incident_masks (dict):
+            the bitmask of the edges incident to each node
+        key (tuple):
+            a hashable value to compare graphs, from their nodes, edges
+            and costs only, i.e. by their topology: e.g. the plans and the
+            MSTs depend only on these, while the graphs of different worlds
+            may share a key with different layouts
+        attributes_key (str):
+            a digest of all the attributes of the graph, its nodes and its
+            edges (e.g. the layout and the node names), to tell apart the
+            graphs of the same key, e.g. of different worlds
+    """
+
+    def __init__(self, graph, edge_weight_key='cost'):
+        self.edge_weight_key = edge_weight_key
+
+        self.edges = _sort_canonically(
+            [_sort_canonically([u, v]) for u, v in graph.edges()])
+        self.edges = [tuple(e) for e in self.edges]
+
+        self.edge_ids = dict()
+        self.costs = list()
+        self.incident_masks = {u: 0 for u in graph.nodes()}
+        for i, (u, v) in enumerate(self.edges):
+            self.edge_ids[(u, v)] = i
+            self.edge_ids[(v, u)] = i
+            self.costs.append(graph[u][v][edge_weight_key])
+            self.incident_masks[u] |= 1 << i
+            self.incident_masks[v] |= 1 << i
+
+        self.full_mask = (1 << len(self.edges)) - 1
+
+        self.key = (frozenset(graph.nodes()),
+                    tuple(zip(self.edges, self.costs)))
+        self._hash = hash(self.key)
+        self.attributes_key = _get_attributes_digest(graph, self.edges)
+
+        self._arrays = None
+        self._mst_classes = None
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, NetworkIndex)
+                                 and self._hash == other._hash
+                                 and self.key == other.key)
+
+    def __repr__(self):
+        return 'NetworkIndex(|V|={}, |E|={})'.format(
+            len(self.incident_masks), len(self.edges))
+
+    def get_mask(self, edges) -> int:
+        """Encode a collection of edges as a bitmask.
+
+        Raises:
+            KeyError: if an edge is not in the graph.
+        """
+        mask = 0
+        for u, v in edges:
+            mask |= 1 << self.edge_ids[(u, v)]
+        return mask
+
+    def get_edges(self, mask) -> list:
+        """Decode a bitmask to the list of its edges, in the id order."""
+        edges = list()
+        while mask:
+            low = mask & -mask
+            edges.append(self.edges[low.bit_length() - 1])
+            mask ^= low
+        return edges
+
+    def get_nodes(self, mask) -> set:
+        """Get the set of the nodes of the edges in a bitmask."""
+        return {u for e in self.get_edges(mask) for u in e}
+
+    def get_cost(self, mask) -> float:
+        """Compute the total cost on the edges in a bitmask."""
+        cost = 0
+        while mask:
+            low = mask & -mask
+            cost += self.costs[low.bit_length() - 1]
+            mask ^= low
+        return cost
+
+    def get_mst_cost(self) -> float:
+        """Get the cost of a minimum-spanning tree of the graph."""
+        return self.mst_classes.mst_cost
+
+    def get_frontier_mask(self, mask) -> int:
+        """Get the bitmask of the edges that are not in a bitmask, and are
+        incident to a node of an edge in the bitmask."""
+        if len(self.edges) >= ARRAY_MIN_EDGES:
+            return self.arrays.get_frontier_mask(mask)
+        frontier = 0
+        for u in self.get_nodes(mask):
+            frontier |= self.incident_masks[u]
+        return frontier & ~mask
+
+    @property
+    def arrays(self):
+        """NetworkArrays: the array-backed view of the graph, built once."""
+        if self._arrays is None:
+            with _cache_lock:
+                if self._arrays is None:
+                    self._arrays = NetworkArrays(self)
+        return self._arrays
+
+    @property
+    def mst_classes(self):
+        """MstEdgeClasses: the classes of the edges by their membership in
+        the minimum-spanning trees of the graph, built once."""
+        if self._mst_classes is None:
+            with _cache_lock:
+                if self._mst_classes is None:
+                    self._mst_classes = MstEdgeClasses(self)
+        return self._mst_classes
+
+
+def get_network_arrays(graph, edge_weight_key='cost'):
+    """Get the array-backed view of a graph, if the graph is large enough.
+
+    Args:
+        graph (nx.Graph): The graph with a cost function on edges.
+        edge_weight_key (str, optional): The attribute key for the weight.
+            Defaults to 'cost'.
+
+    Returns:
+        NetworkArrays: the view of the graph, or None if the graph has
+            fewer than ARRAY_MIN_EDGES edges.
+    """
+    index = get_network_index(graph, edge_weight_key=edge_weight_key)
+    if len(index.edges) < ARRAY_MIN_EDGES:
+        return None
+    return index.arrays
+
+
+def _get_cached_network_arrays(graph, edge_weight_key='cost'):
+    """Get the array-backed view of a graph only if it is already indexed,
+    e.g. the background graph of a network state, and large enough."""
+    index = _network_index_cache.get(graph, {}).get(edge_weight_key)
+    if index is None or len(index.edges) < ARRAY_MIN_EDGES:
+        return None
+    return index.arrays
+
+
+class NetworkArrays(object):
+    """An array-backed view of an indexed (background) graph.
+
+    Nodes are numbered in a canonical order and edges by their ids in the
+    index, so that a bitmask of edges maps to a boolean array over the
+    edges, and the queries on it are vectorized.
+
+    Attributes:
+        nodes (list):
+            the nodes by their ids
+        node_ids (dict):
+            the id of each node
+        costs (np.ndarray):
+            the costs of the edges by their ids
+        heads (np.ndarray):
+            the id of the first node of each edge
+        tails (np.ndarray):
+            the id of the second node of each edge
+        indptr (np.ndarray):
+            the neighbors of node i are at indptr[i]:indptr[i+1] in
+            neighbors and neighbor_edges, i.e. in CSR (compressed sparse
+            row) format
+        neighbors (np.ndarray):
+            the ids of the neighbors of each node, in increasing cost
+        neighbor_edges (np.ndarray):
+            the ids of the edges to the neighbors of each node
+    """
+
+    def __init__(self, index):
+        self.nodes = _sort_canonically(list(index.incident_masks))
+        self.node_ids = {u: i for i, u in enumerate(self.nodes)}
+
+        self.costs = np.asarray(index.costs)
+        self.heads = np.array(
+            [self.node_ids[u] for u, _ in index.edges], dtype=np.intp)
+        self.tails = np.array(
+            [self.node_ids[v] for _, v in index.edges], dtype=np.intp)
+
+        # Both directions of each edge, sorted by node, cost and neighbor.
+        rows = np.concatenate([self.heads, self.tails])
+        cols = np.concatenate([self.tails, self.heads])
+        edge_ids = np.tile(np.arange(len(index.edges), dtype=np.intp), 2)
+        order = np.lexsort((cols, self.costs[edge_ids], rows))
+
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(rows, minlength=len(self.nodes)),
+                  out=self.indptr[1:])
+        self.neighbors = cols[order]
+        self.neighbor_edges = edge_ids[order]
+
+        self._cost_matrix = None
+
+    def __repr__(self):
+        return 'NetworkArrays(|V|={}, |E|={})'.format(
+            len(self.nodes), len(self.costs))
+
+    @property
+    def cost_matrix(self):
+        """np.ndarray: the dense cost matrix, with inf for no edge."""
+        if self._cost_matrix is None:
+            with _cache_lock:
+                if self._cost_matrix is None:
+                    matrix = np.full(
+                        (len(self.nodes), len(self.nodes)), np.inf)
+                    matrix[self.heads, self.tails] = self.costs
+                    matrix[self.tails, self.heads] = self.costs
+                    self._cost_matrix = matrix
+        return self._cost_matrix
+
+    def get_selection(self, mask) -> np.ndarray:
+        """Convert a bitmask of edges to a boolean array over the edges."""
+        num_bytes = (len(self.costs) + 7) // 8
+        bits = np.frombuffer(mask.to_bytes(num_bytes, 'little'), np.uint8)
+        return np.unpackbits(
+            bits, count=len(self.costs), bitorder='little').astype(bool)
+
+    def get_mask(self, selection) -> int:
+        """Convert a boolean array over the edges to a bitmask of edges."""
+        bits = np.packbits(selection, bitorder='little')
+        return int.from_bytes(bits.tobytes(), 'little')
+
+    def get_cost(self, mask) -> float:
+        """Compute the total cost on the edges in a bitmask."""
+        return self.costs[self.get_selection(mask)].sum().item()
+
+    def get_total_cost(self) -> float:
+        """Compute the total cost on all edges."""
+        return self.costs.sum().item()
+
+    def get_node_selection(self, selection) -> np.ndarray:
+        """Get the boolean array over the nodes of the selected edges."""
+        nodes = np.zeros(len(self.nodes), dtype=bool)
+        nodes[self.heads[selection]] = True
+        nodes[self.tails[selection]] = True
+        return nodes
+
+    def get_frontier_mask(self, mask) -> int:
+        """Get the bitmask of the edges that are not in a bitmask, and are
+        incident to a node of an edge in the bitmask."""
+        selection = self.get_selection(mask)
+        nodes = self.get_node_selection(selection)
+        frontier = (nodes[self.heads] | nodes[self.tails]) & ~selection
+        return self.get_mask(frontier)
+
+    def get_min_neighbors(self, u, mask) -> tuple:
+        """Find the neighbors of a node with the lowest cost edges.
+
+        Ignore the edges in a bitmask (e.g. selected edges).
+
+        Returns:
+            tuple: the set of the nodes with the minimum cost edges, and
+                the set of the other neighbors.
+        """
+        i = self.node_ids[u]
+        begin, end = self.indptr[i], self.indptr[i + 1]
+        edge_ids = self.neighbor_edges[begin:end]
+        available = ~self.get_selection(mask)[edge_ids]
+        if not available.any():
+            return set(), set()
+
+        neighbors = self.neighbors[begin:end][available]
+        costs = self.costs[edge_ids[available]]
+        is_min = costs == costs[0]
+        return ({self.nodes[j] for j in neighbors[is_min]},
+                {self.nodes[j] for j in neighbors[~is_min]})
+
+
+def get_mst_edge_classes(graph, edge_weight_key='cost'):
+    """Get the MST classes of the edges of a graph, built once and cached
+    with the graph's index.
+
+    Args:
+        graph (nx.Graph): The graph with a cost function on edges.
+        edge_weight_key (str, optional): The attribute key for the weight.
+            Defaults to 'cost'.
+
+    Returns:
+        MstEdgeClasses: the classes of the graph's edges.
+    """
+    return get_network_index(
+        graph, edge_weight_key=edge_weight_key).mst_classes
+
+
+class MstEdgeClasses(object):
+    """A class to classify the edges of an indexed graph by their membership
+    in the minimum-spanning trees (MSTs) of the graph, e.g. to tell whether
+    an edge is optimal in constant time.
+
+    The classes are found by a pass of Kruskal's algorithm over the groups
+    of equal-cost edges: at each group, an edge whose nodes are connected
+    by cheaper edges is in no MST; the others are in some MST, and in every
+    MST if they are bridges among the group's edges (with the components
+    of the cheaper edges contracted). The other edges of a group that are
+    in some MST are tied: they are grouped into tie classes, i.e. the
+    two-edge-connected components among the group's edges, where any MST
+    takes a fixed number of edges from each class. For a disconnected
+    graph, the classes are of its minimum-spanning forests.
+
+    Attributes:
+        some_mask (int):
+            the bitmask of the edges in at least one MST
+        every_mask (int):
+            the bitmask of the edges in every MST
+        mst_mask (int):
+            the bitmask of the edges of an MST
+        mst_cost (float):
+            the cost of an MST
+        tie_classes (list):
+            the tie classes, each as a pair of the list of its edge ids and
+            the number of its edges in any MST, by increasing cost
+        tie_class_ids (dict):
+            the index of the tie class of each tied edge by its id
+    """
+
+    def __init__(self, index):
+        self.some_mask = 0
+        self.every_mask = 0
+        self.mst_mask = 0
+        self.tie_classes = list()
+        self.tie_class_ids = dict()
+
+        components = UnionFind(index.incident_masks)
+        order = sorted(range(len(index.edges)), key=lambda i: index.costs[i])
+        begin = 0
+        while begin < len(order):
+            end = begin + 1
+            cost = index.costs[order[begin]]
+            while end < len(order) and index.costs[order[end]] == cost:
+                end += 1
+            group = order[begin:end]
+            begin = end
+
+            # The group's edges between the components of cheaper edges.
+            candidates = list()
+            for i in group:
+                u, v = index.edges[i]
+                ru, rv = components.find(u), components.find(v)
+                if ru != rv:
+                    candidates.append((ru, rv, i))
+                    self.some_mask |= 1 << i
+
+            bridges = _find_bridges(candidates)
+            for i in bridges:
+                self.every_mask |= 1 << i
+            self._add_tie_classes(
+                [e for e in candidates if e[2] not in bridges])
+
+            for _, _, i in candidates:
+                if components.union(*index.edges[i]):
+                    self.mst_mask |= 1 << i
+
+        self.mst_cost = index.get_cost(self.mst_mask)
+
+    def __repr__(self):
+        return 'MstEdgeClasses(some={}, every={}, ties={})'.format(
+            bin(self.some_mask).count('1'), bin(self.every_mask).count('1'),
+            len(self.tie_classes))
+
+    def is_in_some_mst(self, edge_id) -> bool:
+        """Check if an edge is in at least one MST, i.e. may be optimal."""
+        return (self.some_mask >> edge_id) & 1 == 1
+
+    def is_in_every_mst(self, edge_id) -> bool:
+        """Check if an edge is in every MST, i.e. is necessary."""
+        return (self.every_mask >> edge_id) & 1 == 1
+
+    def get_tie_class(self, edge_id):
+        """Get the tie class of an edge, or None if it is not tied.
+
+        Returns:
+            tuple: the list of the edge ids in the class, and the number of
+                them in any MST.
+        """
+        i = self.tie_class_ids.get(edge_id)
+        return None if i is None else self.tie_classes[i]
+
+    def _add_tie_classes(self, edges):
+        """Add the tie classes of the tied edges (as (u, v, id) between the
+        components) of an equal-cost group."""
+        components = UnionFind()
+        for u, v, _ in edges:
+            components.add(u)
+            components.add(v)
+            components.union(u, v)
+        classes = dict()
+        for u, v, i in edges:
+            nodes, ids = classes.setdefault(components.find(u), (set(), []))
+            nodes.update((u, v))
+            ids.append(i)
+        for nodes, ids in classes.values():
+            for i in ids:
+                self.tie_class_ids[i] = len(self.tie_classes)
+            self.tie_classes.append((ids, len(nodes) - 1))
+
+
+def get_node_name_index(graph, node_name_key='text'):
+    """Get the node name index of a graph, built once and cached.
+
+    The graph is assumed not to change after its index is built.
+
+    Args:
+        graph (nx.Graph): The graph with names on nodes.
+        node_name_key (str, optional): The attribute key for the name.
+            Defaults to 'text'.
+
+    Returns:
+        NodeNameIndex: the node name index of the graph.
+    """
+    index = _name_index_cache.get(graph, {}).get(node_name_key)
+    if index is None:
+        with _cache_lock:
+            indices = _name_index_cache.setdefault(graph, dict())
+            index = indices.get(node_name_key)
+            if index is None:
+                index = NodeNameIndex(graph, node_name_key=node_name_key)
+                indices[node_name_key] = index
+    return index
+
+
+class NodeNameIndex(object):
+    """A class to look up the nodes of a graph by their names.
+
+    A name is matched case-insensitively, in the order of:
+    (1) the full name, e.g. "Mount Montreux",
+    (2) the shortened name, i.e. the last word, e.g. "Montreux",
+    (3) a prefix of the full or the shortened name, e.g. "Mont",
+    (4) a part of the full name, e.g. "treux", and
+    (5) a close match to the full or the shortened name, e.g. "Montreu",
+    stopping at the first of these that matches any node. If it matches
+    multiple nodes, the ambiguity is reported, and the first of them in
+    the graph's order is taken, as a substring search over the nodes
+    would.
+
+    Attributes:
+        names (dict):
+            the full name of each node, for the nodes that have a name
+    """
+
+    def __init__(self, graph, node_name_key='text', fuzzy_cutoff=0.75):
+        self.names = {u: d[node_name_key] for u, d in graph.nodes(data=True)
+                      if node_name_key in d}
+        self._fuzzy_cutoff = fuzzy_cutoff
+        self._order = {u: k for k, u in enumerate(graph.nodes())}
+
+        self._full = dict()
+        self._short = dict()
+        for u, name in self.names.items():
+            self._full.setdefault(name.lower(), set()).add(u)
+            self._short.setdefault(name.split()[-1].lower(), set()).add(u)
+
+        # Sorted (name, node) pairs for prefix search.
+        self._sorted = sorted(
+            [(name, u) for name, nodes in self._full.items() for u in nodes]
+            + [(name, u) for name, nodes in self._short.items()
+               for u in nodes], key=lambda x: (x[0], repr(x[1])))
+        self._sorted_names = [name for name, _ in self._sorted]
+
+    def __repr__(self):
+        return 'NodeNameIndex({})'.format(sorted(self._full))
+
+    def find(self, name):
+        """Find the node with a name.
+
+        Args:
+            name (str): The (part of the) name of a node e.g. "Montreux".
+
+        Returns:
+            int: the node e.g. 1, or None if no node matches the name.
+        """
+        query = name.strip().lower()
+        for match in [self._match_full, self._match_short,
+                      self._match_prefix, self._match_part,
+                      self._match_close]:
+            nodes = match(query)
+            if len(nodes) > 0:
+                nodes = sorted(nodes, key=self._order.get)
+                if len(nodes) > 1:
+                    print('Name "{}" is ambiguous: {}; taking {}.'.format(
+                        name, [self.names[u] for u in nodes],
+                        self.names[nodes[0]]))
+                return nodes[0]
+        return None
+
+    def _match_full(self, query):
+        return self._full.get(query, set())
+
+    def _match_short(self, query):
+        return self._short.get(query, set())
+
+    def _match_prefix(self, query):
+        nodes = set()
+        i = bisect.bisect_left(self._sorted_names, query)
+        while i < len(self._sorted) \
+                and self._sorted_names[i].startswith(query):
+            nodes.add(self._sorted[i][1])
+            i += 1
+        return nodes
+
+    def _match_part(self, query):
+        return {u for name, nodes in self._full.items() if query in name
+                for u in nodes}
+
+    def _match_close(self, query):
+        names = difflib.get_close_matches(
+            query, list(self._full) + list(self._short), n=len(self.names),
+            cutoff=self._fuzzy_cutoff)
+        nodes = set()
+        for name in names:
+            nodes.update(self._full.get(name, set()))
+            nodes.update(self._short.get(name, set()))
+        return nodes
+
+
+def _get_attributes_digest(graph, edges) -> str:
+    """Get a digest of the attributes of a graph, its nodes and its edges
+    (given in a canonical order)."""
+    description = repr((
+        _canonicalize(graph.graph),
+        [(u, _canonicalize(graph.nodes[u]))
+         for u in _sort_canonically(graph.nodes())],
+        [(u, v, _canonicalize(graph[u][v])) for u, v in edges]))
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _canonicalize(value):
+    """Get a value with its dictionaries as sorted lists of items, e.g. to
+    represent it regardless of the insertion order."""
+    if isinstance(value, dict):
+        return [(k, _canonicalize(value[k]))
+                for k in _sort_canonically(value)]
+    return value
+
+
+def _sort_canonically(items):
+    """Sort items by value, or by their representations if not comparable."""
+    try:
+        return sorted(items)
+    except TypeError:
+        return sorted(items, key=repr)
+
+
+def _find_bridges(edges) -> set:
+    """Find the bridges of a multigraph, given as (u, v, edge id) triples,
+    by Tarjan's algorithm.
+
+    Returns:
+        set: the ids of the bridges.
+    """
+    neighbors = dict()
+    for u, v, i in edges:
+        neighbors.setdefault(u, list()).append((v, i))
+        neighbors.setdefault(v, list()).append((u, i))
+
+    bridges = set()
+    discovery, low = dict(), dict()
+    for root in neighbors:
+        if root in discovery:
+            continue
+        discovery[root] = low[root] = len(discovery)
+        # Depth-first, with the edge to the parent and the next neighbors.
+        stack = [(root, None, iter(neighbors[root]))]
+        while stack:
+            u, parent_edge, it = stack[-1]
+            for v, i in it:
+                if i == parent_edge:
+                    continue
+                if v in discovery:
+                    low[u] = min(low[u], discovery[v])
+                else:
+                    discovery[v] = low[v] = len(discovery)
+                    stack.append((v, i, iter(neighbors[v])))
+                    break
+            else:
+                stack.pop()
+                if stack:
+                    p = stack[-1][0]
+                    low[p] = min(low[p], low[u])
+                    if low[u] > discovery[p]:
+                        bridges.add(parent_edge)
+    return bridges
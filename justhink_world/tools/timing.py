@@ -0,0 +1,93 @@
+import json
+import time
+
+
+class StageTimer(object):
+    """A class to accumulate the durations of the stages of a process, e.g.
+    of acting in a world, by their names.
+
+    A stage is timed by a lap, i.e. from the end of the previous stage:
+
+        start = time.perf_counter()
+        ...  # the stage
+        start = timer.lap('stage', start)
+
+    For each stage, the number of the laps, their total, minimum and
+    maximum durations, and a histogram of the durations are kept. The
+    histogram has a bin per power of two microseconds, i.e. a duration of
+    d microseconds falls in the bin of the smallest power of two that is
+    larger than d.
+
+    Attributes:
+        stages (dict):
+            the statistics of each stage by its name, in the order of their
+            first laps
+    """
+
+    def __init__(self):
+        self.stages = dict()
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'StageTimer({})'.format(', '.join(
+            '{}={}'.format(name, s['count'])
+            for name, s in self.stages.items()))
+
+    def lap(self, stage, start):
+        """Record the duration of a stage that started at start (in
+        time.perf_counter() seconds), and get its end, i.e. now."""
+        end = time.perf_counter()
+        self.record(stage, end - start)
+        return end
+
+    def record(self, stage, duration):
+        """Record a duration of a stage, in seconds."""
+        s = self.stages.get(stage)
+        if s is None:
+            s = self.stages[stage] = {
+                'count': 0, 'total': 0.0, 'min': duration, 'max': duration,
+                'histogram': dict()}
+        s['count'] += 1
+        s['total'] += duration
+        if duration < s['min']:
+            s['min'] = duration
+        if duration > s['max']:
+            s['max'] = duration
+        # The bin by the bit length of the duration in microseconds.
+        upper_us = 1 << int(duration * 1e6).bit_length()
+        s['histogram'][upper_us] = s['histogram'].get(upper_us, 0) + 1
+
+    def reset(self):
+        """Remove the records of all the stages."""
+        self.stages.clear()
+
+    def get_stats(self):
+        """Get the statistics of each stage, with the durations in
+        milliseconds, and the histogram as the number of the durations
+        below each bin's upper bound in microseconds, e.g. for JSON.
+
+        Returns:
+            dict: the statistics of each stage by its name.
+        """
+        stats = dict()
+        for name, s in self.stages.items():
+            stats[name] = {
+                'count': s['count'],
+                'total_ms': 1000 * s['total'],
+                'mean_ms': 1000 * s['total'] / s['count'],
+                'min_ms': 1000 * s['min'],
+                'max_ms': 1000 * s['max'],
+                'histogram_us': {
+                    str(k): v for k, v in sorted(s['histogram'].items())},
+            }
+        return stats
+
+    def save(self, file):
+        """Save the statistics (see get_stats()) to a JSON file."""
+        with open(file, 'w') as handle:
+            json.dump(self.get_stats(), handle, indent=2)
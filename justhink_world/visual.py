@@ -14,7 +14,8 @@ from justhink_world.world import HumanIndividualWorld, RobotIndividualWorld, \
     CollaborativeWorld
 from justhink_world.domain.action import SetPauseAction,  \
     PickAction, SuggestPickAction, ClearAction, AgreeAction, DisagreeAction, \
-    AttemptSubmitAction, ContinueAction, SubmitAction
+    AttemptSubmitAction, ContinueAction, SubmitAction, get_action, \
+    get_agent_action
 
 
 class DrawingMode(object):
@@ -221,12 +222,15 @@ class WorldWindow(pyglet.window.Window):
                 self.world.cur_state, self.world.agent.planner.cur_node)
             action = agent.planner.last_plan
 
-        action.agent = self.scene._role  # Reapproriate the role.
-        # Reapproriate a pick type of action.
+        # Reapproriate the role, and a pick type of action, from the action
+        # pool (see get_action).
         if isinstance(action, SuggestPickAction) \
                 or isinstance(action, PickAction):
-            action = self.scene._pick_action_type(
-                action.edge, action.agent)
+            action = get_action(
+                self.scene._pick_action_type, action.edge,
+                agent=self.scene._role)
+        else:
+            action = get_agent_action(action, self.scene._role)
 
         return action
 
@@ -520,13 +524,10 @@ class WorldScene(EnvironmentScene):
 
         # Set as the draw-from node, if an action exists from that node.
         if node is not None:
-            is_possible = False
             # Draw from only if there is an action available from there.
-            for action in self._actions:
-                if hasattr(action, 'edge') and node in action.edge:
-                    self.draw_from = node
-                    is_possible = True
-                    break
+            is_possible = self._actions.touches(node)
+            if is_possible:
+                self.draw_from = node
 
             # Put a cross at the node if cannot draw from that node.
             if not is_possible:
@@ -661,7 +662,7 @@ class WorldScene(EnvironmentScene):
 
     def _update_feasible_actions(self):
         self._actions = self._policy_model.get_all_actions(self._state)
-        self._action_types = {type(action) for action in self._actions}
+        self._action_types = self._actions.get_types()
 
     def _update_paused(self):
         """Override EnvironmentScene's _update_paused() with 'role'."""
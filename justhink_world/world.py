@@ -1,10 +1,15 @@
-import copy
+import functools
+import json
+import time
 
 import importlib_resources
 
+import numpy as np
+
 import pomdp_py
 
 from .domain.state import EnvState
+from .domain.history import StateHistory
 from .domain.action import ObserveAction, PickAction, SuggestPickAction, \
     AgreeAction,  DisagreeAction, SetStateAction, \
     AttemptSubmitAction, ContinueAction, SubmitAction
@@ -19,12 +24,14 @@ from .models.reward_model import MstRewardModel
 
 from .tools.read import make_network_resources, load_network
 from .tools.write import Bcolors
+from .tools.timing import StageTimer
 
 from .agent import Agent, ModellingAgent
 from .agent.reasoning import \
-    TraversalPlanner, TraversalJumpingPlanner, PrimsPlanner
+    TraversalPlanner, TraversalJumpingPlanner, PrimsPlanner, \
+    AnytimePlanner, PolicyPlanner, SpeculativePlanner
 
-__STRATEGIES__ = ['greedy', 'optimal', 'aligning']
+__STRATEGIES__ = ['greedy', 'optimal', 'aligning', 'anytime']
 
 
 def list_worlds():
@@ -117,27 +124,115 @@ def create_world(name, history=None, state_no=None, verbose=False, **kwargs):
     return world
 
 
+def create_planner(state, agent_strategy='greedy', cache=None,
+                   policy=None, deadline_ms=None):
+    """Create the robot's planner for a strategy, see World.
+
+    Args:
+        state (EnvState): The state to start planning from.
+        agent_strategy (str, optional): The robot's strategy, one of
+            __STRATEGIES__ (default 'greedy').
+        cache (PlanCache, optional): The cache of the plans.
+        policy (SolvedPolicy, optional): The solved policy to look the
+            actions up in, see PolicyPlanner.
+        deadline_ms (float, optional): The latency budget of the 'anytime'
+            strategy, in milliseconds.
+
+    Returns:
+        the planner.
+    """
+    try:
+        assert agent_strategy in __STRATEGIES__
+    except Exception as e:
+        print(e, agent_strategy, __STRATEGIES__)
+        raise ValueError
+
+    if agent_strategy == 'greedy':
+        planner_type = TraversalJumpingPlanner
+    elif agent_strategy == 'optimal':
+        planner_type = PrimsPlanner
+    elif agent_strategy == 'aligning':
+        planner_type = TraversalJumpingPlanner
+    elif agent_strategy == 'anytime':
+        planner_type = AnytimePlanner
+    elif agent_strategy == 'pilot':
+        planner_type = TraversalPlanner
+    else:
+        raise NotImplementedError
+
+    planner_kwargs = {'cache': cache}
+    if planner_type is AnytimePlanner and deadline_ms is not None:
+        planner_kwargs['deadline_ms'] = deadline_ms
+    planner = planner_type(state, **planner_kwargs)
+    if policy is not None:
+        planner = PolicyPlanner(policy, planner)
+
+    return planner
+
+
 class World(pomdp_py.POMDP):
     """A world describing the interaction between an agent and the environment.
 
     An Agent operates in an environment by taking actions,
         receiving observations, and updating its belief.
     An Environment maintains the true state of the world.
+
+    If a state table (StateInternTable) is given, the states in the history
+    are interned in that table, so that equal states (e.g. across worlds
+    sharing the table) are a single shared instance.
+
+    The history keeps the actions and a checkpoint state every
+    checkpoint_interval states, and reconstructs the other states on
+    demand (see StateHistory).
+
+    If a transition cache (TransitionCache) is given, the transitions
+    are memoized in that cache, e.g. shared by the worlds replaying logs.
+
+    If a plan cache (PlanCache) is given, the robot's plans are memoized in
+    that cache, e.g. shared by the worlds replaying logs.
+
+    If a solved policy (SolvedPolicy, see solve_world()) is given, the
+    robot looks its actions up in the policy, and plans by its strategy
+    only at the states that the policy does not cover.
+
+    With the 'anytime' strategy, the robot plans greedily first, and then
+    optimally if it fits in deadline_ms milliseconds (see AnytimePlanner).
+    As optimal planning is cheap on the activity's networks, this is
+    effectively the 'optimal' strategy, with a greedy fallback.
+
+    If timed, the stages of acting and of updating the robot's beliefs are
+    timed (see StageTimer), and their statistics are available by stats().
     """
 
     def __init__(self, history, transition_model, policy_model,
                  state_no=None, name='World',
-                 agent_strategy='greedy', verbose=False):
+                 agent_strategy='greedy', state_table=None,
+                 checkpoint_interval=16, transition_cache=None,
+                 plan_cache=None, policy=None, deadline_ms=None,
+                 timed=False, verbose=False):
 
         self.name = name
         self.verbose = verbose
+        self.state_table = state_table
+        self.timer = StageTimer() if timed else None
+
+        if transition_cache is not None:
+            transition_model.cache = transition_cache
 
         # States.
-        if not isinstance(history, list):
+        if isinstance(history, StateHistory):
+            history = list(history)
+        elif not isinstance(history, list):
             history = [history]
 
+        if state_table is not None:
+            history = [state_table.intern(x) if i % 2 == 0 else x
+                       for i, x in enumerate(history)]
+
         # History, for navigating states.
-        self._history = history
+        self._history = StateHistory(
+            history, transition_model,
+            checkpoint_interval=checkpoint_interval)
 
         # Set the state no if given, the last state otherwise.
         if state_no is not None:
@@ -145,7 +240,7 @@ class World(pomdp_py.POMDP):
         else:
             self.state_no = self.num_states
 
-        cur_state = history[self.state_index]
+        cur_state = self._history[self.state_index]
 
         # Create a reward model.
         reward_model = MstRewardModel()
@@ -154,28 +249,14 @@ class World(pomdp_py.POMDP):
         # Assign update belief function as a method of ModellingAgent class.
         setattr(ModellingAgent, "update_belief", update_belief)
 
-        try:
-            assert agent_strategy in __STRATEGIES__
-        except Exception as e:
-            print(e, agent_strategy, __STRATEGIES__)
-            raise ValueError
-
-        if agent_strategy == 'greedy':
-            planner_type = TraversalJumpingPlanner
-        elif agent_strategy == 'optimal':
-            planner_type = PrimsPlanner
-        elif agent_strategy == 'aligning':
-            planner_type = TraversalJumpingPlanner
-        elif agent_strategy == 'pilot':
-            planner_type = TraversalPlanner
-        else:
-            raise NotImplementedError
-
-        planner = planner_type(cur_state)
+        planner = create_planner(
+            cur_state, agent_strategy=agent_strategy, cache=plan_cache,
+            policy=policy, deadline_ms=deadline_ms)
         agent = ModellingAgent(
             cur_state, policy_model, transition_model=transition_model,
             observation_model=observation_model, reward_model=reward_model,
             planner=planner)
+        agent.timer = self.timer
 
         # Initialize an environment.
         env = pomdp_py.Environment(cur_state, transition_model, reward_model)
@@ -208,6 +289,7 @@ class World(pomdp_py.POMDP):
 
     @property
     def history(self):
+        """StateHistory: the states and actions, as a list-like sequence."""
         return self._history
 
     @property
@@ -221,25 +303,39 @@ class World(pomdp_py.POMDP):
         return self._history[self.state_index]
 
     def act(self, action):
+        timer = self.timer
+        if timer is not None:
+            act_start = start = time.perf_counter()
+
         # Validation: check if the action is feasible.
         if action not in self.agent.all_actions:
             s = 'Invalid action {}: it not feasible (i.e. in {}).'.format(
                 action, sorted(self.agent.all_actions))
             s += '\nIgnoring the action request.'
             print(Bcolors.ok(s))
+            if timer is not None:
+                timer.lap('act.validate', start)
             return None
+        if timer is not None:
+            start = timer.lap('act.validate', start)
 
         # Relocate in history if not at the last state.
         if self.state_no != self.num_states:
             # Rebase.
             self.env.state_transition(SetStateAction(self.cur_state))
             # Clean history.
-            self._history = self._history[:self.state_index+1]
+            self._history.truncate(self.state_index + 1)
+            if timer is not None:
+                start = timer.lap('act.rebase', start)
 
-        # Apply the state transition.
-        state = copy.deepcopy(self.env.state)
+        # Apply the state transition: the transition creates a new state.
+        state = self.env.state
         env_reward = self.env.state_transition(action)
+        if self.state_table is not None:
+            self.env.apply_transition(self.state_table.intern(self.env.state))
         next_state = self.env.state
+        if timer is not None:
+            start = timer.lap('act.transition', start)
 
         # Print info.
         if self.verbose:
@@ -252,20 +348,50 @@ class World(pomdp_py.POMDP):
             print()
 
         # Update the history.
-        self._history.extend([action, next_state])
+        self._history.append_transition(action, next_state)
+        if timer is not None:
+            start = timer.lap('act.history', start)
 
         # Update the agent.
         observation = self.env.provide_observation(
             self.agent.observation_model, action)
+        if timer is not None:
+            start = timer.lap('act.observe', start)
 
         self.agent.policy_model.update(state, next_state, action)
+        if timer is not None:
+            start = timer.lap('act.policy_update', start)
+
         self.agent.update_belief(observation, action, verbose=self.verbose)
+        if timer is not None:
+            start = timer.lap('act.update_belief', start)
 
         # Move to the new state.
         self.state_no = self.num_states
 
+        if timer is not None:
+            timer.lap('act', act_start)
+
         return observation
 
+    def stats(self):
+        """Get the statistics of the timed stages of acting, e.g. the
+        transitions, the belief updates and the plans (see StageTimer).
+
+        Returns:
+            dict: the statistics of each stage by its name, or an empty
+                dictionary if the world is not timed.
+        """
+        if self.timer is None:
+            return dict()
+        return self.timer.get_stats()
+
+    def save_stats(self, file):
+        """Save the statistics of the timed stages (see stats()) to a JSON
+        file."""
+        with open(file, 'w') as handle:
+            json.dump(self.stats(), handle, indent=2)
+
 
 class IntroWorld(World):
     """An introduction world that cannot be acted upon.
@@ -339,9 +465,15 @@ class RobotIndividualWorld(IndividualWorld):
 class CollaborativeWorld(World):
     """The world to represent the collaborative acitivty where
     the human and the robot solve the problem together.
+
+    If speculative, the robot plans ahead at the human's turn, for each
+    feasible action of the human, by max_workers threads in the background
+    (see SpeculativePlanner); close() the world (or use it as a context
+    manager) to stop the workers.
     """
 
-    def __init__(self, state, name='CollaborativeWorld', **kwargs):
+    def __init__(self, state, name='CollaborativeWorld',
+                 speculative=False, max_workers=1, **kwargs):
         transition_model = CollaborativeTransitionModel()
         policy_model = CollaborativePolicyModel()
 
@@ -349,49 +481,127 @@ class CollaborativeWorld(World):
             state, transition_model=transition_model,
             policy_model=policy_model, name=name, **kwargs)
 
+        if speculative:
+            # Each worker plans with a planner of its own, without a cache.
+            create_worker_planner = functools.partial(
+                create_planner, self.cur_state,
+                agent_strategy=kwargs.get('agent_strategy', 'greedy'),
+                policy=kwargs.get('policy'),
+                deadline_ms=kwargs.get('deadline_ms'))
+            self.agent.planner = SpeculativePlanner(
+                self.agent.planner, create_planner=create_worker_planner,
+                max_workers=max_workers)
+
         action = ObserveAction(Agent.ROBOT)
         observation = self.env.provide_observation(
             self.agent.observation_model, action)
         self.agent.update_belief(observation, action)
 
+        if self.is_speculative:
+            self.speculate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-def update_choice_beliefs(beliefs, cur_env_state, action):
+    @property
+    def is_speculative(self):
+        """bool: whether the robot plans ahead at the human's turn."""
+        return isinstance(self.agent.planner, SpeculativePlanner)
+
+    def act(self, action):
+        observation = super().act(action)
+        if self.is_speculative:
+            if self.timer is not None:
+                start = time.perf_counter()
+            self.speculate()
+            if self.timer is not None:
+                self.timer.lap('act.speculate', start)
+        return observation
+
+    def speculate(self):
+        """Plan ahead for each feasible action of the human at their turn,
+        in the background (see SpeculativePlanner)."""
+        state = self.cur_state
+        if state.agents != {Agent.HUMAN}:
+            return
+
+        transition_model = self.agent.transition_model
+        cur_node = self.agent.cur_state.cur_node
+        actions = self.agent.policy_model.get_all_actions(state=state)
+        situations = list()
+        for action in actions.for_agents({Agent.HUMAN}):
+            next_state = transition_model.sample(state, action)
+            new_cur_node = get_moved_node(state, next_state, action)
+            situations.append((
+                next_state,
+                cur_node if new_cur_node is None else new_cur_node))
+        self.agent.planner.speculate(situations)
+
+    def close(self):
+        """Stop planning ahead, if speculative."""
+        if self.is_speculative:
+            self.agent.planner.close()
+
+
+def get_moved_node(cur_env_state, next_state, action):
+    """Get the node the robot believes they moved to by an action from a
+    state to the next, or None if they stay at their current node."""
+    selected_nodes = cur_env_state.network.get_selected_nodes()
+    new_selected_nodes = next_state.network.get_selected_nodes()
+
+    new_cur_node = None
+    if isinstance(action, PickAction):  # go to the outer/new one.
+        _, new_cur_node = action.edge
+    elif isinstance(action, SuggestPickAction):  # go to the inner/old one.
+        u, v = action.edge
+        if v in selected_nodes:
+            new_cur_node = v
+        else:
+            new_cur_node = u
+    elif isinstance(action, AgreeAction):
+        # Move the current to the agreed end, inferring the direction.
+        # or at the direction of drawing.
+        u, v = cur_env_state.network.suggested_edge
+        if v in new_selected_nodes and v not in selected_nodes:
+            new_cur_node = v
+        else:
+            new_cur_node = u
+
+    return new_cur_node
+
+
+def update_choice_beliefs(mental_state, level, cur_env_state, action):
+    """Update the beliefs at a level of a mental state about the choices,
+    i.e. whether the edges are optimal, given an action at a state."""
+    is_optimal = mental_state.is_optimal[level]
     try:
         # Choice belief updates.
         if isinstance(action, PickAction) \
                 or isinstance(action, SuggestPickAction):
-            u, v = action.edge
-            beliefs['world'][u][v]['is_optimal'] = 1.0
+            is_optimal[mental_state.get_edge_id(*action.edge)] = 1.0
 
         elif isinstance(action, AgreeAction):
             u, v = cur_env_state.network.suggested_edge
-            beliefs['world'][u][v]['is_optimal'] = 1.0
+            is_optimal[mental_state.get_edge_id(u, v)] = 1.0
 
         elif isinstance(action, DisagreeAction):
             u, v = cur_env_state.network.suggested_edge
-            beliefs['world'][u][v]['is_optimal'] = 0.0
+            is_optimal[mental_state.get_edge_id(u, v)] = 0.0
 
         elif isinstance(action, SubmitAction) or \
                 isinstance(action, AttemptSubmitAction):
-            for u, v in cur_env_state.network.graph.edges():
-                if cur_env_state.network.subgraph.has_edge(u, v):
-                    value = 1.0
-                else:
-                    value = 0.0
-                beliefs['world'][u][v]['is_optimal'] = value
+            is_optimal[:] = mental_state.get_selection(cur_env_state.network)
 
         elif isinstance(action, ContinueAction):
-            for u, v in cur_env_state.network.subgraph.edges():
-                value = beliefs['world'][u][v]['is_optimal']
-                if value is None:
-                    value = 0
-                value = value - 0.1
-                if value < 0:
-                    value = 0
-                beliefs['world'][u][v]['is_optimal'] = value
+            selected = mental_state.get_selection(cur_env_state.network)
+            values = np.nan_to_num(is_optimal[selected], nan=0.0)
+            is_optimal[selected] = np.maximum(values - 0.1, 0.0)
 
     except Exception as e:
-        print(beliefs, e)
+        print(mental_state, e)
 
 
 def update_belief(agent, observation, action=None, verbose=False):
@@ -406,6 +616,10 @@ def update_belief(agent, observation, action=None, verbose=False):
         print('Action: {}'.format(verbose_action))
         print('Observation: {}'.format(observation))
 
+    timer = agent.timer
+    if timer is not None:
+        start = time.perf_counter()
+
     # Get the current environment state as known by the agent.
     cur_env_state = agent.cur_belief.mpe()
 
@@ -416,117 +630,90 @@ def update_belief(agent, observation, action=None, verbose=False):
     agent.set_belief(new_belief)
 
     if not isinstance(action, ObserveAction):
-        # Make a copy of the mental state.
-        next_mental_state = copy.deepcopy(agent.cur_state)
+        # Make a snapshot of the mental state.
+        next_mental_state = agent.cur_state.copy()
     else:
         # Update in place.
         next_mental_state = agent.cur_state
+    if timer is not None:
+        start = timer.lap('update_belief.copy', start)
 
-    # Update the mental state's facts.
-    beliefs_list = [
-        next_mental_state.beliefs['me'],
-        next_mental_state.beliefs['me']['you'],
-        next_mental_state.beliefs['me']['you']['me'],
-    ]
-    suggested = next_state.network.suggested_edge
-    for beliefs in beliefs_list:
-        for u, v, d in beliefs['world'].edges(data=True):
-            d['is_selected'] = next_state.network.subgraph.has_edge(u, v)
-            d['is_suggested'] = suggested is not None \
-                and set({u, v}) == set(suggested)
-
-    # Select the beliefs about you or about me-by-you depending on the action.
+    # Update the mental state's facts, at all levels.
+    next_mental_state.update_facts(next_state.network)
+
+    # Select the beliefs about you or about me-by-you depending on the action
+    # (i.e. me-by-you for the robot's and the manager's actions).
     if action.agent is Agent.HUMAN:
-        beliefs = next_mental_state.beliefs['me']['you']
-    elif action.agent is Agent.ROBOT:
-        beliefs = next_mental_state.beliefs['me']['you']['me']
+        level = 1
+    else:
+        level = 2
     # Update the corresponding choice beliefs.
-    update_choice_beliefs(beliefs, cur_env_state, action)
+    update_choice_beliefs(next_mental_state, level, cur_env_state, action)
 
     # Update the current node the robot believes they are at.
-    selected_nodes = cur_env_state.network.get_selected_nodes()
-    new_selected_nodes = next_state.network.get_selected_nodes()
-
-    new_cur_node = None
-    if isinstance(action, PickAction):  # go to the outer/new one.
-        _, new_cur_node = action.edge
-    elif isinstance(action, SuggestPickAction):  # go to the inner/old one.
-        u, v = action.edge
-        if v in selected_nodes:
-            new_cur_node = v
-        else:
-            new_cur_node = u
-    elif isinstance(action, AgreeAction):
-        # Move the current to the agreed end, inferring the direction.
-        # or at the direction of drawing.
-        u, v = cur_env_state.network.suggested_edge
-        if v in new_selected_nodes and v not in selected_nodes:
-            new_cur_node = v
-        else:
-            new_cur_node = u
-
+    new_cur_node = get_moved_node(cur_env_state, next_state, action)
     if new_cur_node is not None:
         next_mental_state.cur_node = new_cur_node
         if verbose:
             print('Robot moved current to {} (Node {})'.format(
                 next_state.network.get_node_name(new_cur_node),
                 new_cur_node))
+    if timer is not None:
+        start = timer.lap('update_belief.beliefs', start)
 
     # Plan and update beliefs according to the plan.
     agent.planner.plan(next_state, next_mental_state.cur_node)
-    beliefs = next_mental_state.beliefs['me']
-    for a in agent.planner.last_explanation.others:
-        if isinstance(a, SuggestPickAction):
-            u, v = a.edge
-            if next_state.network.subgraph.has_edge(u, v):
-                continue
-            else:
-                value = 0.0
-            beliefs['world'][u][v]['is_optimal'] = value
-    # Update the desired action as believed to be a true choice.
-    for a in agent.planner.last_explanation.best:
-        if isinstance(a, SuggestPickAction):
-            u, v = a.edge
-            if next_state.network.subgraph.has_edge(u, v):
-                continue
-            else:
-                value = 1.0
-            beliefs['world'][u][v]['is_optimal'] = value
+    is_optimal = next_mental_state.is_optimal[0]
+    is_selected = next_mental_state.is_selected[0]
+    # Update the other actions as believed to be false choices, and then
+    # the desired action as believed to be a true choice.
+    explanation = agent.planner.last_explanation
+    for value, actions in [(0.0, explanation.others),
+                           (1.0, explanation.best)]:
+        ids = np.array([next_mental_state.get_edge_id(*a.edge)
+                        for a in actions if isinstance(a, SuggestPickAction)],
+                       dtype=np.intp)
+        is_optimal[ids[~is_selected[ids]]] = value
+    if timer is not None:
+        start = timer.lap('update_belief.plan', start)
 
     # Count the disagreements if the action is disagree by robot.
+    counts = next_mental_state.counts
     if isinstance(action, DisagreeAction):
         u, v = cur_env_state.network.suggested_edge
-        beliefs = next_mental_state.beliefs['me']['world']
+        i = next_mental_state.get_edge_id(u, v)
         if action.agent == Agent.ROBOT:
-            beliefs[u][v]['n_robot_disagree'] += 1
+            counts['n_robot_disagree'][i] += 1
         elif action.agent == Agent.HUMAN:
-            beliefs[u][v]['n_human_disagree'] += 1
+            counts['n_human_disagree'][i] += 1
 
         if verbose:
             print('{} disagreed with {} ({}-{}) {} times.'.format(
                 action.agent,
                 next_state.network.get_edge_name((u, v)),
-                u, v, beliefs[u][v]['n_human_disagree']))
+                u, v, counts['n_human_disagree'][i]))
 
     # Count the disagreements if the action is disagree by robot.
     if isinstance(action, AgreeAction):
         u, v = cur_env_state.network.suggested_edge
-        beliefs = next_mental_state.beliefs['me']['world']
+        i = next_mental_state.get_edge_id(u, v)
         if action.agent == Agent.ROBOT:
-            beliefs[u][v]['n_robot_agree'] += 1
+            counts['n_robot_agree'][i] += 1
         elif action.agent == Agent.HUMAN:
-            beliefs[u][v]['n_human_agree'] += 1
+            counts['n_human_agree'][i] += 1
 
         if verbose:
             print('{} agreed with {} ({}-{}) {} times.'.format(
                 action.agent,
                 next_state.network.get_edge_name((u, v)),
-                u, v, beliefs[u][v]['n_human_agree']))
+                u, v, counts['n_human_agree'][i]))
 
     # Update the mental history and move to that state.
     if not isinstance(action, ObserveAction):
-        agent.history.extend([action, next_mental_state])
+        agent.mental_history.extend([action, next_mental_state])
         agent.state_no = agent.num_states
+    if timer is not None:
+        timer.lap('update_belief.counters', start)
 
     if verbose:
         print('---------------------')
@@ -26,6 +26,7 @@ setup(
         "wheel",
         "pomdp_py",
         "networkx",
+        "numpy",
         "pyglet",
         "importlib_resources",
         "pqdict",